@@ -0,0 +1,5 @@
+"""
+Performance benchmarks for tropostack. Run from the repository root, e.g.:
+
+    $ python -m benchmarks.bench_memoize
+"""
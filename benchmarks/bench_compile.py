@@ -0,0 +1,179 @@
+"""
+Compile-only benchmarks of synthetic stacks of 10 to 2,000 resources, with
+baselines to catch regressions.
+
+    $ python -m benchmarks.bench_compile               # compare to baseline
+    $ python -m benchmarks.bench_compile --save        # record new baseline
+
+Each case measures `BaseStack.compile()`, YAML and JSON serialization and
+the peak memory allocated while compiling and serializing (tracemalloc).
+The import time of tropostack is measured in a fresh interpreter. Compared
+to the baseline, a case fails if it compiles more than `--threshold` slower,
+or peaks higher in memory by as much.
+
+Timings are scaled by a calibration loop run along with the benchmarks, so
+that a baseline recorded on one machine roughly carries over to another.
+Timings on shared CI hosts can still vary by tens of percents between runs;
+raise the threshold there accordingly. The exit status is 1 on regressions.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import timeit
+import tracemalloc
+
+from tropostack import serialize
+from tropostack.base import EnvStack, InlineConfStack
+from tropostack.budget import UnboundedTemplate
+
+from benchmarks.bench_startup import ROOT
+from benchmarks.synthetic import wide_stack
+
+BASELINE = os.path.join(ROOT, 'benchmarks', 'baselines', 'compile.json')
+SIZES = (10, 100, 500, 2000)
+# Cross-references per resource: none, and a dense chain
+REF_DENSITIES = (0, 5)
+BASES = {'inline': InlineConfStack, 'env': EnvStack}
+# Metrics gated against the baseline, with the smallest increase that
+# counts - below it, differences are measurement noise
+GATED = {'compile_s': 0.002, 'peak_mb': 0.5}
+
+IMPORT_SNIPPET = '''
+import time
+started = time.perf_counter()
+import tropostack.base, tropostack.cli
+print(time.perf_counter() - started)
+'''
+
+
+def calibrate(repeat=5):
+    """Seconds taken by a fixed pure-Python workload on this machine"""
+    return min(timeit.repeat(
+        lambda: sorted({str(idx): idx for idx in range(100000)}.items()),
+        number=1, repeat=repeat))
+
+
+def import_time(repeat=3):
+    """Seconds to import tropostack in a fresh interpreter, best of `repeat`"""
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    return min(float(subprocess.check_output(
+        [sys.executable, '-c', IMPORT_SNIPPET], cwd=ROOT, env=env,
+        universal_newlines=True)) for _ in range(repeat))
+
+
+def cases(sizes=SIZES):
+    """``(name, stack instance)`` of every benchmark case"""
+    for size in sizes:
+        # Outputs are capped at 200 per template
+        outputs = min(200, size // 5)
+        for refs in REF_DENSITIES:
+            for base_name, base in sorted(BASES.items()):
+                stack_cls = wide_stack(size, refs=refs, outputs=outputs,
+                                       base=base)
+                yield ('%s-%d-refs%d' % (base_name, size, refs),
+                       stack_cls(dict(stack_cls.CONF)))
+
+
+def measure(stack, repeat=7):
+    """Timings and peak memory of compiling and serializing `stack`"""
+    def compile_():
+        return stack.compile(UnboundedTemplate())
+    template = compile_()
+    result = {
+        'compile_s': min(timeit.repeat(compile_, number=1, repeat=repeat)),
+        'to_yaml_s': min(timeit.repeat(lambda: serialize.to_yaml(template),
+                                       number=1, repeat=repeat)),
+        'to_json_s': min(timeit.repeat(lambda: serialize.to_json(template),
+                                       number=1, repeat=repeat)),
+    }
+    tracemalloc.start()
+    try:
+        serialize.to_yaml(compile_())
+        result['peak_mb'] = tracemalloc.get_traced_memory()[1] / 2.0 ** 20
+    finally:
+        tracemalloc.stop()
+    return result
+
+
+def run(sizes=SIZES, repeat=7):
+    """Results of all cases, along with the calibration and import time"""
+    return {
+        'calibration_s': calibrate(),
+        'import_s': import_time(),
+        'cases': {name: measure(stack, repeat) for name, stack in
+                  cases(sizes)},
+    }
+
+
+def compare(results, baseline, threshold=0.25):
+    """
+    Check `results` against `baseline`, both as returned by `run()`.
+
+    Returns:
+        list: ``(case, metric, baseline value, value)`` of every gated
+        metric more than `threshold` (a fraction) above its baseline
+    """
+    scale = results['calibration_s'] / baseline['calibration_s']
+    regressions = []
+    for name, metrics in sorted(results['cases'].items()):
+        base = baseline['cases'].get(name)
+        if base is None:
+            continue
+        for metric, noise in sorted(GATED.items()):
+            expected = base[metric] * (scale if metric.endswith('_s') else 1)
+            if metrics[metric] > expected * (1 + threshold) and \
+                    metrics[metric] - expected > noise:
+                regressions.append((name, metric, expected, metrics[metric]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='bench_compile')
+    parser.add_argument('--baseline', default=BASELINE,
+                        help='Baseline JSON file')
+    parser.add_argument('--save', action='store_true',
+                        help='Record the results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='Allowed slowdown, as a fraction')
+    parser.add_argument('--sizes', type=lambda val: [
+        int(size) for size in val.split(',')], default=SIZES,
+        help='Comma-separated stack sizes')
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    results = run(args.sizes)
+    print('{0:<22} {1:>10} {2:>10} {3:>10} {4:>9}'.format(
+        'CASE', 'COMPILE', 'TO_YAML', 'TO_JSON', 'PEAK MB'))
+    for name, metrics in results['cases'].items():
+        print('{0:<22} {1[compile_s]:>10.4f} {1[to_yaml_s]:>10.4f} '
+              '{1[to_json_s]:>10.4f} {1[peak_mb]:>9.1f}'.format(
+                  name, metrics))
+    print('import: %.3f s, calibration: %.3f s, total: %.1f s' % (
+        results['import_s'], results['calibration_s'],
+        time.perf_counter() - started))
+
+    if args.save:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w', encoding='utf-8') as fhandle:
+            json.dump(results, fhandle, indent=2, sort_keys=True)
+            fhandle.write('\n')
+        print('Baseline saved to %s' % args.baseline)
+        return 0
+    try:
+        with open(args.baseline, encoding='utf-8') as fhandle:
+            baseline = json.load(fhandle)
+    except OSError:
+        print('No baseline at %s - run with --save first' % args.baseline)
+        return 0
+    regressions = compare(results, baseline, args.threshold)
+    for name, metric, expected, value in regressions:
+        print('REGRESSION %s %s: %.4f, baseline %.4f (+%.0f%%)' % (
+            name, metric, value, expected, 100 * (value / expected - 1)))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
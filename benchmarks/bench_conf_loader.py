@@ -0,0 +1,63 @@
+"""
+Compare configuring many stacks from one large partitioned YAML file by
+calling `partitioned_yaml_loader` per stack, against a single shared
+`PartitionedConfig`.
+
+    $ python -m benchmarks.bench_conf_loader
+"""
+import io
+import time
+
+import yaml
+
+from tropostack.conf_loaders import partitioned_yaml_loader, PartitionedConfig
+
+
+def make_config(stacks=50, keys=500):
+    """Render a partitioned config with `stacks` sections of `keys` entries"""
+    conf = {'env': 'bench', 'region': 'eu-west-1'}
+    for stack in range(stacks):
+        conf['stack-%03d' % stack] = {
+            'key_%04d' % key: {'cidr': '10.%d.%d.0/24' % (stack, key % 256),
+                               'ports': [22, 80, 443],
+                               'name': 'resource-%d-%d' % (stack, key)}
+            for key in range(keys)
+        }
+    return yaml.safe_dump(conf)
+
+
+def main():
+    stacks = 50
+    source = make_config(stacks)
+    names = ['stack-%03d' % stack for stack in range(stacks)]
+    print('Config size: %.1f MB, libyaml: %s'
+          % (len(source) / 1024 / 1024, yaml.__with_libyaml__))
+
+    # Re-parsing per stack is slow enough to only time a sample of it
+    sample = 5
+    started = time.perf_counter()
+    for name in names[:sample]:
+        partitioned_yaml_loader(io.StringIO(source), name)
+    per_stack = (time.perf_counter() - started) * stacks / sample
+
+    started = time.perf_counter()
+    config = PartitionedConfig.load(io.StringIO(source))
+    for name in names:
+        config.stack_conf(name)
+    shared = time.perf_counter() - started
+
+    started = time.perf_counter()
+    yaml.load(io.StringIO(source), Loader=yaml.SafeLoader)
+    pure_python = time.perf_counter() - started
+
+    print('{0:<45} {1:>9}'.format('METHOD', 'SECONDS'))
+    print('{0:<45} {1:>9.3f}'.format(
+        'pure-Python parse, once', pure_python))
+    print('{0:<45} {1:>9.3f}'.format(
+        'partitioned_yaml_loader x %d (estimated)' % stacks, per_stack))
+    print('{0:<45} {1:>9.3f}'.format(
+        'PartitionedConfig + %d views' % stacks, shared))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+"""
+Compare recompiling a 400-resource stack after changing a single
+configuration key, fully and through `IncrementalCompiler`.
+
+    $ python -m benchmarks.bench_incremental
+"""
+import timeit
+
+from tropostack.incremental import IncrementalCompiler
+from benchmarks.synthetic import wide_stack
+
+
+def bench(size=400, repeat=3):
+    stack_cls = wide_stack(size, refs=0, outputs=50, own_keys=True)
+    compiler = IncrementalCompiler()
+    compiler.compile(stack_cls({}))
+    edits = iter(range(10 ** 6))
+
+    def incremental():
+        # A different value each time, so there is always one change
+        compiler.compile(stack_cls({'name_00007': 'edit-%d' % next(edits)}))
+
+    full = min(timeit.repeat(lambda: stack_cls({}).compile().to_dict(),
+                             number=1, repeat=repeat))
+    incr = min(timeit.repeat(incremental, number=1, repeat=repeat))
+    return full, incr, len(compiler.rebuilt)
+
+
+def main():
+    full, incr, rebuilt = bench()
+    print('{0:<30} {1:>9}'.format('METHOD (400 resources)', 'SECONDS'))
+    print('{0:<30} {1:>9.3f}'.format('compile + to_dict', full))
+    print('{0:<30} {1:>9.3f}'.format(
+        'incremental (%d rebuilt)' % rebuilt, incr))
+
+
+if __name__ == '__main__':
+    main()
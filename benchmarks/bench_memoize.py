@@ -0,0 +1,51 @@
+"""
+Compare `compile()` time of a wide, cross-referenced stack declared with
+plain ``@property`` members against the memoized `resource`/`output` ones,
+then time heavily cross-referenced stacks - out of reach of plain properties -
+with memoized members only.
+
+    $ python -m benchmarks.bench_memoize
+"""
+import sys
+import timeit
+
+from benchmarks.synthetic import wide_stack
+
+
+def bench(size, refs, repeat=3, plain=True):
+    """
+    Returns:
+        tuple: Best compile times with plain properties - None unless
+        `plain` - and with memoized members, in seconds
+    """
+    memo_cls = wide_stack(size, refs=refs)
+    memo = min(timeit.repeat(lambda: memo_cls({}).compile(),
+                             number=1, repeat=repeat))
+    if not plain:
+        return None, memo
+    plain_cls = wide_stack(size, refs=refs, decorator=property,
+                           out_decorator=property)
+    plain = min(timeit.repeat(lambda: plain_cls({}).compile(),
+                              number=1, repeat=repeat))
+    return plain, memo
+
+
+def main():
+    # Plain properties re-evaluate the whole reference chain on each access;
+    # with more than one reference per resource that becomes exponential
+    sys.setrecursionlimit(10000)
+    print('{0:>9} {1:>5} {2:>12} {3:>12} {4:>8}'.format(
+        'RESOURCES', 'REFS', 'PROPERTY (s)', 'MEMO (s)', 'SPEEDUP'))
+    for size in (50, 100, 200, 300):
+        plain, memo = bench(size, refs=1)
+        print('{0:>9} {1:>5} {2:>12.4f} {3:>12.4f} {4:>7.1f}x'.format(
+            size, 1, plain, memo, plain / memo))
+    for refs in (3, 10):
+        for size in (100, 250, 500):
+            _, memo = bench(size, refs=refs, plain=False)
+            print('{0:>9} {1:>5} {2:>12} {3:>12.4f} {4:>8}'.format(
+                size, refs, '-', memo, '-'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+"""
+Compare troposphere's `to_yaml`/`to_json` against `tropostack.serialize` on a
+1,000-resource template.
+
+    $ python -m benchmarks.bench_serialize
+"""
+import timeit
+
+import troposphere
+import yaml
+
+from tropostack import serialize
+from benchmarks.synthetic import wide_stack
+
+
+def bench(size=1000, repeat=3):
+    # CloudFormation caps templates at 500 resources, which troposphere
+    # enforces; lift the cap, as only serialization is measured here
+    troposphere.MAX_RESOURCES = max(troposphere.MAX_RESOURCES, size)
+    template = wide_stack(size, outputs=100)({}).compile()
+    cases = [
+        ('Template.to_yaml', template.to_yaml),
+        ('serialize.to_yaml', lambda: serialize.to_yaml(template)),
+        ('Template.to_json', template.to_json),
+        ('serialize.to_json', lambda: serialize.to_json(template)),
+    ]
+    return [(name, min(timeit.repeat(func, number=1, repeat=repeat)))
+            for name, func in cases]
+
+
+def main():
+    print('libyaml: %s, orjson: %s' % (yaml.__with_libyaml__,
+                                       serialize.orjson is not None))
+    print('{0:<25} {1:>9}'.format('METHOD (1000 resources)', 'SECONDS'))
+    for name, elapsed in bench():
+        print('{0:<25} {1:>9.3f}'.format(name, elapsed))
+
+
+if __name__ == '__main__':
+    main()
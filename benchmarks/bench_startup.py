@@ -0,0 +1,80 @@
+"""
+Measure the startup cost of the ``print`` command with ``python -X importtime``
+and list the heaviest imports along its path.
+
+    $ python -m benchmarks.bench_startup
+"""
+import os
+import subprocess
+import sys
+import time
+
+# Module-level code run by the child process: render a stack without AWS
+PRINT_SNIPPET = '''
+import io, contextlib, sys
+from tropostack.cli import InlineConfCLI
+from examples.s3_bucket.s3_minimal import MyS3BucketStack
+cli = InlineConfCLI.for_stack(MyS3BucketStack({}), 'print')
+with contextlib.redirect_stdout(io.StringIO()):
+    cli.run()
+print(' '.join(sorted(sys.modules)))
+'''
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_print(importtime=False):
+    """
+    Run the ``print`` command in a fresh interpreter.
+
+    Returns:
+        tuple: Wall-clock seconds, the set of loaded module names and the
+        ``-X importtime`` report lines (empty unless `importtime` is set)
+    """
+    cmd = [sys.executable]
+    if importtime:
+        cmd += ['-X', 'importtime']
+    cmd += ['-c', PRINT_SNIPPET]
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    started = time.perf_counter()
+    proc = subprocess.run(cmd, cwd=ROOT, env=env, check=True,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          universal_newlines=True)
+    elapsed = time.perf_counter() - started
+    return elapsed, set(proc.stdout.split()), proc.stderr.splitlines()
+
+
+def parse_importtime(lines):
+    """
+    Parse ``-X importtime`` output.
+
+    Returns:
+        list: (cumulative microseconds, module name) of the top-level
+        imports, heaviest first
+    """
+    top = []
+    for line in lines:
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Nested imports are indented below their parent
+        if not name[1:].startswith(' '):
+            top.append((int(cumulative), name.strip()))
+    return sorted(top, reverse=True)
+
+
+def main():
+    runs = 5
+    best = min(run_print()[0] for _ in range(runs))
+    _, modules, report = run_print(importtime=True)
+    print('print command, best of %d: %.3f s' % (runs, best))
+    print('AWS stack loaded: %s' % ', '.join(
+        sorted(mod for mod in ('boto3', 'botocore', 'tabulate')
+               if mod in modules) or ['none']))
+    print('{0:<45} {1:>9}'.format('TOP-LEVEL IMPORT', 'SECONDS'))
+    for cumulative, name in parse_importtime(report)[:10]:
+        print('{0:<45} {1:>9.3f}'.format(name, cumulative / 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Generators for synthetic stacks used by the benchmarks
+"""
+from troposphere import Output, Join, Ref
+from troposphere import sns
+
+from tropostack.base import InlineConfStack, resource, output
+
+
+def wide_stack(size, refs=3, outputs=10, decorator=resource,
+               out_decorator=output, base=InlineConfStack, own_keys=False):
+    """
+    Build a stack class with `size` SNS topics. Each topic references the
+    `refs` topics declared right before it, so evaluating the last member
+    walks the whole chain unless members are memoized.
+
+    Args:
+        size (int): Number of `r_` members
+        refs (int): How many preceding resources each resource references
+        outputs (int): Number of `o_` members, spread across the resources
+        decorator (callable): Decorator used for the `r_` members
+        out_decorator (callable): Decorator used for the `o_` members
+        base (type): Stack base class
+        own_keys (bool): Have each resource also read a configuration key
+            of its own, ``name_<index>``
+
+    Returns:
+        type: A `base` subclass ready to be instantiated
+    """
+    attrs = {
+        'BASE_NAME': 'synthetic-%d' % size,
+        'CONF': {'region': 'pytest', 'env': 'bench', 'prefix': 'bench'},
+    }
+
+    def make_resource(idx):
+        def member(self):
+            deps = [getattr(self, 'r_topic_%05d' % dep)
+                    for dep in range(max(0, idx - refs), idx)]
+            prefix = [self.conf['prefix']]
+            if own_keys:
+                prefix.append(self.conf.get('name_%05d' % idx, 'topic'))
+            return sns.Topic(
+                'Topic%05d' % idx,
+                DisplayName=Join('-', prefix + [Ref(dep) for dep in deps]),
+            )
+        member.__name__ = 'r_topic_%05d' % idx
+        return decorator(member)
+
+    def make_output(idx):
+        def member(self):
+            return Output('Topic%05dArn' % idx,
+                          Value=Ref(getattr(self, 'r_topic_%05d' % idx)))
+        member.__name__ = 'o_topic_%05d' % idx
+        return out_decorator(member)
+
+    for idx in range(size):
+        attrs['r_topic_%05d' % idx] = make_resource(idx)
+    step = max(1, size // max(1, outputs))
+    for idx in range(0, size, step)[:outputs]:
+        attrs['o_topic_%05d' % idx] = make_output(idx)
+    return type('SyntheticStack%d' % size, (base,), attrs)
@@ -0,0 +1,85 @@
+"""
+End-to-end benchmarks of the CLI deploy flows against the in-memory AWS
+fakes, tracking the wall-clock time and the AWS API calls of each command.
+
+    $ python -m pytest benchmarks/test_cli_flows.py --benchmark-only
+
+Each benchmark records its API call counts in the ``extra_info`` of the
+pytest-benchmark results (see ``--benchmark-json``), and fails if a command
+makes more calls than its budget below.
+"""
+import pytest
+
+from tropostack import cli
+from tropostack.testing import FakeProvider
+
+from benchmarks.synthetic import wide_stack
+
+pytest.importorskip('pytest_benchmark')
+
+STACK = wide_stack(50, refs=1, outputs=5)
+# Simulated round trip of each API call, in seconds
+LATENCY = 0.0005
+
+# Most API calls each flow may make, by operation
+CALL_BUDGETS = {
+    'validate': {'validate_template': 1},
+    'create': {'create_stack': 1, 'describe_stacks': 51,
+               'describe_stack_events': 51},
+    'update': {'describe_stacks': 53, 'get_template': 1,
+               'create_change_set': 1, 'describe_change_set': 1,
+               'execute_change_set': 1, 'describe_stack_events': 52},
+    'noop': {'describe_stacks': 2, 'get_template': 1},
+    'delete': {'delete_stack': 1, 'describe_stacks': 52,
+               'describe_stack_events': 53},
+}
+
+
+pytestmark = pytest.mark.usefixtures('fast_polls')
+
+
+def run_command(aws, command, conf=None):
+    sut = cli.InlineConfCLI.for_stack(STACK(conf or {}), command)
+    sut.aws = aws
+    sut.echo = lambda msg: None
+    sut.run()
+
+
+def deployed(conf=None):
+    """Provider with the stack already created, and a clean call count"""
+    aws = FakeProvider(region='pytest', latency=LATENCY)
+    run_command(aws, 'create', conf)
+    for client in aws.clients.values():
+        client.calls.clear()
+    return aws
+
+
+# Flow name to (command, setup returning the provider, stack conf)
+FLOWS = {
+    'validate': ('validate',
+                 lambda: FakeProvider(region='pytest', latency=LATENCY),
+                 None),
+    'create': ('create',
+               lambda: FakeProvider(region='pytest', latency=LATENCY), None),
+    'update': ('apply', deployed, {'prefix': 'changed'}),
+    'noop': ('apply', deployed, None),
+    'delete': ('delete', deployed, None),
+}
+
+
+@pytest.mark.parametrize('flow', sorted(FLOWS))
+def test_cli_flow(benchmark, flow):
+    command, setup, conf = FLOWS[flow]
+    providers = []
+
+    def prepare():
+        providers.append(setup())
+        return (providers[-1], command, conf), {}
+
+    benchmark.pedantic(run_command, setup=prepare, rounds=3)
+    calls = dict(providers[-1].calls())
+    benchmark.extra_info['aws_calls'] = calls
+    benchmark.extra_info['aws_calls_total'] = sum(calls.values())
+    over = {op: count for op, count in calls.items()
+            if count > CALL_BUDGETS[flow].get(op, 0)}
+    assert not over, 'API calls over budget: %s' % over
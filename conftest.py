@@ -0,0 +1,16 @@
+"""
+Fixtures shared by the tests and the benchmarks
+"""
+import asyncio
+
+import pytest
+
+from tropostack import cli
+
+
+@pytest.fixture
+def fast_polls(monkeypatch):
+    """Poll the (fake) stacks without waiting in between"""
+    monkeypatch.setattr(cli.InlineConfCLI, 'POLL_MIN_SEC', 0)
+    real_sleep = asyncio.sleep
+    monkeypatch.setattr(asyncio, 'sleep', lambda delay: real_sleep(0))
@@ -5,7 +5,7 @@ Executable/library defining a Troposphere-powered: DynamoDB
 from troposphere import Output, Export, Sub, GetAtt
 from troposphere import dynamodb
 
-from tropostack.base import InlineConfStack
+from tropostack.base import InlineConfStack, resource, output
 from tropostack.cli import InlineConfCLI
 
 class DynamoDbStack(InlineConfStack):
@@ -16,7 +16,7 @@ class DynamoDbStack(InlineConfStack):
         'table_name': 'tropostack-sample-table',
         'table_key': 'tropostack-sample-key',
     }
-    @property
+    @output
     def o_dynamodb_table_name(self):
         _id = 'TableName'
         return Output(
@@ -26,7 +26,7 @@ class DynamoDbStack(InlineConfStack):
             Export=Export(Sub("${AWS::StackName}-%s" % _id))
         )
 
-    @property
+    @output
     def o_dynamodb_table_arn(self):
         _id = 'TableArn'
         return Output(
@@ -36,7 +36,7 @@ class DynamoDbStack(InlineConfStack):
             Export=Export(Sub("${AWS::StackName}-%s" % _id))
         )
 
-    @property
+    @resource
     def r_table(self):
         table_name = self.conf['table_name']
         table_key = self.conf['table_key']
@@ -3,7 +3,7 @@
 from troposphere import ec2
 from troposphere import Output, Export, Sub, GetAtt, Ref
 
-from tropostack.base import InlineConfStack
+from tropostack.base import InlineConfStack, resource
 from tropostack.cli import InlineConfCLI
 
 class EC2Stack(InlineConfStack):
@@ -28,6 +28,8 @@ class EC2Stack(InlineConfStack):
     """
 
     BASE_NAME = 'ec2-instance'
+    # AMIs get looked up in one go when compiling
+    AMI_LOCATION_KEYS = ('ami_location',)
     CONF = {
         'region': 'eu-west-1',
         'instance_type': 't3.nano',
@@ -39,7 +41,7 @@ class EC2Stack(InlineConfStack):
         'ami_location': '',
     }
 
-    @property
+    @resource
     def r_ec2_secgroup(self):
         return ec2.SecurityGroup(
             "Ec2SecurityGroup",
@@ -55,7 +57,7 @@ class EC2Stack(InlineConfStack):
             ],
         )
 
-    @property
+    @resource
     def r_ec2(self):
         return ec2.Instance(
             "Ec2Instance",
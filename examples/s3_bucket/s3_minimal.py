@@ -3,7 +3,7 @@
 from troposphere import s3
 from troposphere import Output, Export, Sub, GetAtt
 
-from tropostack.base import InlineConfStack
+from tropostack.base import InlineConfStack, resource, output
 from tropostack.cli import InlineConfOvrdCLI
 
 
@@ -31,7 +31,7 @@ class MyS3BucketStack(InlineConfStack):
     }
 
     # Stack Resources are defined as class properties prefixed with 'r_'
-    @property
+    @resource
     def r_bucket(self):
         return s3.Bucket(
             'MyBucketResource',
@@ -39,7 +39,7 @@ class MyS3BucketStack(InlineConfStack):
         )
 
     # Stack Outputs are defined as class properties prefixed with 'o_'
-    @property
+    @output
     def o_bucket_arn(self):
         _id = 'BucketArn'
         return Output(
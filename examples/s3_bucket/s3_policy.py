@@ -4,7 +4,7 @@ from troposphere import Output, Export, Sub, GetAtt, Join
 from troposphere import s3
 import boto3.s3
 
-from tropostack.base import InlineConfStack
+from tropostack.base import InlineConfStack, resource, output
 from tropostack.cli import InlineConfOvrdCLI
 
 class S3BucketStack(InlineConfStack):
@@ -32,7 +32,7 @@ class S3BucketStack(InlineConfStack):
     }
 
     # This is an Output element in the stack, as denoted by leading 'o_'
-    @property
+    @output
     def o_bucket_arn(self):
         _id = 'BucketArn'
         return Output(
@@ -45,7 +45,7 @@ class S3BucketStack(InlineConfStack):
         )
 
     # Below are the Resource elements in the stack, specified by a leading 'r_'
-    @property
+    @resource
     def r_bucket(self):
         # Create an S3 Bucket
         return s3.Bucket(
@@ -54,7 +54,7 @@ class S3BucketStack(InlineConfStack):
             BucketName=Sub(self.conf['bucket_name']),
         )
 
-    @property
+    @resource
     def r_bucket_policy(self):
         # Append a policy to the S3 bucket
         return s3.BucketPolicy(
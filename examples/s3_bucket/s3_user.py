@@ -4,7 +4,7 @@ from troposphere import Output, Export, Sub, GetAtt, Join, Ref
 from troposphere import s3
 from troposphere import iam
 
-from tropostack.base import InlineConfStack
+from tropostack.base import InlineConfStack, resource, output
 from tropostack.cli import InlineConfOvrdCLI
 
 class S3UserStack(InlineConfStack):
@@ -37,7 +37,7 @@ class S3UserStack(InlineConfStack):
     # Since we are creating a Named IAM user account, we need extra capability
     CFN_CAPS = ['CAPABILITY_NAMED_IAM']
 
-    @property
+    @output
     def o_bucket_arn(self):
         _id = 'BucketArn'
         return Output(
@@ -47,7 +47,7 @@ class S3UserStack(InlineConfStack):
             Export=Export(Sub("${AWS::StackName}-%s" % _id))
         )
 
-    @property
+    @output
     def o_username(self):
         _id = 'UserName'
         return Output(
@@ -57,14 +57,14 @@ class S3UserStack(InlineConfStack):
             Export=Export(Sub("${AWS::StackName}-%s" % _id))
         )
 
-    @property
+    @resource
     def r_bucket(self):
         return s3.Bucket(
             'S3Bucket',
             BucketName=Sub(self.conf['bucket_name']),
         )
 
-    @property
+    @resource
     def r_iam_user(self):
         return iam.User(
             'S3BotUser',
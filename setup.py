@@ -32,19 +32,28 @@ setup(
     long_description_content_type='text/x-rst',
     long_description=read("README.rst"),
     packages=find_packages(exclude=('tests',)),
+    entry_points={
+        'console_scripts': ['tropostack=tropostack.__main__:main'],
+    },
+    # Ordered class namespaces and __set_name__ (see tropostack.base), and
+    # asyncio.run (see tropostack.aio)
+    python_requires='>=3.7',
     install_requires=[
         'boto3',
+        'cfn_flip',
         'tabulate',
         'troposphere',
         'pyyaml',
     ],
+    extras_require={
+        # Faster JSON template rendering
+        'fast': ['orjson'],
+    },
     classifiers=[
         'Development Status :: 2 - Pre-Alpha',
         'License :: OSI Approved :: MIT License',
         'Programming Language :: Python',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.5',
-        'Programming Language :: Python :: 3.6',
         'Programming Language :: Python :: 3.7',
     ],
 )
@@ -0,0 +1,72 @@
+import asyncio
+
+from tropostack import aio, cli
+from tropostack.testing import FakeProvider
+
+from examples.s3_bucket.s3_minimal import MyS3BucketStack
+
+
+class NumberedStack(MyS3BucketStack):
+    BASE_NAME = 'aio-{idx}'
+
+
+def make_clis(count, aws, conf=None):
+    clis = []
+    for idx in range(count):
+        sut = cli.InlineConfCLI.for_stack(
+            NumberedStack(dict(conf or {}, idx=idx)))
+        sut.aws = aws
+        clis.append(sut)
+    return clis
+
+
+def test_apply_many_stacks_concurrently(fast_polls, capsys):
+    aws = FakeProvider(region='eu-west-1')
+    clis = make_clis(200, aws)
+    results = asyncio.run(aio.run_commands(clis, 'apply', limit=50))
+    assert results == [None] * 200
+    fake = aws.client('cloudformation', 'eu-west-1')
+    assert sorted(fake.stacks) == sorted('aio-%d' % idx for idx in range(200))
+    assert {stack.status for stack in fake.stacks.values()} == {
+        'CREATE_COMPLETE'}
+    assert fake.calls['create_stack'] == 200
+    out = capsys.readouterr().out
+    assert out.count('CREATE_COMPLETE') >= 200
+
+    # Unchanged stacks end up as no-ops, without any change sets
+    results = asyncio.run(aio.run_commands(make_clis(200, aws), 'apply'))
+    assert results == [None] * 200
+    assert fake.calls['create_change_set'] == 0
+    assert 'No updates to be performed' in capsys.readouterr().out
+
+
+def test_update_through_change_set(fast_polls, capsys):
+    aws = FakeProvider(region='eu-west-1')
+    asyncio.run(aio.run_commands(make_clis(3, aws), 'create'))
+    clis = make_clis(3, aws, {'bucket_name': 'renamed'})
+    assert asyncio.run(aio.run_commands(clis, 'update')) == [None] * 3
+    fake = aws.client('cloudformation', 'eu-west-1')
+    assert fake.calls['execute_change_set'] == 3
+    assert {stack.status for stack in fake.stacks.values()} == {
+        'UPDATE_COMPLETE'}
+    assert 'Modify' in capsys.readouterr().out
+
+
+def test_errors_are_collected_per_stack(fast_polls):
+    aws = FakeProvider(region='eu-west-1')
+    clis = make_clis(2, aws)
+    asyncio.run(aio.AsyncEngine(clis[0]).cmd_create())
+    results = asyncio.run(aio.run_commands(clis, 'delete'))
+    assert results[0] is None
+    assert 'not found' in str(results[1])
+    assert aws.client('cloudformation', 'eu-west-1').stacks == {}
+
+
+def test_outputs(fast_polls, capsys):
+    aws = FakeProvider(region='eu-west-1')
+    engine = aio.AsyncEngine(make_clis(1, aws)[0])
+    asyncio.run(engine.cmd_create())
+    asyncio.run(engine.run('outputs'))
+    out = capsys.readouterr().out
+    assert 'CREATE_COMPLETE' in out
+    assert 'BucketArn' in out
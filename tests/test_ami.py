@@ -0,0 +1,69 @@
+import pytest
+
+from tropostack.ami import AmiResolver, StubImageBackend
+from tropostack.exceptions import AmiLookupError
+
+from examples.ec2.ec2_static_ip import EC2Stack
+
+
+class CountingBackend(StubImageBackend):
+    cacheable = True
+
+    def __init__(self, images):
+        super().__init__(images)
+        self.calls = []
+
+    def describe(self, aws, region, locations):
+        self.calls.append(sorted(locations))
+        return {loc: [self.images[loc]] if loc in self.images else []
+                for loc in locations}
+
+
+IMAGES = {'amazon/one': 'ami-1', 'amazon/two': 'ami-2'}
+
+
+def test_batched_and_memoized(tmp_path):
+    backend = CountingBackend(IMAGES)
+    resolver = AmiResolver(backend, cache_path=str(tmp_path / 'amis.json'))
+    resolver.prefetch('eu-west-1', ['amazon/one', 'amazon/two'])
+    assert resolver.resolve('eu-west-1', 'amazon/two') == 'ami-2'
+    assert resolver.resolve('eu-west-1', 'amazon/one') == 'ami-1'
+    assert backend.calls == [['amazon/one', 'amazon/two']]
+    with pytest.raises(AmiLookupError):
+        resolver.resolve('eu-west-1', 'amazon/missing')
+
+
+def test_disk_cache_and_offline(tmp_path):
+    cache_path = str(tmp_path / 'amis.json')
+    AmiResolver(CountingBackend(IMAGES), cache_path=cache_path).resolve(
+        'eu-west-1', 'amazon/one')
+    backend = CountingBackend(IMAGES)
+    offline = AmiResolver(backend, cache_path=cache_path, offline=True)
+    assert offline.resolve('eu-west-1', 'amazon/one') == 'ami-1'
+    assert backend.calls == []
+    with pytest.raises(AmiLookupError):
+        offline.resolve('eu-west-1', 'amazon/two')
+    expired = AmiResolver(backend, cache_path=cache_path, ttl=-1)
+    assert expired.resolve('eu-west-1', 'amazon/one') == 'ami-1'
+    assert backend.calls == [['amazon/one']]
+
+
+def test_stack_prefetches_on_compile(tmp_path):
+    backend = CountingBackend(IMAGES)
+    resolver = AmiResolver(backend, cache_path=str(tmp_path / 'amis.json'))
+
+    class Stack(EC2Stack):
+        AMI_RESOLVER = resolver
+
+    stack = Stack({'ami_location': 'amazon/two'})
+    stack.compile()
+    stack.compile()
+    assert backend.calls == [['amazon/two']]
+    assert stack.r_ec2.ImageId == 'ami-2'
+
+
+def test_pytest_region_stub():
+    resolver = AmiResolver(CountingBackend({}))
+    assert resolver.resolve('pytest', 'amazon/any') == 'ami-notfound'
+    resolver.register_backend('pytest', StubImageBackend({'x': 'ami-x'}))
+    assert resolver.resolve('pytest', 'x') == 'ami-x'
@@ -0,0 +1,56 @@
+import threading
+from datetime import datetime, timedelta, timezone
+
+from botocore.stub import Stubber
+
+from tropostack.aws import ClientProvider
+from tropostack.cli import InlineConfCLI
+
+from examples.s3_bucket.s3_minimal import MyS3BucketStack
+
+
+def test_clients_are_shared():
+    aws = ClientProvider(region='eu-west-1', max_pool_connections=3)
+    cfn = aws.client('cloudformation')
+    assert aws.client('cloudformation', 'eu-west-1') is cfn
+    assert aws.client('cloudformation', 'us-east-1') is not cfn
+    assert cfn.meta.config.max_pool_connections == 3
+    assert cfn.meta.config.retries['mode'] == 'standard'
+
+
+def test_clients_shared_between_threads():
+    aws = ClientProvider(region='eu-west-1')
+    clients = []
+    threads = [threading.Thread(target=lambda: clients.append(
+        aws.client('cloudformation'))) for _ in range(8)]
+    [thread.start() for thread in threads]
+    [thread.join() for thread in threads]
+    assert len(set(map(id, clients))) == 1
+
+
+def test_cli_shares_provider_with_stack():
+    cli = InlineConfCLI.for_stack(MyS3BucketStack({}))
+    assert cli.stack.aws is cli.aws
+    assert cli._cfn_conn() is cli._cfn_conn()
+    assert cli._cfn_conn().meta.region_name == 'eu-west-1'
+
+
+def test_assumed_role_credentials_refresh():
+    aws = ClientProvider(region='eu-west-1', aws_access_key_id='base',
+                         aws_secret_access_key='base')
+    stubber = Stubber(aws.client('sts'))
+    now = datetime.now(timezone.utc)
+    # The first credentials are about to expire, the second ones are not
+    for idx, expires in enumerate([now + timedelta(seconds=30),
+                                   now + timedelta(hours=1)]):
+        stubber.add_response('assume_role', {'Credentials': {
+            'AccessKeyId': 'ASIAEXAMPLEKEY%02d' % idx, 'SecretAccessKey': 'secret',
+            'SessionToken': 'token', 'Expiration': expires}})
+    with stubber:
+        assumed = aws.assume_role('arn:aws:iam::111111111111:role/deploy')
+        assert aws.assume_role('arn:aws:iam::111111111111:role/deploy') \
+            is assumed
+        creds = assumed.session.get_credentials()
+        assert creds.get_frozen_credentials().access_key == 'ASIAEXAMPLEKEY01'
+        assert creds.get_frozen_credentials().access_key == 'ASIAEXAMPLEKEY01'
+    stubber.assert_no_pending_responses()
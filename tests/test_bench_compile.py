@@ -0,0 +1,32 @@
+from benchmarks import bench_compile
+
+
+def results(calibration, compile_s, peak_mb):
+    return {'calibration_s': calibration, 'import_s': 0.1, 'cases': {
+        'inline-100-refs0': {'compile_s': compile_s, 'to_yaml_s': 0.01,
+                             'to_json_s': 0.01, 'peak_mb': peak_mb}}}
+
+
+def test_compare_scales_by_calibration():
+    baseline = results(0.05, 0.1, 10.0)
+    assert bench_compile.compare(results(0.05, 0.12, 10.0), baseline) == []
+    assert bench_compile.compare(results(0.05, 0.2, 10.0), baseline) == [
+        ('inline-100-refs0', 'compile_s', 0.1, 0.2)]
+    # A machine twice as slow is allowed twice the time
+    assert bench_compile.compare(results(0.1, 0.2, 10.0), baseline) == []
+    assert bench_compile.compare(results(0.05, 0.1, 20.0), baseline) == [
+        ('inline-100-refs0', 'peak_mb', 10.0, 20.0)]
+
+
+def test_compare_ignores_noise_and_new_cases():
+    baseline = results(0.05, 0.0001, 0.01)
+    assert bench_compile.compare(results(0.05, 0.001, 0.1), baseline) == []
+    assert bench_compile.compare(results(0.05, 1.0, 100.0),
+                                 {'calibration_s': 0.05, 'cases': {}}) == []
+
+
+def test_small_run():
+    run = bench_compile.run(sizes=[10], repeat=1)
+    assert sorted(run['cases']) == ['env-10-refs0', 'env-10-refs5',
+                                    'inline-10-refs0', 'inline-10-refs5']
+    assert all(case['peak_mb'] > 0 for case in run['cases'].values())
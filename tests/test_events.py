@@ -0,0 +1,162 @@
+import io
+import json
+from datetime import datetime, timedelta, timezone
+
+import boto3
+from botocore.stub import Stubber
+
+from tropostack import cli
+from tropostack.events import (Backoff, JsonLinesSink, StackEventTailer,
+                               TableSink)
+from tropostack.base import InlineConfStack
+
+STACK = 'events-stack'
+T0 = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+
+class TStack(InlineConfStack):
+    BASE_NAME = STACK
+    CONF = {'region': 'eu-west-1'}
+
+
+def event(num, status='CREATE_IN_PROGRESS'):
+    return {
+        'StackId': 'arn:stack/%s' % STACK,
+        'EventId': 'ev-%d' % num,
+        'StackName': STACK,
+        'LogicalResourceId': 'Rsc%d' % num,
+        'ResourceType': 'AWS::SNS::Topic',
+        'ResourceStatus': status,
+        'Timestamp': T0 + timedelta(seconds=num),
+    }
+
+
+def stack_status(status):
+    return {'Stacks': [{
+        'StackName': STACK, 'StackStatus': status, 'CreationTime': T0,
+    }]}
+
+
+def cfn_client():
+    return boto3.client('cloudformation', region_name='eu-west-1',
+                        aws_access_key_id='test', aws_secret_access_key='test')
+
+
+def test_backoff():
+    backoff = Backoff(min_sec=1, max_sec=4, factor=2, jitter=0)
+    assert backoff.delay() == 1
+    backoff.idle()
+    backoff.idle()
+    backoff.idle()
+    assert backoff.delay() == 4
+    backoff.reset()
+    assert backoff.delay() == 1
+    jittery = Backoff(min_sec=10, jitter=0.5)
+    assert all(5 <= jittery.delay() <= 15 for _ in range(100))
+
+
+def test_tailer_pages_until_last_seen():
+    cfn = cfn_client()
+    tailer = StackEventTailer(cfn, STACK, since=T0)
+    with Stubber(cfn) as stub:
+        # First poll - two pages, newest first, stopping at the `since` marker
+        stub.add_response('describe_stack_events',
+                          {'StackEvents': [event(4), event(3)],
+                           'NextToken': 'page2'},
+                          {'StackName': STACK})
+        stub.add_response('describe_stack_events',
+                          {'StackEvents': [event(2), event(1), event(0)],
+                           'NextToken': 'page3'},
+                          {'StackName': STACK, 'NextToken': 'page2'})
+        assert [ev['EventId'] for ev in tailer.poll()] == \
+            ['ev-1', 'ev-2', 'ev-3', 'ev-4']
+        # Second poll stops on the first page, at the last seen event
+        stub.add_response('describe_stack_events',
+                          {'StackEvents': [event(6), event(5), event(4)],
+                           'NextToken': 'page2'},
+                          {'StackName': STACK})
+        assert [ev['EventId'] for ev in tailer.poll()] == ['ev-5', 'ev-6']
+        stub.add_response('describe_stack_events',
+                          {'StackEvents': [event(6), event(5)]},
+                          {'StackName': STACK})
+        assert tailer.poll() == []
+        stub.assert_no_pending_responses()
+
+
+def test_print_status_while_sleeps_when_idle(monkeypatch, capsys):
+    sleeps = []
+    monkeypatch.setattr(cli.time, 'sleep', sleeps.append)
+    monkeypatch.setattr(cli, 'StackEventTailer',
+                        lambda cfn, name: StackEventTailer(cfn, name, T0))
+    cfn = cfn_client()
+    sut = cli.InlineConfCLI.for_stack(TStack({}))
+    with Stubber(cfn) as stub:
+        for _ in range(3):
+            stub.add_response('describe_stacks',
+                              stack_status('CREATE_IN_PROGRESS'))
+            stub.add_response('describe_stack_events', {'StackEvents': []})
+        stub.add_response('describe_stacks', stack_status('CREATE_COMPLETE'))
+        stub.add_response('describe_stack_events', {'StackEvents': [
+            event(2, 'CREATE_COMPLETE'), event(1)]})
+        sut.print_status_while(cfn, 'CREATE_IN_PROGRESS', poll_sec=20)
+        stub.assert_no_pending_responses()
+    # Idle polls were spaced out, with a growing interval
+    assert len(sleeps) == 3
+    assert sleeps[0] < sleeps[2]
+    out = capsys.readouterr().out
+    assert 'Rsc1' in out and 'CREATE_COMPLETE' in out
+
+
+def test_table_sink_prints_header_once():
+    echoed = []
+    sink = TableSink(echoed.append)
+    sink.emit(STACK, 'eu-west-1', [])
+    sink.emit(STACK, 'eu-west-1', [event(1), event(2)])
+    sink.emit(STACK, 'eu-west-1', [event(3)])
+    assert len(echoed) == 2
+    lines = '\n'.join(echoed).splitlines()
+    assert lines[0].startswith('TIMESTAMP (UTC)')
+    assert [line.split()[3] for line in lines[1:]] == ['Rsc1', 'Rsc2', 'Rsc3']
+
+
+def test_json_lines_sink_batches():
+    stream = io.StringIO()
+    sink = JsonLinesSink(stream, batch_size=3, interval=3600)
+    sink.emit(STACK, 'eu-west-1', [event(1), event(2)])
+    assert stream.getvalue() == ''
+    sink.emit(STACK, 'eu-west-1', [event(3)])
+    assert len(stream.getvalue().splitlines()) == 3
+    sink.emit(STACK, 'eu-west-1', [event(4)])
+    sink.flush()
+    records = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [rec['logical_id'] for rec in records] == \
+        ['Rsc1', 'Rsc2', 'Rsc3', 'Rsc4']
+    assert records[0]['stack'] == STACK
+    assert records[0]['region'] == 'eu-west-1'
+    assert records[0]['timestamp'] == '2020-01-01T00:00:01+00:00'
+    assert 'received' in records[0]
+
+
+def test_print_status_while_json_events(monkeypatch, capsys):
+    monkeypatch.setattr(cli.time, 'sleep', lambda sec: None)
+    monkeypatch.setattr(cli, 'StackEventTailer',
+                        lambda cfn, name: StackEventTailer(cfn, name, T0))
+    cfn = cfn_client()
+    sut = cli.InlineConfCLI.for_stack(TStack({}), events='json')
+    with Stubber(cfn) as stub:
+        stub.add_response('describe_stacks', stack_status('CREATE_COMPLETE'))
+        stub.add_response('describe_stack_events', {'StackEvents': [
+            event(2, 'CREATE_COMPLETE'), event(1)]})
+        sut.print_status_while(cfn, 'CREATE_IN_PROGRESS')
+    records = [json.loads(line)
+               for line in capsys.readouterr().out.splitlines()]
+    assert [(rec['logical_id'], rec['status']) for rec in records] == [
+        ('Rsc1', 'CREATE_IN_PROGRESS'), ('Rsc2', 'CREATE_COMPLETE')]
+
+
+def test_json_events_keep_messages_off_stdout(capsys):
+    sut = cli.InlineConfCLI.for_stack(TStack({}), events='json')
+    sut.echo('Stack created')
+    captured = capsys.readouterr()
+    assert captured.out == ''
+    assert captured.err == 'Stack created\n'
@@ -0,0 +1,102 @@
+import time
+
+import botocore.exceptions
+import pytest
+
+from tropostack import cli
+from tropostack.ami import AmiResolver
+from tropostack.testing import FakeProvider
+from tropostack.transport import TemplateTransport
+
+from benchmarks.synthetic import wide_stack
+from examples.s3_bucket.s3_minimal import MyS3BucketStack
+
+
+pytestmark = pytest.mark.usefixtures('fast_polls')
+
+
+def test_throttling():
+    aws = FakeProvider(throttle_every=3)
+    cfn = aws.client('cloudformation')
+    cfn.describe_stacks()
+    cfn.describe_stacks()
+    with pytest.raises(botocore.exceptions.ClientError) as err:
+        cfn.describe_stacks()
+    assert err.value.response['Error']['Code'] == 'Throttling'
+    cfn.describe_stacks()
+    assert cfn.throttled == 1
+    assert aws.calls() == {'describe_stacks': 4}
+
+
+def test_latency():
+    aws = FakeProvider(latency=0.01)
+    started = time.perf_counter()
+    aws.client('s3').put_object(Bucket='b', Key='k', Body='x')
+    aws.client('s3').head_object(Bucket='b', Key='k')
+    assert time.perf_counter() - started >= 0.02
+
+
+def test_ec2_images_for_ami_resolver(tmp_path):
+    aws = FakeProvider()
+    aws.client('ec2').images = {'amazon/one': 'ami-1', 'amazon/two': 'ami-2'}
+    resolver = AmiResolver(cache_path=str(tmp_path / 'amis.json'))
+    resolver.prefetch('us-east-1', ['amazon/one', 'amazon/two'], aws=aws)
+    assert resolver.resolve('us-east-1', 'amazon/two') == 'ami-2'
+    assert aws.calls() == {'describe_images': 1}
+
+
+def test_s3_for_template_transport():
+    aws = FakeProvider()
+    transport = TemplateTransport(aws, bucket='templates')
+    body = wide_stack(400)({}).compile().to_yaml()
+    url = transport.template_args(body)['TemplateURL']
+    assert transport.template_args(body)['TemplateURL'] == url
+    assert aws.calls() == {'head_object': 2, 'put_object': 1}
+    key = url.split('amazonaws.com/')[1]
+    assert aws.client('s3').get_object(
+        Bucket='templates', Key=key)['Body'].read().startswith(b'{')
+
+
+def test_cli_end_to_end():
+    aws = FakeProvider(region='eu-west-1')
+    sut = cli.InlineConfCLI.for_stack(MyS3BucketStack({}), 'apply')
+    sut.aws = aws
+    sut.run()
+    cfn = aws.client('cloudformation', 'eu-west-1')
+    assert cfn.stacks[sut.stackname].status == 'CREATE_COMPLETE'
+    assert cfn.calls['create_stack'] == 1
+
+
+def deploy_flow(monkeypatch, **options):
+    """Create, update and delete a stack - its event rows and API calls"""
+    stack_cls = wide_stack(20, refs=1)
+    aws = FakeProvider(steps_per_event=0)
+    # Stacks progress while the CLI sleeps between polls
+    monkeypatch.setattr(cli.time, 'sleep', lambda sec: [
+        client.tick() for (service, _), client in aws.clients.items()
+        if service == 'cloudformation'])
+    lines = []
+    for command, conf in (('create', {}), ('apply', {'prefix': 'changed'}),
+                          ('delete', {})):
+        sut = cli.InlineConfCLI.for_stack(stack_cls(conf), command,
+                                          **options)
+        sut.aws = aws
+        sut.echo = lambda msg: lines.extend(msg.splitlines())
+        sut.run()
+    # Timestamps aside, as the fake clock ticks on every event
+    rows = [line[25:] for line in lines if line.startswith('20')]
+    return rows, aws.calls()
+
+
+def test_quiet_waits_fetch_events_on_status_changes(monkeypatch):
+    rows, calls = deploy_flow(monkeypatch)
+    quiet_rows, quiet_calls = deploy_flow(monkeypatch, quiet=True)
+    assert quiet_rows == rows
+    assert rows[-1].split()[:3] == [
+        'AWS::CloudFormation::Stack', 'synthetic-20', 'DELETE_COMPLETE']
+    # Polled as often, but with an initial and a final event fetch per
+    # operation only
+    assert quiet_calls['describe_stacks'] == calls['describe_stacks']
+    assert quiet_calls['describe_stack_events'] == 6
+    assert calls['describe_stack_events'] > 100
+    assert sum(quiet_calls.values()) < sum(calls.values()) * 0.6
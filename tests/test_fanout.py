@@ -0,0 +1,116 @@
+import os
+
+import pytest
+from troposphere import sns
+
+from tropostack import cli
+from tropostack.base import InlineConfStack, resource
+from tropostack.fanout import FanOut, Target, target_label
+from tropostack.orchestrator import OK
+from tropostack.testing import FakeProvider
+
+from benchmarks.synthetic import wide_stack
+
+ROLE = 'arn:aws:iam::123456789012:role/deployer'
+
+
+class Global(InlineConfStack):
+    BASE_NAME = 'global'
+    CONF = {'region': 'eu-west-1', 'name': 'topic'}
+
+    @resource
+    def r_topic(self):
+        return sns.Topic('Topic', DisplayName=self.conf['name'])
+
+
+class Regional(Global):
+    BASE_NAME = 'regional'
+
+    @resource
+    def r_topic(self):
+        return sns.Topic('Topic', DisplayName=self.region)
+
+
+pytestmark = pytest.mark.usefixtures('fast_polls')
+
+
+def fan_out(stack_cls, aws, **options):
+    sut = cli.InlineConfCLI.for_stack(stack_cls({}), 'apply', **options)
+    sut.aws = aws
+    return sut
+
+
+def test_compile_once_when_region_independent(capsys):
+    aws = FakeProvider()
+    regions = ['eu-west-1', 'us-east-1', 'ap-south-1']
+    sut = fan_out(Global, aws, regions=regions)
+    fanout = FanOut(sut, regions)
+    results = fanout.run('apply')
+    assert set(results.values()) == {OK}
+    assert fanout.compiles == 1
+    for region in regions:
+        fake = aws.client('cloudformation', region)
+        assert fake.stacks['global'].status == 'CREATE_COMPLETE'
+        assert fake.stacks['global'].stack_id.split(':')[3] == region
+    out = capsys.readouterr().out
+    assert '[ap-south-1] Stack creation initiated' in out
+    assert 'RESULT' in out
+
+
+def test_compile_per_target_when_region_dependent():
+    aws = FakeProvider()
+    regions = ['eu-west-1', 'us-east-1']
+    fanout = FanOut(fan_out(Regional, aws), regions)
+    fanout.run('apply')
+    assert fanout.compiles == 2
+    for region in regions:
+        fake = aws.client('cloudformation', region)
+        assert 'DisplayName: %s' % region in fake.stacks['regional'].template
+
+
+def test_accounts_get_their_own_clients():
+    aws = FakeProvider()
+    sut = fan_out(Global, aws, regions=['eu-west-1', 'us-east-1'],
+                  role_arns=[ROLE])
+    sut.run()
+    assert aws.clients == {}
+    assumed = aws.assumed[ROLE]
+    assert sorted(region for _, region in assumed.clients) == [
+        'eu-west-1', 'us-east-1']
+    assert target_label(Target('us-east-1', ROLE)) == '123456789012/us-east-1'
+
+
+def test_failures_are_reported():
+    aws = FakeProvider()
+    sut = cli.InlineConfCLI.for_stack(Global({}), 'delete',
+                                      regions=['eu-west-1', 'us-east-1'])
+    sut.aws = aws
+    with pytest.raises(RuntimeError) as err:
+        sut.run()
+    assert 'eu-west-1, us-east-1' in str(err.value)
+
+
+def test_split_nested_stacks_fan_out():
+    class Wide(wide_stack(600, refs=1, outputs=5)):
+        CONF = {'region': 'eu-west-1', 'prefix': 'wide'}
+        SPLIT_NESTED = True
+    aws = FakeProvider()
+    regions = ['eu-west-1', 'us-east-1']
+    sut = fan_out(Wide, aws, regions=regions, template_bucket='templates')
+    fanout = FanOut(sut, regions)
+    assert set(fanout.run('create').values()) == {OK}
+    assert fanout.compiles == 1
+    for region in regions:
+        fake = aws.client('cloudformation', region)
+        assert fake.stacks[sut.stackname].status == 'CREATE_COMPLETE'
+
+
+def test_fan_out_incremental(tmp_path, monkeypatch):
+    monkeypatch.setenv('TROPOSTACK_CACHE_DIR', str(tmp_path))
+    aws = FakeProvider()
+    regions = ['eu-west-1', 'us-east-1']
+    sut = fan_out(Regional, aws, regions=regions, incremental=True)
+    fanout = FanOut(sut, regions)
+    assert set(fanout.run('create').values()) == {OK}
+    assert fanout.compiles == 2
+    assert os.listdir(str(tmp_path / 'fragments'))
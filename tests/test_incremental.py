@@ -0,0 +1,165 @@
+import json
+
+import pytest
+
+from troposphere import Output, Ref, Sub
+from troposphere import ec2, sns
+
+from tropostack.base import EnvStack, InlineConfStack, resource, output
+from tropostack.budget import UnboundedTemplate
+from tropostack.incremental import IncrementalCompiler
+from tropostack.outputs import OutputResolver, StubOutputBackend
+
+from benchmarks.synthetic import wide_stack
+from examples.s3_bucket.s3_minimal import MyS3BucketStack
+
+
+class Topics(EnvStack):
+    BASE_NAME = 'topics'
+
+    @resource
+    def r_alerts(self):
+        return sns.Topic('Alerts', DisplayName=self.conf['alerts_name'])
+
+    @resource
+    def r_events(self):
+        return sns.Topic('Events', DisplayName=self.conf.get('events_name',
+                                                             'events'))
+
+    @property
+    def r_audit(self):
+        return sns.Topic('Audit', DisplayName=Sub(
+            '%s-${AWS::Region}' % self.conf['audit_prefix']))
+
+    @output
+    def o_alerts(self):
+        return Output('AlertsArn', Value=Ref(self.r_alerts))
+
+
+CONF = {'env': 'dev', 'region': 'eu-west-1', 'alerts_name': 'alerts',
+        'audit_prefix': 'audit'}
+
+
+def test_same_template_as_compile():
+    for stack in (Topics(CONF), MyS3BucketStack({}), wide_stack(30)({})):
+        assert IncrementalCompiler().compile(stack) == \
+            stack.compile().to_dict()
+
+
+def test_rebuilds_only_changed_members():
+    compiler = IncrementalCompiler()
+    compiler.compile(Topics(CONF))
+    assert compiler.rebuilt == ['r_alerts', 'r_events', 'r_audit', 'o_alerts']
+
+    stack = Topics(CONF)
+    compiler.compile(stack)
+    assert compiler.rebuilt == []
+
+    conf = dict(CONF, audit_prefix='changed')
+    stack = Topics(conf)
+    tmpl = compiler.compile(stack)
+    assert compiler.rebuilt == ['r_audit']
+    assert tmpl == stack.compile().to_dict()
+
+    # Outputs referencing a rebuilt resource get rebuilt too
+    conf['alerts_name'] = 'changed'
+    stack = Topics(conf)
+    tmpl = compiler.compile(stack)
+    assert compiler.rebuilt == ['r_alerts', 'o_alerts']
+    assert tmpl == stack.compile().to_dict()
+
+    # Setting a previously missing key
+    conf['events_name'] = 'more'
+    stack = Topics(conf)
+    tmpl = compiler.compile(stack)
+    assert compiler.rebuilt == ['r_events']
+    assert tmpl == stack.compile().to_dict()
+
+
+def test_stack_attributes_rebuild_everything():
+    compiler = IncrementalCompiler()
+    compiler.compile(Topics(CONF))
+    compiler.compile(Topics(dict(CONF, env='prod')))
+    assert compiler.rebuilt == ['r_alerts', 'r_events', 'r_audit', 'o_alerts']
+
+
+def test_reference_chain():
+    stack_cls = wide_stack(10, refs=1, outputs=0)
+    compiler = IncrementalCompiler()
+    compiler.compile(stack_cls({}))
+    # All topics read the prefix
+    compiler.compile(stack_cls({'prefix': 'other'}))
+    assert len(compiler.rebuilt) == 10
+
+
+def test_persisted_fragments(tmp_path):
+    path = str(tmp_path / 'fragments')
+    IncrementalCompiler(path).compile(Topics(CONF))
+    IncrementalCompiler(path).compile(MyS3BucketStack({}))
+    # One file per stack
+    files = sorted(tmp_path.joinpath('fragments').iterdir())
+    assert len(files) == 2
+    assert all(json.loads(file.read_text()) for file in files)
+    compiler = IncrementalCompiler(path)
+    stack = Topics(dict(CONF, audit_prefix='changed'))
+    assert compiler.compile(stack) == stack.compile().to_dict()
+    assert compiler.rebuilt == ['r_audit']
+    # Files of stacks not compiled for a while get evicted
+    IncrementalCompiler(path, max_age=-1).compile(stack)
+    assert len(list(tmp_path.joinpath('fragments').iterdir())) == 0
+
+
+def test_template_limits():
+    stack = wide_stack(520)({})
+    with pytest.raises(ValueError):
+        IncrementalCompiler().compile(stack)
+    tmpl = IncrementalCompiler().compile(stack, UnboundedTemplate())
+    assert len(tmpl['Resources']) == 520
+
+
+def test_cli_incremental(tmp_path, monkeypatch, capsys):
+    from tropostack.cli import InlineConfCLI
+    monkeypatch.setenv('TROPOSTACK_CACHE_DIR', str(tmp_path))
+    for _ in range(2):
+        sut = InlineConfCLI.for_stack(Topics(CONF), 'print', incremental=True,
+                                      verbose=True)
+        sut.run()
+    captured = capsys.readouterr()
+    assert 'Alerts:' in captured.out
+    assert '0 member(s) rebuilt, 4 reused' in captured.err
+    assert (tmp_path / 'fragments').is_dir()
+
+
+def test_rebuilds_members_whose_lookups_changed():
+    def resolver(vpc_id):
+        resolver = OutputResolver()
+        resolver.register_backend('pytest', StubOutputBackend(
+            {'network': {'VpcId': vpc_id}}))
+        return resolver
+
+    class App(InlineConfStack):
+        BASE_NAME = 'app'
+        CONF = {'region': 'pytest'}
+        OUTPUT_RESOLVER = resolver('vpc-1')
+
+        @resource
+        def r_secgroup(self):
+            return ec2.SecurityGroup(
+                'SecurityGroup', GroupDescription='App',
+                VpcId=self.stack_output('network', 'VpcId'))
+
+        @resource
+        def r_topic(self):
+            return sns.Topic('Topic')
+
+    compiler = IncrementalCompiler()
+    compiler.compile(App({}))
+    compiler.compile(App({}))
+    assert compiler.rebuilt == []
+
+    # The network stack got redeployed
+    App.OUTPUT_RESOLVER = resolver('vpc-2')
+    tmpl = compiler.compile(App({}))
+    assert compiler.rebuilt == ['r_secgroup']
+    assert tmpl['Resources']['SecurityGroup']['Properties']['VpcId'] == \
+        'vpc-2'
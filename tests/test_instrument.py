@@ -0,0 +1,102 @@
+import json
+
+import pytest
+from botocore.stub import Stubber
+
+from tropostack import cli, instrument
+from tropostack.aws import ClientProvider
+
+from benchmarks.synthetic import wide_stack
+from examples.s3_bucket.s3_minimal import MyS3BucketStack
+
+
+class Recorder(instrument.Instrument):
+    def __init__(self):
+        self.calls = []
+
+    def on_start(self, kind, name):
+        self.calls.append(('start', kind, name))
+
+    def on_end(self, kind, name, elapsed):
+        assert elapsed >= 0
+        self.calls.append(('end', kind, name))
+
+
+@pytest.fixture
+def recorder():
+    hook = Recorder()
+    instrument.register(hook)
+    yield hook
+    instrument.unregister(hook)
+
+
+def test_compile_spans(recorder):
+    MyS3BucketStack({}).compile()
+    assert recorder.calls == [
+        ('start', 'phase', 'compile'),
+        ('start', 'member', 'r_bucket'),
+        ('end', 'member', 'r_bucket'),
+        ('start', 'member', 'o_bucket_arn'),
+        ('end', 'member', 'o_bucket_arn'),
+        ('end', 'phase', 'compile'),
+    ]
+
+
+def test_plain_property_members(recorder):
+    stack_cls = wide_stack(3, refs=1, outputs=0, decorator=property)
+    stack_cls({}).compile()
+    names = [name for event, kind, name in recorder.calls
+             if event == 'end' and kind == 'member']
+    assert names == ['r_topic_00000', 'r_topic_00001', 'r_topic_00002']
+
+
+def test_api_call_spans(recorder):
+    aws = ClientProvider(aws_access_key_id='test',
+                         aws_secret_access_key='test')
+    cfn = aws.client('cloudformation', 'eu-west-1')
+    with Stubber(cfn) as stub:
+        stub.add_response('describe_stacks', {'Stacks': []})
+        cfn.describe_stacks()
+    assert recorder.calls == [
+        ('start', 'api', 'cloudformation.DescribeStacks'),
+        ('end', 'api', 'cloudformation.DescribeStacks'),
+    ]
+
+
+def test_no_hooks():
+    assert not instrument.active()
+    with instrument.span(instrument.PHASE, 'idle'):
+        pass
+
+
+def test_profiler_self_time():
+    profiler = instrument.Profiler()
+    instrument.register(profiler)
+    try:
+        wide_stack(20, refs=2)({}).compile()
+    finally:
+        instrument.unregister(profiler)
+    totals = {(row[0], row[1]): row for row in profiler.totals()}
+    compile_row = totals['phase', 'compile']
+    members = [row for key, row in totals.items() if key[0] == 'member']
+    assert len(members) == 30
+    assert compile_row[3] == profiler.totals()[0][3]
+    # Self times add up to the total of the outermost span
+    assert sum(row[4] for row in totals.values()) == \
+        pytest.approx(compile_row[3])
+
+
+def test_cli_profile(tmp_path, capsys):
+    trace = str(tmp_path / 'trace.json')
+    sut = cli.InlineConfCLI.for_stack(MyS3BucketStack({}), 'print',
+                                      profile=True, trace_file=trace)
+    sut.run()
+    captured = capsys.readouterr()
+    assert 'MyBucketResource' in captured.out
+    assert 'serialize' in captured.err and 'r_bucket' in captured.err
+    with open(trace) as fhandle:
+        events = json.load(fhandle)['traceEvents']
+    assert {event['name'] for event in events} >= {
+        'print', 'compile', 'serialize', 'r_bucket'}
+    assert all(event['ph'] == 'X' for event in events)
+    assert not instrument.active()
@@ -0,0 +1,168 @@
+import pytest
+
+from tropostack import cli
+from tropostack.budget import TemplateBudget, UnboundedTemplate
+from tropostack.nested import NestedSplit, exchange_name, references, rewrite
+from tropostack.testing import FakeProvider
+
+from benchmarks.synthetic import wide_stack
+from examples.s3_bucket.s3_minimal import MyS3BucketStack
+
+
+def test_references_and_rewrite():
+    value = {'A': [{'Ref': 'X'}, {'Fn::GetAtt': ['Y', 'Arn']},
+                   {'Fn::GetAtt': 'Z.Endpoint.Address'},
+                   {'Fn::Sub': ['${X}-${Y.Arn}-${!Lit}-${v}',
+                                {'v': {'Ref': 'W'}}]}]}
+    assert sorted(references(value), key=str) == [
+        ('W', None), ('X', None), ('X', None), ('Y', 'Arn'), ('Y', 'Arn'),
+        ('Z', 'Endpoint.Address')]
+
+    def replace(ref):
+        if ref[0] == 'W':
+            return None
+        name = ref[0] + (ref[1] or '')
+        return {'Ref': name}, name
+    assert rewrite(value, replace) == {'A': [
+        {'Ref': 'X'}, {'Ref': 'YArn'}, {'Ref': 'ZEndpoint.Address'},
+        {'Fn::Sub': ['${X}-${YArn}-${!Lit}-${v}', {'v': {'Ref': 'W'}}]}]}
+
+
+def test_unbounded_template_and_budget():
+    stack_cls = wide_stack(520, refs=1, outputs=5)
+    with pytest.raises(ValueError):
+        stack_cls({}).compile()
+    budget = TemplateBudget(stack_cls({}).compile(UnboundedTemplate()))
+    assert len(budget.resource_bytes) == 520
+    assert budget.over_limits() == ['Resources: 520 over the limit of 500']
+    assert budget.largest(1)[0][1] == max(budget.resource_bytes.values())
+    assert 'Topic00519' in budget.report(top=600)
+
+
+def _inline(split, name):
+    """Resources of child `name` with its parameters replaced back"""
+    imports, _ = split.links[name]
+
+    def replace(ref):
+        if ref[1] is None and ref[0] in imports:
+            owner = split.children[imports[ref[0]]]
+            return owner['Outputs'][ref[0]]['Value'], None
+        return None
+    return {title: rewrite(rsc, replace)
+            for title, rsc in split.children[name]['Resources'].items()}
+
+
+def test_split_preserves_resources():
+    template = wide_stack(450, refs=3, outputs=10)({}).compile(
+        UnboundedTemplate()).to_dict()
+    split = NestedSplit(template, max_resources=100)
+    assert list(split.partitions) == ['Part1', 'Part2', 'Part3', 'Part4',
+                                      'Part5']
+    rebuilt = {}
+    for name in split.children:
+        assert len(split.children[name]['Resources']) <= 100
+        rebuilt.update(_inline(split, name))
+    assert rebuilt == template['Resources']
+
+    parent = split.parent({name: 'https://bucket/%s' % name
+                           for name in split.children})
+    names = [exchange_name('Topic%05d' % idx, None) for idx in (97, 98, 99)]
+    assert parent['Resources']['Part2']['Properties']['Parameters'] == {
+        name: {'Fn::GetAtt': ['Part1', 'Outputs.' + name]} for name in names}
+    name = exchange_name('Topic00045', None)
+    assert parent['Outputs']['Topic00045Arn']['Value'] == \
+        {'Fn::GetAtt': ['Part1', 'Outputs.' + name]}
+    assert name in split.children['Part1']['Outputs']
+
+
+def test_exchange_names_are_distinct():
+    assert exchange_name('Foo', 'Bar.Baz') != exchange_name('FooBar', 'Baz')
+    assert exchange_name('Foo', None) != exchange_name('Foo', 'Ref')
+    assert exchange_name('Foo', 'Bar.Baz').startswith('FooBarBaz')
+
+
+def test_split_child_limits():
+    # Every resource of the second child references one of the first
+    resources = {'A%03d' % idx: {'Type': 'AWS::SNS::Topic'}
+                 for idx in range(201)}
+    resources.update(('B%03d' % idx, {
+        'Type': 'AWS::SNS::Topic',
+        'Properties': {'DisplayName': {'Ref': 'A%03d' % idx}}})
+        for idx in range(201))
+    with pytest.raises(ValueError) as err:
+        NestedSplit({'Resources': resources}, max_resources=201)
+    assert str(err.value) == \
+        'Maximum number of outputs 200 reached in nested stack Part1'
+
+
+def test_split_depends_on_moves_to_parent():
+    template = {'Resources': {
+        'A': {'Type': 'AWS::SNS::Topic'},
+        'B': {'Type': 'AWS::SNS::Topic', 'DependsOn': ['A', 'C']},
+        'C': {'Type': 'AWS::SNS::Topic'},
+    }}
+    split = NestedSplit(template, max_resources=2)
+    # Dependencies come first, declaration order otherwise
+    assert split.partitions == {'Part1': ['A', 'C'], 'Part2': ['B']}
+    assert 'DependsOn' not in split.children['Part2']['Resources']['B']
+    parent = split.parent({'Part1': 'u1', 'Part2': 'u2'})
+    assert parent['Resources']['Part2']['DependsOn'] == ['Part1']
+    assert 'DependsOn' not in parent['Resources']['Part1']
+
+
+class FakeTransport():
+    bucket = 'templates'
+
+    def __init__(self):
+        self.uploads = []
+
+    def upload(self, body):
+        self.uploads.append(body)
+        return 'https://templates/%d.json' % len(self.uploads)
+
+
+def test_cli_splits_whatever_the_size(capsys):
+    sut = cli.InlineConfCLI.for_stack(MyS3BucketStack({}), split_nested=True)
+    transport = FakeTransport()
+    assert 'AWS::CloudFormation::Stack' in sut._split_nested(
+        transport, sut.template_body())
+    assert len(transport.uploads) == 1
+
+    class Split(MyS3BucketStack):
+        SPLIT_NESTED = True
+    assert cli.InlineConfCLI.for_stack(Split({})).split_nested
+    transport.uploads = []
+
+    stack_cls = wide_stack(520, refs=1, outputs=5)
+    sut = cli.InlineConfCLI.for_stack(stack_cls({}), split_nested=True)
+    parent = sut._split_nested(transport, sut.template_body())
+    assert len(transport.uploads) == 3
+    assert 'AWS::CloudFormation::Stack' in parent
+    assert 'split into 3 nested stacks' in capsys.readouterr().out
+
+
+def test_cmd_budget(capsys):
+    stack_cls = wide_stack(520, refs=1, outputs=5)
+    cli.InlineConfCLI.for_stack(stack_cls({}), 'budget',
+                                split_nested=True).run()
+    out = capsys.readouterr().out
+    assert 'Resources: 520 over the limit of 500' in out
+    assert 'Part3' in out
+
+
+def test_cli_update_noop_of_nested_stacks(monkeypatch):
+    monkeypatch.setattr(cli.InlineConfCLI, 'POLL_MIN_SEC', 0)
+    aws = FakeProvider()
+    stack = wide_stack(520, refs=1, outputs=5)({})
+
+    def run(command):
+        sut = cli.InlineConfCLI.for_stack(stack, command, split_nested=True,
+                                          template_bucket='templates')
+        sut.aws = aws
+        sut.echo = lambda msg: None
+        sut.run()
+    run('create')
+    run('apply')
+    calls = aws.calls()
+    assert calls['get_template'] == 1
+    assert 'create_change_set' not in calls
@@ -0,0 +1,169 @@
+import threading
+
+import pytest
+from troposphere import Output, Export, ImportValue, Sub, Ref
+from troposphere import sns
+
+from tropostack.base import InlineConfStack, EnvStack, resource, output
+from tropostack.cli import InlineConfCLI
+from tropostack.exceptions import OrchestrationError
+from tropostack.orchestrator import Orchestrator, OK, FAILED, SKIPPED
+from tropostack.orchestrator import resolve_name
+
+
+class Network(EnvStack):
+    BASE_NAME = 'network'
+
+    @resource
+    def r_topic(self):
+        return sns.Topic('Topic')
+
+    @output
+    def o_topic(self):
+        return Output('TopicArn', Value=Ref(self.r_topic),
+                      Export=Export(Sub('${AWS::StackName}-TopicArn')))
+
+
+class App(EnvStack):
+    BASE_NAME = 'app'
+
+    @resource
+    def r_topic(self):
+        return sns.Topic(
+            'Topic',
+            DisplayName=ImportValue('network-%s-TopicArn' % self.env))
+
+    @output
+    def o_topic(self):
+        return Output('TopicArn', Value=Ref(self.r_topic),
+                      Export=Export(Sub('${AWS::StackName}-TopicArn')))
+
+
+class Frontend(EnvStack):
+    BASE_NAME = 'frontend'
+
+    @resource
+    def r_topic(self):
+        return sns.Topic(
+            'Topic',
+            DisplayName=ImportValue(Sub('app-${Env}-TopicArn',
+                                        Env=self.env)))
+
+
+class Standalone(InlineConfStack):
+    BASE_NAME = 'standalone'
+    CONF = {'region': 'eu-west-1'}
+
+    @resource
+    def r_topic(self):
+        return sns.Topic('Topic', DisplayName=ImportValue('external-export'))
+
+
+CONF = {'region': 'eu-west-1', 'env': 'dev'}
+STACKS = [Frontend, Standalone, App, Network]
+
+
+class RecordingCLI(InlineConfCLI):
+    calls = []
+    failing = set()
+    _lock = threading.Lock()
+
+    def cmd_apply(self):
+        with self._lock:
+            self.calls.append(self.stackname)
+        self.echo('applying')
+        if self.stackname in self.failing:
+            raise RuntimeError('boom')
+
+    cmd_delete = cmd_apply
+
+
+def test_resolve_name():
+    assert resolve_name('plain', 'stk', 'eu') == 'plain'
+    assert resolve_name({'Fn::Sub': '${AWS::StackName}-X'},
+                        'stk', 'eu') == 'stk-X'
+    assert resolve_name({'Fn::Join': ['-', [{'Ref': 'AWS::Region'}, 'X']]},
+                        'stk', 'eu') == 'eu-X'
+    assert resolve_name({'Fn::GetAtt': ['A', 'B']}, 'stk', 'eu') is None
+
+
+def test_dependencies_and_waves():
+    orch = Orchestrator(STACKS, CONF, cli_cls=RecordingCLI)
+    assert orch.deps == {
+        'network-dev': set(),
+        'app-dev': {'network-dev'},
+        'frontend-dev': {'app-dev'},
+        'standalone': set(),
+    }
+    assert orch.waves() == [
+        ['network-dev', 'standalone'], ['app-dev'], ['frontend-dev']]
+
+
+def test_run_in_order(capsys):
+    RecordingCLI.calls = []
+    RecordingCLI.failing = set()
+    orch = Orchestrator(STACKS, CONF, cli_cls=RecordingCLI, max_workers=2)
+    results = orch.run()
+    assert set(results.values()) == {OK}
+    assert RecordingCLI.calls.index('network-dev') < \
+        RecordingCLI.calls.index('app-dev') < \
+        RecordingCLI.calls.index('frontend-dev')
+    assert '[app-dev] applying' in capsys.readouterr().out
+
+
+def test_run_fails_per_branch():
+    RecordingCLI.calls = []
+    RecordingCLI.failing = {'network-dev'}
+    orch = Orchestrator(STACKS, CONF, cli_cls=RecordingCLI)
+    results = orch.run()
+    assert results == {
+        'network-dev': FAILED,
+        'standalone': OK,
+        'app-dev': SKIPPED,
+        'frontend-dev': SKIPPED,
+    }
+    assert sorted(RecordingCLI.calls) == ['network-dev', 'standalone']
+
+
+def test_circular_dependencies():
+    class Loop(EnvStack):
+        BASE_NAME = 'network'
+
+        @output
+        def o_topic(self):
+            return Output('TopicArn', Value=ImportValue('app-dev-TopicArn'),
+                          Export=Export(Sub('${AWS::StackName}-TopicArn')))
+
+    orch = Orchestrator([Loop, App], CONF, cli_cls=RecordingCLI)
+    with pytest.raises(OrchestrationError):
+        orch.waves()
+
+
+def test_stacks_share_the_clients():
+    orch = Orchestrator(STACKS, CONF, cli_cls=RecordingCLI)
+    # Lookups while computing the dependencies included
+    assert all(stack.aws is orch.aws for stack in orch.stacks.values())
+
+
+def test_stack_confs_are_writable():
+    orch = Orchestrator(STACKS, CONF, cli_cls=RecordingCLI)
+    orch.stacks['app-dev'].conf['env'] = 'qa'
+    assert orch.stacks['app-dev'].conf['env'] == 'qa'
+    assert orch.stacks['network-dev'].conf['env'] == 'dev'
+
+
+def test_delete_in_reverse_order(capsys):
+    RecordingCLI.calls = []
+    RecordingCLI.failing = {'app-dev'}
+    orch = Orchestrator(STACKS, CONF, cli_cls=RecordingCLI)
+    assert orch.waves(reverse=True) == [
+        ['frontend-dev'], ['app-dev'], ['network-dev', 'standalone']]
+    results = orch.run('delete')
+    assert results == {
+        'frontend-dev': OK,
+        'app-dev': FAILED,
+        'network-dev': SKIPPED,
+        'standalone': OK,
+    }
+    assert RecordingCLI.calls[:2] == ['frontend-dev', 'app-dev']
+    assert 'Skipped, as dependents failed: app-dev' in capsys.readouterr().out
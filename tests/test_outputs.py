@@ -0,0 +1,137 @@
+import concurrent.futures
+import json
+import threading
+
+import pytest
+from troposphere import ec2
+
+from tropostack.base import InlineConfStack, resource
+from tropostack.exceptions import OutputLookupError
+from tropostack.outputs import OutputResolver, StubOutputBackend
+from tropostack.testing import FakeProvider
+
+TEMPLATE = json.dumps({'Resources': {}, 'Outputs': {'VpcId': {'Value': 'x'}}})
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv('TROPOSTACK_CACHE_DIR', str(tmp_path / 'cache'))
+
+
+@pytest.fixture
+def aws():
+    provider = FakeProvider(region='eu-west-1')
+    cfn = provider.client('cloudformation')
+    for idx in range(30):
+        cfn.create_stack(StackName='network-%02d' % idx,
+                         TemplateBody=TEMPLATE)
+    cfn.calls.clear()
+    return provider
+
+
+def test_memoized_per_stack(aws):
+    resolver = OutputResolver()
+    for _ in range(3):
+        assert resolver.resolve('eu-west-1', 'network-01', 'VpcId',
+                                aws=aws) == 'network-01-VpcId'
+    assert aws.calls() == {'describe_stacks': 1}
+    with pytest.raises(OutputLookupError):
+        resolver.resolve('eu-west-1', 'network-01', 'SubnetId', aws=aws)
+    with pytest.raises(OutputLookupError):
+        resolver.resolve('eu-west-1', 'missing', 'VpcId', aws=aws)
+
+
+def test_large_batches_list_all_stacks(aws):
+    resolver = OutputResolver()
+    names = ['network-%02d' % idx for idx in range(25)]
+    resolver.prefetch('eu-west-1', names, aws=aws)
+    assert resolver.resolve('eu-west-1', 'network-24', 'VpcId') == \
+        'network-24-VpcId'
+    # A single page of the whole region
+    assert aws.calls() == {'describe_stacks': 1}
+
+
+def test_disk_cache_and_offline(aws, tmp_path):
+    cache_path = str(tmp_path / 'outputs.json')
+    OutputResolver(cache_path=cache_path, ttl=60).resolve(
+        'eu-west-1', 'network-01', 'VpcId', aws=aws)
+    offline = OutputResolver(cache_path=cache_path, ttl=60, offline=True)
+    assert offline.resolve('eu-west-1', 'network-01', 'VpcId') == \
+        'network-01-VpcId'
+    assert aws.calls() == {'describe_stacks': 1}
+    with pytest.raises(OutputLookupError):
+        offline.resolve('eu-west-1', 'network-02', 'VpcId')
+    # Without a TTL, online lookups always go to the API, but the results
+    # remain available offline
+    OutputResolver(cache_path=cache_path, ttl=0).resolve(
+        'eu-west-1', 'network-01', 'VpcId', aws=aws)
+    assert aws.calls() == {'describe_stacks': 2}
+    assert OutputResolver(cache_path=cache_path, ttl=0, offline=True).resolve(
+        'eu-west-1', 'network-01', 'VpcId') == 'network-01-VpcId'
+
+
+def test_default_resolver_online_then_offline(aws):
+    OutputResolver().resolve('eu-west-1', 'network-01', 'VpcId', aws=aws)
+    offline = OutputResolver(offline=True)
+    assert offline.resolve('eu-west-1', 'network-01', 'VpcId') == \
+        'network-01-VpcId'
+    assert aws.calls() == {'describe_stacks': 1}
+
+
+def test_lookups_in_parallel(tmp_path):
+    started = threading.Barrier(2, timeout=5)
+
+    class SlowBackend(StubOutputBackend):
+        cacheable = True
+
+        def describe(self, aws, region, stacknames):
+            # Both regions are being fetched at once
+            started.wait()
+            return {name: {'VpcId': region} for name in stacknames}
+
+    resolver = OutputResolver(SlowBackend(),
+                              cache_path=str(tmp_path / 'outputs.json'))
+    with concurrent.futures.ThreadPoolExecutor(2) as pool:
+        values = list(pool.map(
+            lambda region: resolver.resolve(region, 'network', 'VpcId'),
+            ['eu-west-1', 'us-east-1']))
+    assert values == ['eu-west-1', 'us-east-1']
+
+
+class AppStack(InlineConfStack):
+    BASE_NAME = 'app'
+    OUTPUT_STACK_KEYS = ('network_stack',)
+    CONF = {'region': 'pytest', 'network_stack': 'network-01'}
+
+    @resource
+    def r_secgroup(self):
+        return ec2.SecurityGroup(
+            'SecurityGroup', GroupDescription='App',
+            VpcId=self.stack_output(self.conf['network_stack'], 'VpcId'))
+
+
+def test_stack_prefetches_on_compile(aws):
+    resolver = OutputResolver()
+
+    class Stack(AppStack):
+        OUTPUT_RESOLVER = resolver
+
+    stack = Stack({'region': 'eu-west-1'})
+    stack.aws = aws
+    stack.compile()
+    stack.compile()
+    assert aws.calls() == {'describe_stacks': 1}
+    assert stack.r_secgroup.VpcId == 'network-01-VpcId'
+
+
+def test_pytest_region_stub():
+    stack = AppStack({})
+    assert stack.r_secgroup.VpcId == 'output-notfound'
+    resolver = OutputResolver()
+    resolver.register_backend('pytest', StubOutputBackend(
+        {'network-01': {'VpcId': 'vpc-1'}}))
+
+    class Stack(AppStack):
+        OUTPUT_RESOLVER = resolver
+
+    assert Stack({}).r_secgroup.VpcId == 'vpc-1'
@@ -2,7 +2,7 @@ from io import StringIO
 
 import pytest
 
-from tropostack.conf_loaders import partitioned_yaml_loader
+from tropostack.conf_loaders import partitioned_yaml_loader, PartitionedConfig
 from tropostack.exceptions import ConfigLoadError
 
 VALID_CONFIG = '''
@@ -45,3 +45,27 @@ def test_partitioned_yaml_loader_validation():
         partitioned_yaml_loader(StringIO(IVALID_CONFIG_ROOT), 'stack-foo')
     with pytest.raises(ConfigLoadError):
         partitioned_yaml_loader(StringIO(INVALID_CONFIG_STACK), 'stack-foo')
+
+
+def test_partitioned_config_views():
+    config = PartitionedConfig.load(StringIO(VALID_CONFIG))
+    view = config.stack_conf('stack-foo')
+    assert dict(view) == {'env': 'dev', 'region': 'eu', 'k1': 'v1', 'k2': 'v2'}
+    assert dict(config.stack_conf('missing')) == {'env': 'dev', 'region': 'eu'}
+    # Views are not copies of the parsed document
+    config.full_conf['stack-foo']['k1'] = 'changed'
+    assert view['k1'] == 'changed'
+    with pytest.raises(TypeError):
+        view['k1'] = 'other'
+    assert partitioned_yaml_loader(config, 'stack-bar') == \
+        {'env': 'dev', 'region': 'eu', 'var': 'bar'}
+
+
+def test_partitioned_config_validation():
+    with pytest.raises(ConfigLoadError):
+        PartitionedConfig.load(StringIO(IVALID_CONFIG_NOYAML))
+    with pytest.raises(ConfigLoadError):
+        PartitionedConfig.load(StringIO(IVALID_CONFIG_ROOT))
+    config = PartitionedConfig.load(StringIO(INVALID_CONFIG_STACK))
+    with pytest.raises(ConfigLoadError):
+        config.stack_conf('stack-foo')
@@ -0,0 +1,151 @@
+import time
+
+import botocore.exceptions
+import pytest
+from botocore.awsrequest import AWSResponse
+from botocore.retries import standard
+
+from tropostack import cli, ratelimit
+from tropostack.aws import ClientProvider
+from tropostack.testing import FakeProvider
+
+from examples.s3_bucket.s3_minimal import MyS3BucketStack
+
+THROTTLED = (b'<ErrorResponse><Error><Type>Sender</Type><Code>Throttling'
+             b'</Code><Message>Rate exceeded</Message></Error>'
+             b'<RequestId>1</RequestId></ErrorResponse>')
+NO_STACKS = (b'<DescribeStacksResponse><DescribeStacksResult><Stacks/>'
+             b'</DescribeStacksResult></DescribeStacksResponse>')
+
+
+class RawBody():
+    def __init__(self, body):
+        self.body = body
+
+    def stream(self, **kwargs):
+        yield self.body
+
+
+def http_responses(client, responses):
+    """Answer the HTTP requests of `client` with `responses` in turn"""
+    def send(request, **kwargs):
+        status, body = responses.pop(0)
+        return AWSResponse(request.url, status, {}, RawBody(body))
+    client.meta.events.register('before-send.*.*', send)
+
+
+def test_token_bucket_rate():
+    bucket = ratelimit.TokenBucket(rate=50, burst=1)
+    started = time.time()
+    waited = sum(bucket.acquire() for _ in range(6))
+    assert time.time() - started >= 0.09
+    assert waited > 0
+
+
+def test_token_bucket_adapts():
+    bucket = ratelimit.TokenBucket(rate=8, min_rate=1, increase=1)
+    bucket.throttled()
+    bucket.throttled()
+    assert bucket.rate == 2
+    bucket.throttled()
+    bucket.throttled()
+    assert bucket.rate == 1
+    for _ in range(20):
+        bucket.succeeded()
+    assert bucket.rate == 8
+
+
+def test_shared_bucket(tmp_path):
+    path = str(tmp_path / 'bucket.json')
+    first = ratelimit.SharedTokenBucket(path, rate=1, burst=2)
+    second = ratelimit.SharedTokenBucket(path, rate=1, burst=2)
+    assert first.acquire() == 0
+    assert second.acquire() == 0
+    # The burst both drew from is used up
+    first.throttled()
+    assert second.rate == 0.5
+
+
+def test_limiter_counts_throttling(monkeypatch):
+    # Retry right away
+    monkeypatch.setattr(standard.ExponentialBackoff, 'delay_amount',
+                        lambda self, context: 0)
+    limiter = ratelimit.RateLimiter(rate=100)
+    aws = ClientProvider(aws_access_key_id='test',
+                         aws_secret_access_key='test', max_attempts=1,
+                         rate_limiter=limiter)
+    cfn = aws.client('cloudformation', 'eu-west-1')
+    http_responses(cfn, [(400, THROTTLED), (200, NO_STACKS),
+                         (400, THROTTLED), (400, THROTTLED)])
+    # botocore retries the throttled attempt, which waits for a token too
+    assert cfn.describe_stacks()['Stacks'] == []
+    assert limiter.stats()[0][:4] == ['cloudformation', 'eu-west-1', 2, 1]
+    with pytest.raises(botocore.exceptions.ClientError) as err:
+        cfn.describe_stacks()
+    assert ratelimit.is_throttling(err.value)
+    assert limiter.stats()[0][2:4] == [4, 3]
+    assert limiter.bucket('cloudformation', 'eu-west-1').rate < 100
+
+
+def test_assumed_roles_get_own_buckets():
+    limiter = ratelimit.RateLimiter(rate=3)
+    assert limiter.scoped('123456789012').scope == '123456789012'
+    assert limiter.scoped('123456789012').rate == 3
+    assert limiter.scoped('123456789012') is limiter.scoped('123456789012')
+
+
+def test_default_scope_follows_credentials(monkeypatch):
+    for name in ('AWS_ACCESS_KEY_ID', 'AWS_PROFILE', 'AWS_DEFAULT_PROFILE'):
+        monkeypatch.delenv(name, raising=False)
+    assert ratelimit.RateLimiter().scope == 'default'
+    monkeypatch.setenv('AWS_PROFILE', 'staging')
+    assert ratelimit.RateLimiter().scope == 'staging'
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'AKIAEXAMPLE')
+    scope = ratelimit.RateLimiter().scope
+    assert scope.startswith('key-') and 'AKIAEXAMPLE' not in scope
+    assert ratelimit.RateLimiter().scope == scope
+
+
+def test_stats_include_scoped_limiters():
+    limiter = ratelimit.RateLimiter(rate=100)
+    aws = ClientProvider(aws_access_key_id='test',
+                         aws_secret_access_key='test', rate_limiter=limiter)
+    other = ClientProvider(aws_access_key_id='test',
+                           aws_secret_access_key='test',
+                           rate_limiter=limiter.scoped('123456789012'))
+    for provider in (aws, other):
+        cfn = provider.client('cloudformation', 'eu-west-1')
+        http_responses(cfn, [(200, NO_STACKS)])
+        cfn.describe_stacks()
+    assert limiter.stats()[0][:4] == ['cloudformation', 'eu-west-1', 2, 0]
+
+
+def test_status_polling_survives_throttling(monkeypatch):
+    monkeypatch.setattr(cli.InlineConfCLI, 'POLL_MIN_SEC', 0)
+    monkeypatch.setattr(cli.time, 'sleep', lambda sec: None)
+    aws = FakeProvider(region='eu-west-1', throttle_every=4)
+    sut = cli.InlineConfCLI.for_stack(MyS3BucketStack({}))
+    sut.aws = aws
+    cfn = aws.client('cloudformation', 'eu-west-1')
+    cfn.create_stack(StackName=sut.stackname,
+                     TemplateBody=sut.template_body())
+    sut.print_status_while(cfn, 'CREATE_IN_PROGRESS')
+    assert cfn.throttled > 0
+    assert cfn.stacks[sut.stackname].status == 'CREATE_COMPLETE'
+
+
+def test_stack_clients_get_limited(capsys):
+    stack = MyS3BucketStack({})
+    cli.InlineConfCLI.for_stack(stack, 'print', max_api_rate=5).run()
+    assert stack.aws.rate_limiter is not None
+    # Clients the stack created before the CLI took over are covered too
+    stack = MyS3BucketStack({})
+    stack.aws = ClientProvider(aws_access_key_id='test',
+                               aws_secret_access_key='test')
+    cfn = stack.aws.client('cloudformation', 'eu-west-1')
+    sut = cli.InlineConfCLI.for_stack(stack, 'print', max_api_rate=5)
+    assert sut.aws is stack.aws
+    http_responses(cfn, [(200, NO_STACKS)])
+    cfn.describe_stacks()
+    assert sut.aws.rate_limiter.stats()[0][:3] == [
+        'cloudformation', 'eu-west-1', 1]
@@ -0,0 +1,84 @@
+import os
+
+import pytest
+from troposphere import sns
+
+from tropostack import __main__ as main_mod
+from tropostack.base import EnvStack, resource
+from tropostack.discovery import find_stacks
+from tropostack.exceptions import InvalidStackError
+from tropostack.render import Renderer
+from tropostack.serialize import to_yaml
+
+from examples.ec2.ec2_static_ip import EC2Stack
+from examples.s3_bucket.s3_minimal import MyS3BucketStack
+from examples.s3_bucket.s3_policy import S3BucketStack
+
+EXAMPLES = [EC2Stack, MyS3BucketStack, S3BucketStack]
+
+
+class Topics(EnvStack):
+    BASE_NAME = 'topics'
+
+    @resource
+    def r_topic(self):
+        return sns.Topic('Topic', DisplayName=self.conf['display_name'])
+
+
+def test_render_in_process_pool(tmp_path):
+    renderer = Renderer(EXAMPLES, outdir=str(tmp_path), workers=2)
+    results = renderer.run()
+    assert sorted(results) == sorted(cls({}).stackname for cls in EXAMPLES)
+    for cls in EXAMPLES:
+        stack = cls({})
+        region, path = results[stack.stackname]
+        assert region == stack.region
+        with open(path) as fhandle:
+            assert fhandle.read() == to_yaml(stack.compile())
+    assert set(renderer.timings[stack.stackname]) == {
+        'import', 'compile', 'serialize', 'write'}
+    assert 'COMPILE' in renderer.report()
+
+
+def test_unchanged_templates_are_not_rewritten(tmp_path):
+    results = Renderer(EXAMPLES, outdir=str(tmp_path), fmt='json',
+                       workers=1).run()
+    mtimes = {}
+    for _, path in results.values():
+        os.utime(path, (0, 0))
+        mtimes[path] = os.path.getmtime(path)
+    Renderer(EXAMPLES, outdir=str(tmp_path), fmt='json', workers=2).run()
+    assert {path: os.path.getmtime(path) for path in mtimes} == mtimes
+    assert sorted(os.listdir(str(tmp_path))) == sorted(
+        os.path.basename(path) for path in mtimes)
+
+
+def test_render_partitioned_conf(tmp_path):
+    conf = {'env': 'dev', 'region': 'eu-west-1',
+            'topics': {'display_name': 'hello'}}
+    results = Renderer([Topics], conf, outdir=str(tmp_path)).run()
+    _, path = results['topics-dev']
+    with open(path) as fhandle:
+        assert 'DisplayName: hello' in fhandle.read()
+
+
+def test_duplicate_stack_names(tmp_path):
+    with pytest.raises(InvalidStackError):
+        Renderer([MyS3BucketStack, MyS3BucketStack],
+                 outdir=str(tmp_path)).run()
+
+
+def test_find_stacks_in_package():
+    names = [stack.BASE_NAME for stack in find_stacks('examples')]
+    # examples.ec2 is a regular package, the others namespace packages
+    assert names == ['ec2-instance', 'example-dynamodb', 'example-s3-stack',
+                     'my-s3-bucket-stack', 's3-iam-stack']
+
+
+def test_render_command(tmp_path, capsys):
+    ret = main_mod.main(['render', 'examples.s3_bucket.s3_minimal',
+                         'examples.ec2', '-o', str(tmp_path)])
+    assert ret == 0
+    assert sorted(os.listdir(str(tmp_path))) == [
+        'ec2-instance.yaml', 'my-s3-bucket-stack.yaml']
+    assert 'Rendered 2 stack(s)' in capsys.readouterr().out
@@ -0,0 +1,67 @@
+import json
+
+import pytest
+from troposphere import Base64, GetAtt, Join, Ref, Sub, Template, Output
+from troposphere import sns
+
+from tropostack import serialize
+from tropostack.diff import load_template
+
+from benchmarks.synthetic import wide_stack
+from examples.ec2.ec2_static_ip import EC2Stack
+from examples.s3_bucket.s3_minimal import MyS3BucketStack
+from examples.s3_bucket.s3_policy import S3BucketStack
+
+
+@pytest.mark.parametrize('stack_cls', [EC2Stack, MyS3BucketStack,
+                                       S3BucketStack, wide_stack(50)])
+def test_same_template_as_troposphere(stack_cls):
+    template = stack_cls({}).compile()
+    expected = load_template(template.to_json())
+    assert load_template(serialize.to_yaml(template)) == expected
+    assert json.loads(serialize.to_json(template)) == expected
+    assert json.loads(serialize.to_json(template, compact=False)) == expected
+
+
+def test_short_form_intrinsics():
+    template = Template()
+    topic = template.add_resource(sns.Topic(
+        'Topic', DisplayName=Base64(Sub('${AWS::Region}'))))
+    template.add_output(Output('Arn', Value=GetAtt(topic, 'TopicArn')))
+    template.add_output(Output('Name', Value=Join('-', [Ref(topic), 'x'])))
+    body = serialize.to_yaml(template)
+    assert 'Value: !GetAtt Topic.TopicArn' in body
+    assert '!Join' in body and '!Ref Topic' in body
+    assert load_template(body) == template.to_dict()
+
+
+def test_output_is_stable_and_alias_free():
+    shared = ['10.0.0.0/8']
+    data = {'Resources': {'B': {'Type': 'X', 'Properties': {'Cidrs': shared}},
+                          'A': {'Type': 'X', 'Properties': {'Cidrs': shared}}}}
+    body = serialize.to_yaml(data)
+    assert '&' not in body and '*' not in body
+    assert body.index('A:') < body.index('B:')
+    assert serialize.to_yaml(dict(reversed(list(data.items())))) == body
+
+
+def test_multiline_and_numeric_strings():
+    data = {'Script': '#!/bin/bash\necho hi\n', 'Account': '0123456789'}
+    body = serialize.to_yaml(data)
+    assert 'Script: |' in body
+    assert load_template(body) == data
+
+
+def test_dumps():
+    data = {'Resources': {}}
+    assert serialize.dumps(data, 'json') == '{"Resources":{}}'
+    assert serialize.dumps(data) == 'Resources: {}\n'
+    with pytest.raises(ValueError):
+        serialize.dumps(data, 'xml')
+
+
+def test_json_without_orjson(monkeypatch):
+    template = MyS3BucketStack({}).compile()
+    fast = serialize.to_json(template)
+    monkeypatch.setattr(serialize, 'orjson', None)
+    assert serialize.to_json(template) == fast
@@ -0,0 +1,24 @@
+import os
+
+from benchmarks.bench_startup import run_print, parse_importtime
+
+# Wall-clock budget of the print command, interpreter startup included
+PRINT_BUDGET_SEC = float(os.environ.get('TROPOSTACK_PRINT_BUDGET', '2.0'))
+
+
+def test_print_does_not_load_aws_stack():
+    _, modules, _ = run_print()
+    assert 'tropostack.cli' in modules
+    assert not {'boto3', 'botocore', 'tabulate'} & modules
+
+
+def test_print_startup_budget():
+    elapsed = min(run_print()[0] for _ in range(3))
+    assert elapsed < PRINT_BUDGET_SEC
+
+
+def test_importtime_report():
+    _, _, report = run_print(importtime=True)
+    top = dict((name, usec) for usec, name in parse_importtime(report))
+    assert 'tropostack.cli' in top
+    assert 'boto3' not in top
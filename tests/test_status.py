@@ -0,0 +1,84 @@
+import csv
+import io
+import json
+
+import pytest
+
+from tropostack import __main__ as main
+from tropostack import status
+from tropostack.testing import FakeProvider
+
+TEMPLATE = json.dumps({'Resources': {}, 'Outputs': {
+    'Arn': {'Value': 'x'}, 'Name': {'Value': 'y'}}})
+
+
+@pytest.fixture
+def aws():
+    provider = FakeProvider(page_size=100)
+    cfn = provider.client('cloudformation')
+    for idx in range(250):
+        cfn.create_stack(StackName='app-%03d-%s' % (
+            idx, 'prod' if idx % 2 else 'dev'), TemplateBody=TEMPLATE)
+    cfn.create_stack(StackName='other', TemplateBody=TEMPLATE)
+    cfn.calls.clear()
+    return provider
+
+
+def test_paginated_outputs(aws):
+    query = status.StackStatusQuery(aws, patterns=['app-*-prod'],
+                                    outputs=True)
+    stacks = query.fetch()
+    assert len(stacks) == 125
+    assert stacks[0]['StackName'] == 'app-001-prod'
+    assert stacks[0]['Outputs'] == {'Arn': 'app-001-prod-Arn',
+                                    'Name': 'app-001-prod-Name'}
+    assert aws.calls() == {'describe_stacks': 3}
+
+
+def test_status_filter(aws):
+    cfn = aws.client('cloudformation')
+    cfn.stacks['app-000-dev'].status = 'ROLLBACK_COMPLETE'
+    query = status.StackStatusQuery(aws, prefix='app-',
+                                    statuses=['ROLLBACK_COMPLETE'])
+    assert [stack['StackName'] for stack in query.fetch()] == ['app-000-dev']
+    assert aws.calls() == {'list_stacks': 1}
+
+
+def test_ttl_cache(aws, tmp_path, monkeypatch):
+    monkeypatch.setenv('TROPOSTACK_CACHE_DIR', str(tmp_path))
+    first = status.StackStatusQuery(aws, prefix='other', ttl=60).fetch()
+    again = status.StackStatusQuery(aws, prefix='other', ttl=60).fetch()
+    assert again == first
+    assert aws.calls() == {'list_stacks': 3}
+    # A different query is not served from the cache
+    status.StackStatusQuery(aws, prefix='app-', ttl=60).fetch()
+    assert aws.calls() == {'list_stacks': 6}
+
+
+def test_formats(aws):
+    stacks = status.StackStatusQuery(aws, prefix='other',
+                                     outputs=True).fetch()
+    rows = list(csv.reader(io.StringIO(
+        status.format_stacks(stacks, 'csv', outputs=True))))
+    assert rows[0] == ['REGION', 'STACK', 'STATUS', 'UPDATED (UTC)',
+                       'OUTPUT', 'VALUE']
+    assert [row[4:] for row in rows[1:]] == [['Arn', 'other-Arn'],
+                                             ['Name', 'other-Name']]
+    assert json.loads(status.format_stacks(stacks, 'json')) == stacks
+    assert 'CREATE_IN_PROGRESS' in status.format_stacks(stacks)
+    with pytest.raises(ValueError):
+        status.format_stacks(stacks, 'xml')
+
+
+def test_status_command(aws, monkeypatch, capsys):
+    import tropostack.aws
+    monkeypatch.setattr(tropostack.aws, 'ClientProvider', lambda: aws)
+    assert main.main(['status', 'other', '--format', 'json']) == 0
+    stacks = json.loads(capsys.readouterr().out)
+    assert [stack['StackName'] for stack in stacks] == ['other']
+
+
+def test_status_regions_option():
+    args = main.argparser().parse_args(
+        ['status', '--regions', 'eu-west-1, us-east-1,'])
+    assert args.regions == ['eu-west-1', 'us-east-1']
@@ -0,0 +1,135 @@
+import os
+import sys
+import time
+import types
+
+from troposphere import sns
+
+from tropostack.base import InlineConfStack, resource
+from tropostack.cache import (TemplateCache, atomic_write, source_fingerprint,
+                              stack_fingerprint)
+from tropostack.cli import InlineConfCLI
+from tropostack.outputs import OutputResolver, StubOutputBackend
+
+from examples.s3_bucket.s3_minimal import MyS3BucketStack
+
+
+def test_fingerprint_tracks_conf():
+    base = stack_fingerprint(MyS3BucketStack({}))
+    assert base == stack_fingerprint(MyS3BucketStack({}))
+    assert base != stack_fingerprint(MyS3BucketStack({'bucket_name': 'x'}))
+
+
+def test_cache_hit_skips_compile(tmp_path):
+    cache = TemplateCache(path=str(tmp_path))
+    stack = MyS3BucketStack({})
+    renders = []
+
+    def render():
+        renders.append(1)
+        return stack.compile().to_yaml()
+
+    first = cache.template_body(stack, render)
+    second = TemplateCache(path=str(tmp_path)).template_body(stack, render)
+    assert first == second
+    assert len(renders) == 1
+    assert (cache.hits, cache.misses) == (0, 1)
+
+
+def test_cache_eviction(tmp_path):
+    cache = TemplateCache(path=str(tmp_path), max_bytes=10, max_age=60)
+    cache.put('old', 'x' * 6)
+    old = time.time() - 30
+    os.utime(str(tmp_path / 'old'), (old, old))
+    cache.put('new', 'y' * 6)
+    assert os.listdir(str(tmp_path)) == ['new']
+    assert cache.get('new') == 'y' * 6
+    expired = time.time() - 120
+    os.utime(str(tmp_path / 'new'), (expired, expired))
+    assert cache.get('new') is None
+
+
+def test_cli_cache_counters(tmp_path, monkeypatch, capsys):
+    monkeypatch.setenv('TROPOSTACK_CACHE_DIR', str(tmp_path))
+    stack = MyS3BucketStack({})
+    for _ in range(2):
+        cli = InlineConfCLI.for_stack(stack, 'print', cache=True, verbose=True)
+        cli.run()
+    captured = capsys.readouterr()
+    assert captured.out.count('MyBucketResource:') == 2
+    assert '1 hit(s), 0 miss(es)' in captured.err
+
+
+def test_cache_tolerates_concurrent_removal(tmp_path, monkeypatch):
+    cache = TemplateCache(path=str(tmp_path), max_bytes=10, max_age=60)
+    cache.put('old', 'x' * 6)
+    old = time.time() - 30
+    os.utime(str(tmp_path / 'old'), (old, old))
+    remove = os.remove
+
+    def remove_twice(path):
+        # Another process got there first
+        remove(path)
+        remove(path)
+    monkeypatch.setattr(os, 'remove', remove_twice)
+    cache.put('new', 'y' * 6)
+    assert os.listdir(str(tmp_path)) == ['new']
+
+    def gone(path, *args):
+        remove(path)
+        raise FileNotFoundError(path)
+    monkeypatch.setattr(os, 'utime', gone)
+    assert cache.get('new') == 'y' * 6
+
+
+def test_atomic_write_honours_umask(tmp_path, monkeypatch):
+    monkeypatch.setattr('tropostack.cache._UMASK', 0o022)
+    path = str(tmp_path / 'out.json')
+    atomic_write(path, '{}')
+    assert os.stat(path).st_mode & 0o777 == 0o644
+
+
+def test_fingerprint_without_source_file(monkeypatch):
+    module = types.ModuleType('stacks_without_source')
+    monkeypatch.setitem(sys.modules, module.__name__, module)
+    stack_cls = type('Stack', (MyS3BucketStack,),
+                     {'__module__': module.__name__})
+    assert source_fingerprint(stack_cls) == source_fingerprint(stack_cls)
+    other_cls = type('Stack', (MyS3BucketStack,),
+                     {'__module__': module.__name__})
+    assert source_fingerprint(stack_cls) != source_fingerprint(other_cls)
+
+    def no_source(obj):
+        raise OSError('source code not available')
+    monkeypatch.setattr('inspect.getsourcefile', no_source)
+    assert source_fingerprint(MyS3BucketStack) \
+        == source_fingerprint(MyS3BucketStack)
+
+
+class Consumer(InlineConfStack):
+    BASE_NAME = 'consumer'
+    CONF = {'region': 'pytest'}
+
+    @resource
+    def r_topic(self):
+        return sns.Topic('Topic', DisplayName=self.stack_output(
+            'network', 'VpcId'))
+
+
+def test_cache_keyed_by_lookups(tmp_path):
+    def body(vpc_id):
+        stack = Consumer({})
+        stack.OUTPUT_RESOLVER = OutputResolver()
+        stack.OUTPUT_RESOLVER.register_backend('pytest', StubOutputBackend(
+            {'network': {'VpcId': vpc_id}}))
+        cache = TemplateCache(path=str(tmp_path))
+        return cache.template_body(
+            stack, lambda: stack.compile().to_yaml()), cache
+    assert 'vpc-1' in body('vpc-1')[0]
+    # The deployed output changed since
+    text, cache = body('vpc-2')
+    assert 'vpc-2' in text
+    assert cache.misses == 1
+    text, cache = body('vpc-2')
+    assert 'vpc-2' in text
+    assert cache.hits == 1
@@ -0,0 +1,67 @@
+import json
+
+import botocore
+import pytest
+
+from tropostack.transport import TemplateTransport, minify
+
+from benchmarks.synthetic import wide_stack
+
+
+class LocalS3():
+    """Minimal in-memory stand-in for the S3 client"""
+    def __init__(self):
+        self.objects = {}
+        self.puts = 0
+
+    def head_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise botocore.exceptions.ClientError(
+                {'Error': {'Code': '404', 'Message': 'Not Found'}},
+                'HeadObject')
+        return {}
+
+    def put_object(self, Bucket, Key, Body):
+        self.puts += 1
+        self.objects[Bucket, Key] = Body
+
+
+class LocalProvider():
+    def __init__(self):
+        self.s3 = LocalS3()
+
+    def client(self, service, region=None):
+        assert service == 's3'
+        return self.s3
+
+
+def test_small_template_inline():
+    body = wide_stack(5)({}).compile().to_yaml()
+    transport = TemplateTransport(LocalProvider())
+    assert transport.template_args(body) == {'TemplateBody': body}
+
+
+def test_minified_when_it_fits():
+    body = wide_stack(5)({}).compile().to_yaml()
+    compact = minify(body)
+    transport = TemplateTransport(LocalProvider(), inline_limit=len(compact))
+    args = transport.template_args(body)
+    assert json.loads(args['TemplateBody']) == json.loads(compact)
+
+
+def test_large_template_uploaded_once():
+    body = wide_stack(400)({}).compile().to_yaml()
+    aws = LocalProvider()
+    transport = TemplateTransport(aws, bucket='templates', region='eu-west-1')
+    url = transport.template_args(body)['TemplateURL']
+    assert url.startswith('https://templates.s3.eu-west-1.amazonaws.com/')
+    assert transport.template_args(body)['TemplateURL'] == url
+    assert aws.s3.puts == 1
+    key = url.split('amazonaws.com/')[1]
+    assert json.loads(aws.s3.objects['templates', key].decode('utf-8'))
+
+
+def test_large_template_without_bucket():
+    body = wide_stack(400)({}).compile().to_yaml()
+    with pytest.raises(RuntimeError):
+        TemplateTransport(LocalProvider()).template_args(body)
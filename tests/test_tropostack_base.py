@@ -1,4 +1,5 @@
 import pytest
+from troposphere import Output, Ref, sns
 
 from tropostack.exceptions import InvalidStackError
 from tropostack import base
@@ -43,3 +44,77 @@ def test_release_stack_init():
     stack = TReleaseEnvStack(DEF_CFG)
     assert DEF_CFG['env'] in stack.stackname
     assert DEF_CFG['release'] in stack.stackname
+
+
+class TMemoStack(base.InlineConfStack):
+    BASE_NAME = 'memo-stack'
+    CONF = {'region': 'pytestregion', 'topic': 'first'}
+    builds = 0
+
+    @base.resource
+    def r_topic(self):
+        self.__class__.builds += 1
+        return sns.Topic('Topic', DisplayName=self.conf['topic'])
+
+    @base.output
+    def o_topic(self):
+        return Output('TopicArn', Value=Ref(self.r_topic))
+
+
+def test_memoized_members():
+    TMemoStack.builds = 0
+    stack = TMemoStack({})
+    assert stack.r_topic is stack.r_topic
+    stack.compile()
+    # One build for the direct access, one for the fresh compile
+    assert TMemoStack.builds == 2
+    stack.conf = {**stack.conf, 'topic': 'second'}
+    assert stack.r_topic.DisplayName == 'second'
+
+
+class TMemoStackNoOutput(TMemoStack):
+    o_topic = None
+
+    @base.resource
+    def r_another(self):
+        return sns.Topic('Another')
+
+
+def test_member_registry():
+    assert TMemoStack._RESOURCES == ('r_topic',)
+    assert TMemoStack._OUTPUTS == ('o_topic',)
+    assert TMemoStackNoOutput._RESOURCES == ('r_topic', 'r_another')
+    assert TMemoStackNoOutput._OUTPUTS == ()
+    compiled = TMemoStackNoOutput({}).compile()
+    assert list(compiled.resources) == ['Topic', 'Another']
+    assert not compiled.outputs
+
+
+def test_compile_recording():
+    stack = TMemoStack({})
+    _, keys_read = stack.compile_recording()
+    assert keys_read == {'topic'}
+    assert isinstance(stack.conf, dict)
+    stack.region = 'us-east-1'
+    assert stack.conf['region'] == 'us-east-1'
+
+
+def test_region_assignment():
+    class EarlyRegion(TEnvStack):
+        def __init__(self, conf):
+            self.region = 'early-region'
+            super().__init__(conf)
+
+    conf = dict(DEF_CFG)
+    del conf['region']
+    assert EarlyRegion(conf).region == 'early-region'
+    assert EarlyRegion(DEF_CFG).region == DEF_CFG['region']
+
+    view = base.ConfRecorder(DEF_CFG)
+    stack = TEnvStack(view)
+    stack.region = 'other-region'
+    assert stack.region == 'other-region'
+    assert stack.conf['env'] == DEF_CFG['env']
+    # The original view is still the one read through
+    assert view.keys_read >= {'env'}
+    assert DEF_CFG['region'] == 'pytestregion'
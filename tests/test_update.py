@@ -0,0 +1,115 @@
+from datetime import datetime, timezone
+
+import pytest
+from botocore.stub import Stubber, ANY
+
+from tropostack import cli
+from tropostack.aws import ClientProvider
+from tropostack.diff import diff_templates, load_template
+
+from examples.s3_bucket.s3_minimal import MyS3BucketStack as Sut
+
+T0 = datetime(2020, 1, 1, tzinfo=timezone.utc)
+CS_ID = 'arn:aws:cloudformation:eu-west-1:1:changeSet/tropostack/1'
+STACK_ID = 'arn:aws:cloudformation:eu-west-1:1:stack/my-s3-bucket-stack/1'
+
+
+@pytest.fixture
+def aws():
+    return ClientProvider(aws_access_key_id='test',
+                          aws_secret_access_key='test')
+
+
+@pytest.fixture
+def stubbed(aws):
+    with Stubber(aws.client('cloudformation', 'eu-west-1')) as stub:
+        yield stub
+        stub.assert_no_pending_responses()
+
+
+def sut_cli(stack, aws):
+    sut = cli.InlineConfCLI.for_stack(stack)
+    sut.aws = aws
+    return sut
+
+
+def deployed(stack):
+    return {'Stacks': [{
+        'StackName': stack.stackname, 'StackStatus': 'CREATE_COMPLETE',
+        'CreationTime': T0, 'Tags': stack.tags,
+    }]}
+
+
+def test_diff_templates():
+    old = load_template(Sut({}).compile().to_yaml())
+    assert diff_templates(old, load_template(Sut({}).compile().to_json())) == []
+    new = load_template(Sut({'bucket_name': 'other'}).compile().to_yaml())
+    assert diff_templates(old, new) == [
+        ('Modify', 'Resources', 'MyBucketResource')]
+    assert diff_templates(old, {}) == [
+        ('Remove', 'Outputs', 'BucketArn'),
+        ('Remove', 'Resources', 'MyBucketResource')]
+
+
+def test_update_noop_without_api_update(stubbed, aws, capsys):
+    stack = Sut({})
+    stubbed.add_response('describe_stacks', deployed(stack))
+    stubbed.add_response('get_template',
+                         {'TemplateBody': stack.compile().to_yaml()})
+    sut_cli(stack, aws).cmd_update(exc_on_noop=False)
+    assert 'No updates' in capsys.readouterr().out
+
+
+def test_update_noop_raises(stubbed, aws):
+    stack = Sut({})
+    stubbed.add_response('describe_stacks', deployed(stack))
+    stubbed.add_response('get_template',
+                         {'TemplateBody': stack.compile().to_yaml()})
+    with pytest.raises(RuntimeError):
+        sut_cli(stack, aws).cmd_update()
+
+
+def test_update_via_change_set(stubbed, aws, monkeypatch, capsys):
+    waited = []
+    monkeypatch.setattr(cli.InlineConfCLI, 'print_status_while',
+                        lambda self, cfn, status: waited.append(status))
+    monkeypatch.setattr(cli.time, 'sleep', lambda sec: None)
+    stack = Sut({'bucket_name': 'renamed'})
+    stubbed.add_response('describe_stacks', deployed(stack))
+    stubbed.add_response('get_template',
+                         {'TemplateBody': Sut({}).compile().to_yaml()})
+    stubbed.add_response('create_change_set',
+                         {'Id': CS_ID, 'StackId': STACK_ID},
+                         {'StackName': stack.stackname, 'ChangeSetName': ANY,
+                          'ChangeSetType': 'UPDATE', 'TemplateBody': ANY,
+                          'Capabilities': [], 'Tags': stack.tags})
+    stubbed.add_response('describe_change_set',
+                         {'Status': 'CREATE_IN_PROGRESS'},
+                         {'ChangeSetName': CS_ID})
+    stubbed.add_response('describe_change_set', {
+        'Status': 'CREATE_COMPLETE',
+        'Changes': [{'Type': 'Resource', 'ResourceChange': {
+            'Action': 'Modify', 'LogicalResourceId': 'MyBucketResource',
+            'ResourceType': 'AWS::S3::Bucket', 'Replacement': 'True'}}],
+    }, {'ChangeSetName': CS_ID})
+    stubbed.add_response('execute_change_set', {}, {'ChangeSetName': CS_ID})
+    sut_cli(stack, aws).cmd_update()
+    assert waited == ['UPDATE_IN_PROGRESS']
+    out = capsys.readouterr().out
+    assert 'MyBucketResource' in out and 'Modify' in out
+
+
+def test_failed_change_set_deleted(stubbed, aws, monkeypatch):
+    monkeypatch.setattr(cli.time, 'sleep', lambda sec: None)
+    stack = Sut({'bucket_name': 'renamed'})
+    stubbed.add_response('describe_stacks', deployed(stack))
+    stubbed.add_response('get_template',
+                         {'TemplateBody': Sut({}).compile().to_yaml()})
+    stubbed.add_response('create_change_set',
+                         {'Id': CS_ID, 'StackId': STACK_ID})
+    stubbed.add_response('describe_change_set', {
+        'Status': 'FAILED', 'StatusReason': 'Requires capabilities'},
+        {'ChangeSetName': CS_ID})
+    stubbed.add_response('delete_change_set', {}, {'ChangeSetName': CS_ID})
+    with pytest.raises(RuntimeError, match='Requires capabilities'):
+        sut_cli(stack, aws).cmd_update()
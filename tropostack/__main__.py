@@ -0,0 +1,139 @@
+"""
+The ``tropostack`` command - operations spanning multiple stacks
+"""
+import argparse
+import os
+import sys
+import time
+
+from tropostack.cli import _csv_list
+from tropostack.conf_loaders import PartitionedConfig
+from tropostack.discovery import find_stacks
+from tropostack.orchestrator import Orchestrator, OK
+from tropostack.render import FORMATS, Renderer
+from tropostack import status
+
+
+def cmd_deploy(args):
+    """Run a CLI command across inter-dependent stacks"""
+    conf = PartitionedConfig.load(args.conf_file) if args.conf_file else {}
+    stack_classes = [cls for spec in args.stacks for cls in find_stacks(spec)]
+    orch = Orchestrator(stack_classes, conf, max_workers=args.workers)
+    results = orch.run(args.command)
+    return 0 if all(res == OK for res in results.values()) else 1
+
+
+def cmd_render(args):
+    """Compile stack templates into an output directory"""
+    conf = PartitionedConfig.load(args.conf_file) if args.conf_file else {}
+    stack_classes = [cls for spec in args.stacks for cls in find_stacks(spec)]
+    renderer = Renderer(stack_classes, conf, outdir=args.output_dir,
+                        fmt=args.format, workers=args.workers)
+    started = time.perf_counter()
+    results = renderer.run()
+    elapsed = time.perf_counter() - started
+    print(renderer.report())
+    print('Rendered %d stack(s) into %s in %.2f s'
+          % (len(results), args.output_dir, elapsed))
+    if not args.validate:
+        return 0
+    # Imported here, as plain rendering never needs AWS
+    from tropostack.aws import ClientProvider
+    from tropostack.transport import TemplateTransport
+    aws = ClientProvider()
+    failed = 0
+    for stackname, (region, path) in sorted(results.items()):
+        with open(path, encoding='utf-8') as fhandle:
+            body = fhandle.read()
+        transport = TemplateTransport(aws, bucket=args.template_bucket,
+                                      region=region)
+        try:
+            aws.client('cloudformation', region=region).validate_template(
+                **transport.template_args(body))
+        except Exception as err:
+            print('%s: validation failed: %s' % (stackname, err))
+            failed += 1
+        else:
+            print('%s: validation OK' % stackname)
+    return 1 if failed else 0
+
+
+def cmd_status(args):
+    """Show the status, and optionally outputs, of many deployed stacks"""
+    from tropostack.aws import ClientProvider
+    aws = ClientProvider()
+    stacks = []
+    for region in args.regions or [None]:
+        query = status.StackStatusQuery(
+            aws, region=region, prefix=args.prefix, patterns=args.patterns,
+            statuses=args.status, outputs=args.outputs, ttl=args.cache_ttl)
+        stacks.extend(query.fetch())
+    print(status.format_stacks(stacks, args.format, outputs=args.outputs))
+    return 0
+
+
+def argparser():
+    parser = argparse.ArgumentParser(prog='tropostack')
+    subparsers = parser.add_subparsers(dest='subcommand')
+    subparsers.required = True
+
+    deploy = subparsers.add_parser('deploy', help=cmd_deploy.__doc__)
+    deploy.set_defaults(func=cmd_deploy)
+    deploy.add_argument('stacks', nargs='+', metavar='MODULE[:CLASS]',
+                        help='Stack class, or module to take all stacks from')
+    deploy.add_argument('--conf-file', type=argparse.FileType('r'),
+                        help='Partitioned YAML configuration file')
+    deploy.add_argument('--command', default='apply',
+                        help='CLI command to run on each stack; delete '
+                        'runs on the importing stacks first')
+    deploy.add_argument('--workers', type=int, default=4,
+                        help='Maximum number of stacks processed in parallel')
+
+    render = subparsers.add_parser('render', help=cmd_render.__doc__)
+    render.set_defaults(func=cmd_render)
+    render.add_argument('stacks', nargs='+', metavar='MODULE[:CLASS]',
+                        help='Stack class, or module/package to take all '
+                        'stacks from')
+    render.add_argument('--conf-file', type=argparse.FileType('r'),
+                        help='Partitioned YAML configuration file')
+    render.add_argument('-o', '--output-dir', default='templates',
+                        help='Directory to write the templates to')
+    render.add_argument('--format', choices=FORMATS, default='yaml',
+                        help='Template format')
+    render.add_argument('--workers', type=int, default=None,
+                        help='Number of compiler processes (default: CPUs)')
+    render.add_argument('--validate', action='store_true',
+                        help='Validate the templates against the '
+                        'CloudFormation API')
+    render.add_argument('--template-bucket',
+                        default=os.environ.get('TROPOSTACK_TEMPLATE_BUCKET'),
+                        help='S3 bucket for templates too large to validate '
+                        'inline')
+
+    stat = subparsers.add_parser('status', help=cmd_status.__doc__)
+    stat.set_defaults(func=cmd_status)
+    stat.add_argument('patterns', nargs='*', metavar='PATTERN',
+                      help='Shell-style stack name patterns, e.g. '
+                      '"myapp-*-prod"')
+    stat.add_argument('--prefix', help='Stack name prefix')
+    stat.add_argument('--regions', type=_csv_list,
+                      help='Comma-separated regions (default: the session '
+                      'region)')
+    stat.add_argument('--status', action='append',
+                      help='Only stacks in this status; repeatable')
+    stat.add_argument('--outputs', action='store_true',
+                      help='Include the stack outputs')
+    stat.add_argument('--format', choices=status.FORMATS, default='table',
+                      help='Output format')
+    stat.add_argument('--cache-ttl', type=int, default=0, metavar='SECONDS',
+                      help='Reuse results fetched within this many seconds')
+    return parser
+
+
+def main(argv=None):
+    args = argparser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
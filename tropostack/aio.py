@@ -0,0 +1,154 @@
+"""
+Asyncio engine driving CloudFormation operations of many stacks at once
+"""
+import asyncio
+import functools
+
+from .cli import StatusPoller
+
+
+class AsyncEngine():
+    """
+    Coroutine counterpart of the `tropostack.cli.InlineConfCLI` commands.
+
+    The blocking CloudFormation calls are run in an executor, while all the
+    waiting in between happens in the event loop - so a single process can
+    drive and monitor hundreds of stack operations concurrently. Templates,
+    clients, output and the command plumbing all come from the wrapped CLI.
+
+    Args:
+        cli (tropostack.cli.InlineConfCLI): CLI instance of the stack
+        executor (concurrent.futures.Executor): Executor for the API calls;
+            the event loop's default one if not given
+    """
+    _CMD_PREFIX = 'cmd_'
+
+    def __init__(self, cli, executor=None):
+        self.cli = cli
+        self.executor = executor
+        self.stackname = cli.stackname
+        self._cfn = None
+
+    @property
+    def cfn(self):
+        if self._cfn is None:
+            self._cfn = self.cli._cfn_conn()
+        return self._cfn
+
+    def _call(self, func, *args, **kwargs):
+        """Run the blocking `func` in the executor"""
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(
+            self.executor, functools.partial(func, *args, **kwargs))
+
+    async def run(self, command=None):
+        """Run the given command, or the one the CLI was built for"""
+        command = command or self.cli.args.command
+        return await getattr(self, self._CMD_PREFIX + command)()
+
+    async def aws_stack(self, exc=True):
+        """Coroutine version of `tropostack.cli.InlineConfCLI._aws_stack`"""
+        return await self._call(self.cli._aws_stack, self.cfn, exc=exc)
+
+    async def print_status_while(self, status, poll_sec=20):
+        """
+        Tail and print the stack events while the stack is in the given
+        state, backing off like `tropostack.cli.InlineConfCLI` does -
+        ``--quiet`` included.
+        """
+        poller = StatusPoller(self.cli, self.cfn, status, poll_sec)
+        try:
+            delay = await self._call(poller.step)
+            while delay is not None:
+                await asyncio.sleep(delay)
+                delay = await self._call(poller.step)
+        finally:
+            poller.sink.flush()
+
+    async def wait_change_set(self, cs_id):
+        """
+        Wait for a change set to leave its pending states.
+
+        Returns:
+            dict: The final `describe_change_set` response
+        """
+        while True:
+            change_set = await self._call(
+                self.cli._describe_change_set, self.cfn, cs_id)
+            if change_set['Status'] not in self.cli._CS_PENDING:
+                return change_set
+            await asyncio.sleep(self.cli.POLL_MIN_SEC)
+
+    async def cmd_validate(self):
+        cli = self.cli
+        body = await self._call(cli.template_body)
+        args = await self._call(cli.template_args, body)
+        resp = await self._call(self.cfn.validate_template, **args)
+        status = resp.get('ResponseMetadata', {}).get('HTTPStatusCode', '')
+        if status == 200:
+            cli.echo('Validation OK')
+        else:
+            raise RuntimeError('Validation failed! Response:\n%s' % resp)
+
+    async def cmd_create(self):
+        body = await self._call(self.cli.template_body)
+        await self._call(self.cli._create_stack, self.cfn, body)
+        await self.print_status_while('CREATE_IN_PROGRESS')
+
+    async def cmd_update(self, exc_on_noop=True):
+        cli = self.cli
+        aws_stack = await self.aws_stack(exc=True)
+        body = await self._call(cli.template_body)
+        changes = await self._call(cli._template_changes, self.cfn, body)
+        if not changes and not cli._tags_changed(aws_stack):
+            return cli._update_noop(exc_on_noop)
+        cs_id = await self._call(cli._create_change_set, self.cfn, body)
+        change_set = await self.wait_change_set(cs_id)
+        if await self._call(cli._change_set_noop, self.cfn, change_set, cs_id):
+            return cli._update_noop(exc_on_noop)
+        await self._call(cli._execute_change_set, self.cfn, change_set, cs_id)
+        await self.print_status_while('UPDATE_IN_PROGRESS')
+
+    async def cmd_delete(self):
+        await self.aws_stack(exc=True)
+        await self._call(self.cli._delete_stack, self.cfn)
+        await self.print_status_while('DELETE_IN_PROGRESS')
+
+    async def cmd_outputs(self):
+        self.cli._echo_outputs(await self.aws_stack(exc=True))
+
+    async def cmd_apply(self):
+        if await self.aws_stack(exc=False):
+            await self.cmd_update(exc_on_noop=False)
+        else:
+            await self.cmd_create()
+
+
+async def run_commands(clis, command=None, limit=None, executor=None):
+    """
+    Run a command concurrently on the stacks behind several CLI instances.
+
+    Args:
+        clis (list): `tropostack.cli.InlineConfCLI` instances
+        command (str): Command to run, e.g. ``apply``; defaults to the one
+            each CLI was built for
+        limit (int): Maximum number of operations in flight; unbounded if
+            not given
+        executor (concurrent.futures.Executor): Executor for the API calls
+
+    Returns:
+        list: Per CLI, None on success or the exception raised
+    """
+    sem = asyncio.Semaphore(limit) if limit else None
+
+    async def run_one(cli):
+        engine = AsyncEngine(cli, executor=executor)
+        if sem is None:
+            return await engine.run(command)
+        async with sem:
+            return await engine.run(command)
+
+    results = await asyncio.gather(*[run_one(cli) for cli in clis],
+                                   return_exceptions=True)
+    return [res if isinstance(res, BaseException) else None
+            for res in results]
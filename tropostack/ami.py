@@ -0,0 +1,89 @@
+"""
+Resolution of AMI IDs by image manifest location
+"""
+from tropostack.exceptions import AmiLookupError
+from tropostack.resolver import CachingResolver
+
+# Maximum number of values in a single describe_images filter
+_FILTER_BATCH = 100
+
+
+class Ec2ImageBackend():
+    """Looks AMIs up through the EC2 ``describe_images`` API"""
+    # Results are worth persisting in the on-disk cache
+    cacheable = True
+
+    def describe(self, aws, region, locations):
+        """
+        Find the images at each of the manifest `locations`, using the
+        `tropostack.aws.ClientProvider` given as `aws`.
+
+        Returns:
+            dict: Location to the list of matching image IDs
+        """
+        client = aws.client('ec2', region=region)
+        found = {location: [] for location in locations}
+        locations = sorted(locations)
+        for idx in range(0, len(locations), _FILTER_BATCH):
+            response = client.describe_images(Filters=[{
+                'Name': 'manifest-location',
+                'Values': locations[idx:idx + _FILTER_BATCH],
+            }])
+            for image in response['Images']:
+                found.setdefault(image['ImageLocation'], []).append(
+                    image['ImageId'])
+        return found
+
+
+class StubImageBackend():
+    """
+    Offline backend resolving locations from a static mapping, or to
+    `default` for unknown locations. Used for the ``pytest`` region.
+    """
+    cacheable = False
+
+    def __init__(self, images=None, default='ami-notfound'):
+        self.images = images or {}
+        self.default = default
+
+    def describe(self, aws, region, locations):
+        return {location: [self.images.get(location, self.default)]
+                for location in locations}
+
+
+class AmiResolver(CachingResolver):
+    """
+    Memoizing, batching AMI lookup (see `tropostack.resolver.CachingResolver`),
+    by image manifest location. Results are cached on disk for a day by
+    default.
+    """
+    error = AmiLookupError
+    cache_name = 'amis.json'
+    default_ttl = 24 * 3600
+    noun = 'AMI'
+
+    def _default_backend(self):
+        return Ec2ImageBackend()
+
+    def _stub_backend(self):
+        return StubImageBackend()
+
+    def _value(self, region, name, found):
+        images = found.get(name, [])
+        if len(images) == 0:
+            raise AmiLookupError('No AMIs found with location: %s' % name)
+        if len(images) > 1:
+            raise AmiLookupError('Multiple AMIs found: %s' % images)
+        return images[0]
+
+    def resolve(self, region, location, aws=None):
+        """AMI ID at `location` in `region`"""
+        return self.lookup(region, location, aws=aws)
+
+
+def default_resolver():
+    """
+    The process-wide `AmiResolver`, shared by all stacks. Offline mode is on
+    if ``$TROPOSTACK_OFFLINE`` is set.
+    """
+    return AmiResolver.default()
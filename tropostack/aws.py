@@ -0,0 +1,154 @@
+"""
+Shared AWS session and client management
+"""
+import threading
+
+from tropostack import instrument
+
+
+def _refreshing_session(fetch):
+    """
+    botocore session whose credentials come from `fetch` - a callable
+    returning the ``access_key``, ``secret_key``, ``token`` and
+    ``expiry_time`` - and get fetched again shortly before they expire.
+    """
+    import botocore.credentials
+    import botocore.session
+
+    creds = botocore.credentials.RefreshableCredentials.create_from_metadata(
+        metadata=fetch(), refresh_using=fetch, method='assume-role')
+
+    class _Provider(botocore.credentials.CredentialProvider):
+        METHOD = 'assume-role'
+
+        def load(self):
+            return creds
+
+    session = botocore.session.Session()
+    session.get_component('credential_provider').insert_before(
+        'env', _Provider())
+    return session
+
+
+class ClientProvider():
+    """
+    Source of boto3 clients for the CLI commands and the stack helpers.
+
+    Each client is created once per (service, region) pair and reused
+    afterwards, along with its connection pool. boto3 sessions are not
+    thread-safe while clients are, so the session is only used under a lock -
+    one provider can be shared by many threads.
+
+    boto3 itself is only imported once the first client is requested, so that
+    commands which never call AWS do not pay for loading it.
+
+    Args:
+        region (str): Region for clients requested without one
+        retry_mode (str): botocore retry mode - legacy, standard or adaptive
+        max_attempts (int): Maximum attempts per API call, botocore default
+            if None
+        max_pool_connections (int): Size of each client's connection pool
+        rate_limiter (tropostack.ratelimit.RateLimiter): Rate limiter of the
+            API calls of all clients; none if None
+        session_kwargs: Passed on to `boto3.session.Session`
+    """
+    def __init__(self, region=None, retry_mode='standard', max_attempts=None,
+                 max_pool_connections=10, rate_limiter=None,
+                 **session_kwargs):
+        self.region = region
+        self.rate_limiter = rate_limiter
+        self.retries = {'mode': retry_mode}
+        if max_attempts is not None:
+            self.retries['max_attempts'] = max_attempts
+        self.max_pool_connections = max_pool_connections
+        self._assumed = {}
+        self._config = None
+        self._session_kwargs = session_kwargs
+        self._session = None
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    @property
+    def config(self):
+        """botocore client configuration shared by all clients"""
+        if self._config is None:
+            from botocore.config import Config
+            self._config = Config(
+                retries=dict(self.retries),
+                max_pool_connections=self.max_pool_connections)
+        return self._config
+
+    @property
+    def session(self):
+        """The underlying boto3 session, created on first use"""
+        with self._lock:
+            if self._session is None:
+                import boto3.session
+                self._session = boto3.session.Session(**self._session_kwargs)
+            return self._session
+
+    def client(self, service, region=None):
+        """
+        Shared client for `service` in `region` (or the provider's default
+        region).
+        """
+        key = (service, region or self.region)
+        client = self._clients.get(key)
+        if client is None:
+            session = self.session
+            config = self.config
+            with self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    client = self._clients[key] = session.client(
+                        service, region_name=key[1], config=config)
+                    instrument.attach_client(client)
+                    if self.rate_limiter is not None:
+                        self.rate_limiter.attach(client)
+        return client
+
+    def limit_rate(self, rate_limiter):
+        """Rate limit the API calls of all clients, existing ones included"""
+        with self._lock:
+            self.rate_limiter = rate_limiter
+            clients = list(self._clients.values())
+        for client in clients:
+            rate_limiter.attach(client)
+
+    def assume_role(self, role_arn, session_name='tropostack'):
+        """
+        Provider whose clients act as `role_arn`, e.g. in another account. The
+        role is assumed through STS right away, and again whenever the
+        temporary credentials are about to expire; the provider is kept for
+        later calls.
+
+        Returns:
+            ClientProvider: Provider with the temporary role credentials
+        """
+        with self._lock:
+            provider = self._assumed.get(role_arn)
+        if provider is not None:
+            return provider
+
+        def fetch():
+            creds = self.client('sts').assume_role(
+                RoleArn=role_arn, RoleSessionName=session_name)['Credentials']
+            return {
+                'access_key': creds['AccessKeyId'],
+                'secret_key': creds['SecretAccessKey'],
+                'token': creds['SessionToken'],
+                'expiry_time': creds['Expiration'].isoformat(),
+            }
+        # API rate limits apply per account
+        limiter = self.rate_limiter
+        if limiter is not None:
+            parts = role_arn.split(':')
+            limiter = limiter.scoped(parts[4] if len(parts) > 5 else role_arn)
+        provider = ClientProvider(
+            region=self.region, retry_mode=self.retries['mode'],
+            max_attempts=self.retries.get('max_attempts'),
+            max_pool_connections=self.max_pool_connections,
+            rate_limiter=limiter,
+            botocore_session=_refreshing_session(fetch))
+        with self._lock:
+            return self._assumed.setdefault(role_arn, provider)
@@ -1,12 +1,121 @@
-from collections.abc import Iterable
+import json
+from collections import ChainMap
+from collections.abc import Iterable, Mapping
 
 from troposphere import Template
-import boto3
 
+from tropostack import instrument
+from tropostack.ami import default_resolver
+from tropostack import outputs
+from tropostack.aws import ClientProvider
 from tropostack.exceptions import InvalidStackError
 
 
-class BaseStack():
+class _MemoizedMember():
+    """
+    Property-like descriptor that evaluates the decorated method at most once
+    per stack instance. Cached values are dropped whenever the stack ``conf``
+    is replaced, when `BaseStack.invalidate()` is called, and at the start of
+    every `BaseStack.compile()`.
+    """
+    def __init__(self, fget, kind):
+        self.fget = fget
+        self.kind = kind
+        self.name = fget.__name__
+        self.__doc__ = fget.__doc__
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        tracker = obj.__dict__.get('_tracker')
+        if tracker is not None:
+            # Incremental compile in progress - see `tropostack.incremental`
+            tracker.reference(self.name)
+        memo = obj.__dict__.setdefault('_memo', {})
+        try:
+            return memo[self.name]
+        except KeyError:
+            pass
+        if tracker is not None:
+            with tracker.evaluating(self.name):
+                value = memo[self.name] = self.fget(obj)
+        elif instrument.active():
+            with instrument.span(instrument.MEMBER, self.name):
+                value = memo[self.name] = self.fget(obj)
+        else:
+            value = memo[self.name] = self.fget(obj)
+        return value
+
+
+def resource(fget):
+    """
+    Decorator for `r_` stack members - a memoized drop-in for ``@property``.
+    Other members can reference the resource freely without rebuilding it.
+    """
+    return _MemoizedMember(fget, kind='resource')
+
+
+def output(fget):
+    """
+    Decorator for `o_` stack members - a memoized drop-in for ``@property``.
+    """
+    return _MemoizedMember(fget, kind='output')
+
+
+class ConfRecorder(Mapping):
+    """
+    Read-only view of a stack configuration, recording which keys are read
+    through it. Iterating over the view counts as reading all keys.
+    """
+    def __init__(self, conf):
+        self.conf = conf
+        self.keys_read = set()
+
+    def __getitem__(self, key):
+        self.keys_read.add(key)
+        return self.conf[key]
+
+    def __iter__(self):
+        self.keys_read.update(self.conf)
+        return iter(self.conf)
+
+    def __len__(self):
+        return len(self.conf)
+
+
+class StackMeta(type):
+    """
+    Metaclass recording the resource/output members of each stack class at
+    class creation time, so that `BaseStack.compile()` need not introspect
+    instances. Members are kept in declaration order, base classes first;
+    setting a member to ``None`` in a subclass turns it off.
+
+    Declaration order comes from the class namespace, which is only ordered
+    from Python 3.6 on - as is `_MemoizedMember.__set_name__`.
+    """
+    def __init__(cls, name, bases, namespace):
+        super().__init__(name, bases, namespace)
+        cls._RESOURCES = cls._collect_members(cls._RSC_PREFIX)
+        cls._OUTPUTS = cls._collect_members(cls._OUT_PREFIX)
+
+    def _collect_members(cls, prefix):
+        members = {}
+        for klass in reversed(cls.__mro__):
+            for attr, value in vars(klass).items():
+                if not attr.startswith(prefix):
+                    continue
+                if value is None:
+                    members.pop(attr, None)
+                else:
+                    # Overrides keep the position of the original declaration
+                    members.setdefault(attr, True)
+        return tuple(members)
+
+
+class BaseStack(metaclass=StackMeta):
     CFN_CAPS = []
     BASE_NAME = None
 
@@ -14,13 +123,77 @@ class BaseStack():
     _RSC_PREFIX = 'r_'
     # Methods prefixed with below prefix return Troposphere/CFN Outputs
     _OUT_PREFIX = 'o_'
+    # Configuration keys holding AMI manifest locations (or lists of those).
+    # They get resolved in a single batch at the start of each compile.
+    AMI_LOCATION_KEYS = ()
+    # `tropostack.ami.AmiResolver` to use - the process-wide one if None
+    AMI_RESOLVER = None
+    # Configuration keys holding names of stacks (or lists of those) whose
+    # outputs get fetched in a single batch at the start of each compile
+    OUTPUT_STACK_KEYS = ()
+    # `tropostack.outputs.OutputResolver` to use - the process-wide one if None
+    OUTPUT_RESOLVER = None
+    # Always deploy the stack as a parent stack of nested stacks holding its
+    # resources (see `tropostack.nested`), like the CLI's ``--split-nested``
+    SPLIT_NESTED = False
 
     def __init__(self, conf):
         self.conf = conf
-        # The only absolutely required configuration of each stack is its region
-        self.region = conf.get('region')
         self.validate()
 
+    @property
+    def region(self):
+        """
+        The only absolutely required configuration of each stack. Read from
+        ``conf``, so that configuration recording sees every use of it.
+        """
+        return self.conf.get('region')
+
+    @region.setter
+    def region(self, value):
+        if '_conf' not in self.__dict__:
+            # Set ahead of ``super().__init__()`` - the default for a
+            # configuration without a region
+            self._default_region = value
+            return
+        # Overlaid, so that configuration views (e.g. a `PartitionedConfig`)
+        # stay in place underneath
+        self.conf = ChainMap({'region': value}, self.conf)
+
+    @property
+    def conf(self):
+        return self._conf
+
+    @conf.setter
+    def conf(self, value):
+        default = self.__dict__.pop('_default_region', None)
+        if default is not None and value.get('region') is None:
+            value = ChainMap({'region': default}, value)
+        # Members built against the previous configuration are now stale
+        self._conf = value
+        self.invalidate()
+
+    @property
+    def aws(self):
+        """
+        `tropostack.aws.ClientProvider` used by the stack helpers. Set by the
+        CLI to share its clients; created on first use otherwise.
+        """
+        if self.__dict__.get('_aws') is None:
+            self._aws = ClientProvider(region=self.region)
+        return self._aws
+
+    @aws.setter
+    def aws(self, provider):
+        self._aws = provider
+
+    def invalidate(self):
+        """
+        Drop all memoized `resource`/`output` values, forcing them to be
+        rebuilt on next access.
+        """
+        self.__dict__.pop('_memo', None)
+
     def validate(self):
         # No class is valid without a name
         if not self.BASE_NAME:
@@ -31,23 +204,83 @@ class BaseStack():
         if not getattr(self, 'region'):
             raise InvalidStackError("Stack configuration is missing: region")
 
+    def _ami_resolver(self):
+        return self.AMI_RESOLVER or default_resolver()
+
     def ami_by_location(self, location):
         """
         Find AMI according to the given location
         """
-        if self.region == 'pytest' or not self.region or not location:
-            # Short-circuit if we're running a test or do not have data
+        if not self.region or not location:
+            # Short-circuit if we do not have data
             return 'ami-notfound'
-        client = boto3.client('ec2', region_name=self.region)
-        response = client.describe_images(Filters=[
-            {'Name': 'manifest-location', 'Values': [location]},
-        ])
-        if len(response['Images']) == 0:
-            raise RuntimeError('No AMIs found with location: %s' % location)
-        if len(response['Images']) > 1:
-            raise RuntimeError('Multiple AMIs found: %s' % response['Images'])
-        return response['Images'][0]['ImageId']
+        with instrument.span(instrument.PHASE, 'ami_by_location'):
+            return self._lookup('ami', self.region, location)
 
+    def prefetch_amis(self):
+        """Resolve the AMIs of all `AMI_LOCATION_KEYS` in one batch"""
+        locations = set()
+        for key in self.AMI_LOCATION_KEYS:
+            value = self.conf.get(key)
+            if isinstance(value, str):
+                value = [value]
+            locations.update(loc for loc in value or [] if loc)
+        # Only look at the region when needed, as reading it makes the
+        # template region-specific (see `compile_recording`)
+        if locations and self.region:
+            with instrument.span(instrument.PHASE, 'prefetch_amis'):
+                self._ami_resolver().prefetch(self.region, locations,
+                                              aws=self.aws)
+
+    def _output_resolver(self):
+        return self.OUTPUT_RESOLVER or outputs.default_resolver()
+
+    def stack_output(self, stackname, key, region=None):
+        """
+        Value of the output `key` of the deployed stack `stackname`, in
+        `region` (the stack's own by default). Each referenced stack is
+        described once per process.
+        """
+        region = region or self.region
+        with instrument.span(instrument.PHASE, 'stack_output'):
+            return self._lookup('output', region, stackname, key)
+
+    def resolve_lookup(self, kind, region, *args):
+        """
+        Resolve an AMI (`kind` ``'ami'``, by location) or a stack output
+        (``'output'``, by stack name and key) through the stack's resolvers
+        """
+        if kind == 'ami':
+            value = self._ami_resolver().resolve(region, *args, aws=self.aws)
+        else:
+            value = self._output_resolver().resolve(region, *args,
+                                                    aws=self.aws)
+        resolved = self.__dict__.get('_resolved')
+        if resolved is not None:
+            # Template caching in progress - see `tropostack.cache`
+            resolved[json.dumps([kind, region] + list(args))] = value
+        return value
+
+    def _lookup(self, kind, region, *args):
+        value = self.resolve_lookup(kind, region, *args)
+        tracker = self.__dict__.get('_tracker')
+        if tracker is not None:
+            # Incremental compile in progress - see `tropostack.incremental`
+            tracker.lookup((kind, region) + args, value)
+        return value
+
+    def prefetch_outputs(self):
+        """Fetch the outputs of all `OUTPUT_STACK_KEYS` stacks in one batch"""
+        stacknames = set()
+        for key in self.OUTPUT_STACK_KEYS:
+            value = self.conf.get(key)
+            if isinstance(value, str):
+                value = [value]
+            stacknames.update(name for name in value or [] if name)
+        if stacknames and self.region:
+            with instrument.span(instrument.PHASE, 'prefetch_outputs'):
+                self._output_resolver().prefetch(self.region, stacknames,
+                                                 aws=self.aws)
 
     @property
     def stackname(self):
@@ -58,34 +291,56 @@ class BaseStack():
         """
         Generate a Troposphere Template object by attaching the results of all
         methods/properties following the `_RSC_PREFIX`/`_OUT_PREFIX` convention
-        as either Resources or Outputs.
+        as either Resources or Outputs, in declaration order.
         """
         # Support for attaching resources to externally-passed template,
         # allowing for creating "composite" stacks, where resources are built
         # on top of existing stack objects
         if template is None:
             template = Template()
+        with instrument.span(instrument.PHASE, 'compile'):
+            # Memoized members are shared for the duration of one compile
+            # only, so in-place changes to `conf` are picked up by the next one
+            self.invalidate()
+            self.prefetch_amis()
+            self.prefetch_outputs()
 
-        # Auto-detect and add resources/outputs based on prefix + introspection
-        for attr in dir(self):
-            add_fn = None
-            # Handle Resource addition
-            if attr.startswith(self._RSC_PREFIX):
-                add_fn = template.add_resource
-            # Handle Outputs addition
-            elif attr.startswith(self._OUT_PREFIX):
-                add_fn = template.add_output
-            # Ignore if the property is not of interest
-            if not add_fn:
-                continue
+            # Resources/outputs were registered by prefix at class creation
+            for attr in self._RESOURCES:
+                self._add_member(template.add_resource, attr)
+            for attr in self._OUTPUTS:
+                self._add_member(template.add_output, attr)
+        return template
+
+    def compile_recording(self, template=None):
+        """
+        Compile the stack while recording the configuration keys it reads.
 
+        Returns:
+            tuple: The template and the set of configuration keys read
+        """
+        conf = self.conf
+        recorder = ConfRecorder(conf)
+        self.conf = recorder
+        try:
+            template = self.compile(template)
+        finally:
+            self.conf = conf
+        return template, recorder.keys_read
+
+    def _add_member(self, add_fn, attr):
+        if instrument.active() and \
+                not isinstance(getattr(type(self), attr), _MemoizedMember):
+            # Plain properties get no span of their own otherwise
+            with instrument.span(instrument.MEMBER, attr):
+                value = getattr(self, attr)
+        else:
             value = getattr(self, attr)
-            # Handle iterable vs non-iterable resource/outputs
-            if isinstance(value, Iterable):
-                [add_fn(elem) for elem in value]
-            else:
-                add_fn(value)
-        return template
+        # Handle iterable vs non-iterable resource/outputs
+        if isinstance(value, Iterable):
+            [add_fn(elem) for elem in value]
+        else:
+            add_fn(value)
 
     @property
     def tags(self):
@@ -0,0 +1,89 @@
+"""
+Template size and count budgets against the CloudFormation limits
+"""
+import json
+
+from troposphere import Template
+
+from .serialize import template_dict
+from .transport import INLINE_LIMIT, URL_LIMIT
+
+# CloudFormation limits on the number of template entries, by section
+SECTION_LIMITS = {
+    'Resources': 500,
+    'Outputs': 200,
+    'Parameters': 200,
+    'Mappings': 200,
+}
+
+
+class UnboundedTemplate(Template):
+    """
+    Troposphere template without the resource count cap, so that stacks
+    over the CloudFormation limit can still be compiled - to be analyzed, or
+    split into nested stacks (see `tropostack.nested`).
+    """
+    def add_resource(self, resource):
+        return self._update(self.resources, resource)
+
+
+def compact_size(value):
+    """Bytes taken by `value` in a minified JSON template"""
+    return len(json.dumps(value, separators=(',', ':')).encode('utf-8'))
+
+
+class TemplateBudget():
+    """
+    Serialized size of a template and of each of its resources, and the
+    section counts, measured against the CloudFormation limits.
+
+    Sizes are those of the minified JSON form, which is what gets passed on
+    to CloudFormation for large templates (see `tropostack.transport`).
+
+    Args:
+        template: A troposphere Template, or a template dict
+    """
+    def __init__(self, template):
+        self.template = template_dict(template)
+        self.body_bytes = compact_size(self.template)
+        self.resource_bytes = {
+            title: compact_size({title: rsc}) for title, rsc in
+            self.template.get('Resources', {}).items()}
+
+    def usage(self):
+        """
+        Returns:
+            list: ``[limit, used, maximum]`` rows - the template size and
+            the entry count of each section
+        """
+        rows = [['Template bytes (inline)', self.body_bytes, INLINE_LIMIT],
+                ['Template bytes (S3)', self.body_bytes, URL_LIMIT]]
+        for section, limit in sorted(SECTION_LIMITS.items()):
+            rows.append([section, len(self.template.get(section, {})), limit])
+        return rows
+
+    def over_limits(self):
+        """
+        Returns:
+            list: Descriptions of the hard limits the template exceeds; the
+            inline size limit is not one, as S3 can take larger templates
+        """
+        return ['%s: %d over the limit of %d' % (name, used, limit)
+                for name, used, limit in self.usage()[1:] if used > limit]
+
+    def largest(self, count=10):
+        """The `count` largest resources, as ``(title, bytes)`` pairs"""
+        return sorted(self.resource_bytes.items(),
+                      key=lambda item: (-item[1], item[0]))[:count]
+
+    def report(self, top=10):
+        """Tables of the limit usage and of the largest resources"""
+        import tabulate
+        usage = tabulate.tabulate(
+            [row + [100.0 * row[1] / row[2]] for row in self.usage()],
+            headers=['LIMIT', 'USED', 'MAXIMUM', '%'], floatfmt='.1f')
+        largest = tabulate.tabulate(
+            [[title, size, 100.0 * size / self.body_bytes]
+             for title, size in self.largest(top)],
+            headers=['RESOURCE', 'BYTES', '% OF TEMPLATE'], floatfmt='.1f')
+        return '%s\n\n%s' % (usage, largest)
@@ -0,0 +1,223 @@
+"""
+On-disk caching of compiled templates
+"""
+import hashlib
+import inspect
+import json
+import os
+import tempfile
+import time
+import uuid
+
+import troposphere
+
+import tropostack
+
+
+def _current_umask():
+    # Reading the umask means setting it; done once, at import time
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+_UMASK = _current_umask()
+
+# Stands in for the source of classes defined without a source file
+_PROCESS_TOKEN = uuid.uuid4().hex
+
+
+def cache_dir(*parts):
+    """
+    Location of the tropostack caches - ``$TROPOSTACK_CACHE_DIR`` if set, or
+    ``tropostack`` under the XDG cache directory (``~/.cache`` by default).
+    """
+    base = os.environ.get('TROPOSTACK_CACHE_DIR') or os.path.join(
+        os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'),
+        'tropostack')
+    return os.path.join(base, *parts)
+
+
+def atomic_write(path, text):
+    """
+    Write `text` to `path` through a temporary file in the same directory, so
+    that readers never see a partially written file. The file gets the
+    permissions a plain ``open()`` would give it.
+    """
+    dirname = os.path.dirname(path) or '.'
+    os.makedirs(dirname, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=dirname, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as fhandle:
+            fhandle.write(text)
+        # mkstemp creates files readable by their owner only
+        os.chmod(tmp, 0o666 & ~_UMASK)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+def _remove(path):
+    """Remove the file at `path`, unless another process already did"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _json_default(obj):
+    # Troposphere helpers (e.g. Sub) can be part of the configuration
+    to_dict = getattr(obj, 'to_dict', None)
+    return to_dict() if to_dict else repr(obj)
+
+
+def value_fingerprint(value):
+    """Stable hash of a configuration value"""
+    dumped = json.dumps(value, sort_keys=True, default=_json_default)
+    return hashlib.sha256(dumped.encode('utf-8')).hexdigest()
+
+
+def source_fingerprint(stack_cls, *extra):
+    """
+    Hash the code a stack class compiles with: the source of every module in
+    its class hierarchy and the troposphere/tropostack versions.
+
+    Classes without a source file (e.g. defined in a REPL or through
+    ``python -c``) get a fingerprint valid for the current process only.
+    """
+    digest = hashlib.sha256()
+    for value in (troposphere.__version__, tropostack.__version__) + extra:
+        digest.update(str(value).encode('utf-8'))
+    for klass in stack_cls.__mro__:
+        digest.update(klass.__qualname__.encode('utf-8'))
+        if klass.__module__ == 'builtins':
+            continue
+        try:
+            srcfile = inspect.getsourcefile(klass)
+        except (TypeError, OSError):
+            srcfile = None
+        try:
+            with open(srcfile, 'rb') as src:
+                digest.update(src.read())
+        except (TypeError, OSError):
+            digest.update(('%s %d' % (_PROCESS_TOKEN, id(klass))).encode(
+                'utf-8'))
+    return digest.hexdigest()
+
+
+def stack_fingerprint(stack, *extra):
+    """
+    Hash everything a compiled template is derived from: the stack source
+    (see `source_fingerprint`) and the effective stack configuration.
+    """
+    digest = hashlib.sha256()
+    digest.update(source_fingerprint(type(stack), *extra).encode('utf-8'))
+    digest.update(value_fingerprint(dict(stack.conf)).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _lookups_key(base, resolved, fmt):
+    """Cache key of a template, out of its `base` key and resolved lookups"""
+    digest = hashlib.sha256(base.encode('utf-8'))
+    digest.update(value_fingerprint(resolved).encode('utf-8'))
+    return '%s.%s' % (digest.hexdigest(), fmt)
+
+
+class TemplateCache():
+    """
+    Content-addressed store of rendered templates.
+
+    Entries older than `max_age` seconds are discarded, and the least recently
+    used ones are evicted once the total size exceeds `max_bytes`.
+
+    Templates are keyed by the stack source and configuration, and by the
+    values of the lookups of external data made while compiling (e.g.
+    `ami_by_location`). The lookups are stored alongside and resolved again
+    on every use - through the resolvers, which keep them for their own TTL.
+    """
+    def __init__(self, path=None, max_bytes=64 * 1024 * 1024,
+                 max_age=7 * 24 * 3600):
+        self.path = path or cache_dir('templates')
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+
+    def _entry(self, key):
+        return os.path.join(self.path, key)
+
+    def get(self, key):
+        """Cached body for `key`, or None"""
+        entry = self._entry(key)
+        try:
+            if time.time() - os.path.getmtime(entry) > self.max_age:
+                _remove(entry)
+                return None
+            with open(entry, encoding='utf-8') as fhandle:
+                body = fhandle.read()
+        except OSError:
+            return None
+        # Bump the mtime, which doubles as the LRU marker
+        try:
+            os.utime(entry)
+        except FileNotFoundError:
+            # Evicted by another process in the meantime
+            pass
+        return body
+
+    def put(self, key, body):
+        """Atomically store `body` under `key`"""
+        atomic_write(self._entry(key), body)
+        self.evict()
+
+    def evict(self):
+        """Drop expired entries and trim the cache down to `max_bytes`"""
+        now = time.time()
+        entries = []
+        for dentry in os.scandir(self.path):
+            if dentry.name.startswith('.') or not dentry.is_file():
+                continue
+            try:
+                stat = dentry.stat()
+                if now - stat.st_mtime > self.max_age:
+                    _remove(dentry.path)
+                    continue
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, dentry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            _remove(path)
+            total -= size
+
+    def template_body(self, stack, render, fmt='yaml'):
+        """
+        Return the rendered template of `stack`, calling `render()` only if
+        there is no cached copy.
+        """
+        base = stack_fingerprint(stack, fmt)
+        lookups = self.get('%s.lookups' % base)
+        if lookups is not None:
+            try:
+                resolved = {key: stack.resolve_lookup(*json.loads(key))
+                            for key in json.loads(lookups)}
+            except (ValueError, RuntimeError):
+                # Unreadable, or no longer resolvable - let the render tell
+                resolved = None
+            if resolved is not None:
+                body = self.get(_lookups_key(base, resolved, fmt))
+                if body is not None:
+                    self.hits += 1
+                    return body
+        self.misses += 1
+        resolved = stack._resolved = {}
+        try:
+            body = render()
+        finally:
+            del stack._resolved
+        self.put('%s.lookups' % base, json.dumps(sorted(resolved)))
+        self.put(_lookups_key(base, resolved, fmt), body)
+        return body
@@ -1,12 +1,99 @@
+import os
+import sys
 import time
 import argparse
-from datetime import datetime, timedelta, timezone
 
-import botocore
-import boto3
-import tabulate
+from . import instrument
+from .aws import ClientProvider
+from .budget import TemplateBudget, UnboundedTemplate
+from .cache import TemplateCache, cache_dir
+from .conf_loaders import partitioned_yaml_loader, PartitionedConfig
+from .diff import diff_templates, load_template
+from .events import (Backoff, JsonLinesSink, StackEventTailer,
+                     TableSink)
+from .incremental import IncrementalCompiler
+from .nested import NestedSplit
+from .ratelimit import RateLimiter, is_throttling
+from .serialize import to_json, to_yaml
+from .transport import TemplateTransport
+
+
+def _csv_list(value):
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def _tabulate(*args, **kwargs):
+    # Imported on use, keeping it off the startup path of the CLI
+    import tabulate
+    return tabulate.tabulate(*args, **kwargs)
+
+
+class StatusPoller():
+    """
+    The polling state of one wait on a stack operation - shared by
+    `InlineConfCLI.print_status_while` and its coroutine counterpart in
+    `tropostack.aio`, which only differ in how they sleep between steps.
+
+    Args:
+        cli (InlineConfCLI): CLI of the stack, for its options and output
+        cfn: CloudFormation client
+        status (str): Stack status to wait on
+        poll_sec (int): Longest interval between steps
+    """
+    def __init__(self, cli, cfn, status, poll_sec=20):
+        self.cli = cli
+        self.cfn = cfn
+        self.status = status
+        self.tailer = StackEventTailer(cfn, cli.stackname)
+        self.backoff = Backoff(min_sec=cli.POLL_MIN_SEC, max_sec=poll_sec)
+        self.sink = cli.event_sink()
+        self.last_status = None
+
+    def step(self):
+        """
+        Check the stack status and report any new events - blocking.
+
+        Returns:
+            float: Seconds to wait before the next step, or None once the
+            stack has left `status`
+        """
+        import botocore.exceptions
+        quiet = self.cli.args.quiet
+        try:
+            # Check the status before fetching events, so that the events
+            # leading up to a status change are always printed
+            aws_stack = self.cli._aws_stack(self.cfn, exc=False)
+            # Tail the events by stack ID, which keeps working once the
+            # stack is deleted
+            self.tailer.stackname = aws_stack.get('StackId',
+                                                  self.tailer.stackname)
+            stack_status = aws_stack.get('StackStatus')
+            done = stack_status != self.status
+            changed = stack_status != self.last_status
+            self.last_status = stack_status
+            new = []
+            if changed or not quiet:
+                new = self.tailer.poll()
+        except botocore.exceptions.ClientError as err:
+            if is_throttling(err):
+                # Still throttled after botocore's retries - poll less often
+                # and carry on
+                self.cli.debug('Throttled while polling: %s' % err)
+                self.backoff.idle()
+                return self.backoff.delay()
+            # stack might have disappeared in the meantime
+            self.cli.echo("Stack is gone: {} ({})".format(
+                self.cli.stackname, err))
+            return None
+        if new or (changed and quiet):
+            self.backoff.reset()
+        else:
+            self.backoff.idle()
+        self.sink.emit(self.cli.stackname, self.cli.stack.region, new)
+        if done:
+            return None
+        return self.backoff.delay()
 
-from .conf_loaders import partitioned_yaml_loader
 
 class InlineConfCLI():
     """
@@ -14,6 +101,16 @@ class InlineConfCLI():
     to be hardcoded in the Tropostack class.
     """
     _CMD_PREFIX = 'cmd_'
+    # Fastest stack event polling rate, used while resources are changing
+    POLL_MIN_SEC = 2
+    # AWS client settings - see `tropostack.aws.ClientProvider`
+    AWS_RETRY_MODE = 'standard'
+    AWS_MAX_ATTEMPTS = None
+    AWS_MAX_POOL_CONNECTIONS = 10
+    # API calls per second, per service and region - unlimited if None
+    AWS_MAX_RATE = None
+    # Most resources per child stack with `--split-nested`
+    NESTED_MAX_RESOURCES = 200
 
     def __init__(self, stack_cls):
         """Initialize the class and te_terun it as a CLI command"""
@@ -26,6 +123,26 @@ class InlineConfCLI():
         # Save the command method picked via CLI
         self.run_method = getattr(self, self._CMD_PREFIX + self.args.command)
 
+    @classmethod
+    def for_stack(cls, stack, command=None, **options):
+        """
+        Build a CLI instance around an already instantiated stack, bypassing
+        command-line parsing. Any CLI option not given in `options` takes its
+        argparse default.
+        """
+        cli = cls.__new__(cls)
+        parser = cli.argparser()
+        defaults = {action.dest: action.default for action in parser._actions
+                    if action.dest != 'help'}
+        defaults.update(command=command, **options)
+        cli.args = argparse.Namespace(**defaults)
+        cli.stack = stack
+        cli.stackname = stack.stackname
+        cli.run_method = None
+        if command:
+            cli.run_method = getattr(cli, cls._CMD_PREFIX + command)
+        return cli
+
     # CLI Management
     def argparser(self):
         """Generate the ArgumentParser instance to parse CLI arguments"""
@@ -37,13 +154,211 @@ class InlineConfCLI():
                       and callable(getattr(self, mth))
                       ]
         parser.add_argument('command',  choices=class_cmds)
+        parser.add_argument('-v', '--verbose', action='store_true',
+                            help='Report diagnostics on stderr')
+        parser.add_argument('--cache', action='store_true',
+                            help='Reuse templates compiled from the same '
+                                 'stack source and configuration')
+        parser.add_argument('--incremental', action='store_true',
+                            help='Only rebuild the stack members whose '
+                                 'configuration inputs changed since the '
+                                 'last compile')
+        parser.add_argument('--offline', action='store_true',
+                            help='Fail on AMI and stack output lookups '
+                                 'missing from the cache instead of calling '
+                                 'the AWS API')
+        parser.add_argument('--split-nested', action='store_true',
+                            help='Deploy templates over the CloudFormation '
+                                 'limits as nested stacks (needs a template '
+                                 'bucket)')
+        parser.add_argument('--template-bucket',
+                            default=os.environ.get(
+                                'TROPOSTACK_TEMPLATE_BUCKET'),
+                            help='S3 bucket for templates too large to be '
+                                 'passed inline')
+        parser.add_argument('--regions', type=_csv_list,
+                            help='Run the command in each of these regions '
+                                 '(comma-separated), in parallel')
+        parser.add_argument('--role-arn', dest='role_arns', action='append',
+                            help='Run the command in the accounts of these '
+                                 'roles, in parallel; may be repeated')
+        parser.add_argument('--fanout-workers', type=int, default=8,
+                            help='Maximum number of regions/accounts '
+                                 'processed in parallel')
+        parser.add_argument('--max-api-rate', type=float,
+                            default=self.AWS_MAX_RATE, metavar='CALLS',
+                            help='Limit AWS API calls per second, per '
+                                 'service and region; throttling responses '
+                                 'lower the rate further')
+        parser.add_argument('--shared-rate-limit', action='store_true',
+                            help='Share the --max-api-rate budget with other '
+                                 'tropostack processes on this machine')
+        parser.add_argument('--events', choices=('table', 'json'),
+                            default='table',
+                            help='Stack event output: a table, or one JSON '
+                                 'object per line')
+        parser.add_argument('--quiet', action='store_true',
+                            help='While waiting on the stack, only poll its '
+                                 'status and fetch the events when it '
+                                 'changes - fewer API calls, e.g. for CI')
+        parser.add_argument('--profile', action='store_true',
+                            help='Print a timing breakdown of the compile '
+                                 'and deploy phases on stderr')
+        parser.add_argument('--trace-file',
+                            help='Write a Chrome trace-event JSON file of '
+                                 'the compile and deploy phases')
         return parser
 
     def run(self):
         """
         Let the CLI command take over.
         """
-        self.run_method()
+        if self.args.offline:
+            self.stack._ami_resolver().offline = True
+            self.stack._output_resolver().offline = True
+        # Hand the stack the CLI's clients, rate limited, before it compiles
+        self.stack.aws = self.aws
+        profiler = None
+        if self.args.profile or self.args.trace_file:
+            profiler = instrument.Profiler()
+            instrument.register(profiler)
+        try:
+            if self.args.regions or self.args.role_arns:
+                return self.fan_out()
+            with instrument.span(instrument.PHASE, self.args.command):
+                self.run_method()
+        finally:
+            if profiler is not None:
+                instrument.unregister(profiler)
+                self.report_profile(profiler)
+            self.report_rate_limits()
+
+    def report_rate_limits(self):
+        """Output the API call and throttling counts, in verbose mode"""
+        provider = self.__dict__.get('_aws')
+        limiter = getattr(provider, 'rate_limiter', None)
+        if limiter is None or not limiter.stats():
+            return
+        self.debug(_tabulate(limiter.stats(), headers=[
+            'SERVICE', 'REGION', 'CALLS', 'THROTTLED', 'WAITED (s)'],
+            floatfmt='.2f'))
+
+    def report_profile(self, profiler):
+        """Output the timings gathered with `--profile`/`--trace-file`"""
+        if self.args.profile:
+            print(profiler.report(), file=sys.stderr)
+        if self.args.trace_file:
+            profiler.write_trace(self.args.trace_file)
+            print('Trace written to: %s' % self.args.trace_file,
+                  file=sys.stderr)
+
+    def fan_out(self):
+        """
+        Run the command across all `--regions` (the stack region by default)
+        and `--role-arn` accounts, reporting the results in a single table.
+
+        Raises:
+            RuntimeError: If the command failed for any target
+        """
+        from .fanout import FanOut, OK, target_label
+        regions = self.args.regions or [self.stack.region]
+        fanout = FanOut(self, regions, self.args.role_arns,
+                        max_workers=self.args.fanout_workers)
+        results = fanout.run(self.args.command)
+        failed = [target_label(target) for target, res in results.items()
+                  if res != OK]
+        if failed:
+            raise RuntimeError('Command failed for: %s' % ', '.join(failed))
+
+    def echo(self, msg):
+        """
+        Report progress to the user - on stderr with ``--events json``, which
+        keeps stdout to the JSON event lines
+        """
+        if getattr(self.args, 'events', None) == 'json':
+            print(msg, file=sys.stderr)
+        else:
+            print(msg)
+
+    def debug(self, msg):
+        """Report diagnostics, in verbose mode only"""
+        if self.args.verbose:
+            print(msg, file=sys.stderr)
+
+    def template_body(self):
+        """
+        Render the stack template as YAML. With `--cache`, compilation is
+        skipped if the stack source and configuration are unchanged. With
+        `--incremental`, only the members whose inputs changed are rebuilt.
+        """
+        if not self.args.cache:
+            return self._render()
+        cache = getattr(self, '_template_cache', None)
+        if cache is None:
+            cache = self._template_cache = TemplateCache()
+        body = cache.template_body(self.stack, self._render)
+        self.debug('Template cache: %d hit(s), %d miss(es)'
+                   % (cache.hits, cache.misses))
+        return body
+
+    def _render(self):
+        # Templates over the resource limit get split up later on
+        template = UnboundedTemplate() if self.split_nested else None
+        if not self.args.incremental:
+            return to_yaml(self.stack.compile(template))
+        compiler = getattr(self, '_incremental', None)
+        if compiler is None:
+            compiler = self._incremental = IncrementalCompiler(
+                cache_dir('fragments'))
+        template = compiler.compile(self.stack, template)
+        self.debug('Incremental compile: %d member(s) rebuilt, %d reused'
+                   % (len(compiler.rebuilt), len(compiler.reused)))
+        return to_yaml(template)
+
+    def template_args(self, template_body):
+        """
+        API call arguments passing the template on to CloudFormation - either
+        inline or via S3, depending on its size.
+        """
+        transport = self._transport()
+        if self.split_nested:
+            template_body = self._split_nested(transport, template_body)
+        return transport.template_args(template_body)
+
+    def _transport(self):
+        return TemplateTransport(
+            self.aws, bucket=self.args.template_bucket,
+            region=self.stack.region)
+
+    @property
+    def split_nested(self):
+        """
+        Whether the stack gets deployed as nested stacks - with
+        ``--split-nested`` or `BaseStack.SPLIT_NESTED`. This holds whatever
+        the template size, as moving resources between a flat and a nested
+        stack replaces them.
+        """
+        return self.args.split_nested or self.stack.SPLIT_NESTED
+
+    def _nested_split(self, template):
+        """`NestedSplit` of `template`"""
+        return NestedSplit(template, max_resources=self.NESTED_MAX_RESOURCES)
+
+    def _split_nested(self, transport, template_body, upload=True):
+        """
+        Parent template body of nested stacks holding the resources of
+        `template_body`, which get uploaded to the template bucket - or only
+        addressed there, if not `upload`.
+        """
+        split = self._nested_split(load_template(template_body))
+        if not transport.bucket:
+            raise RuntimeError('Nested stacks need a template bucket')
+        store = transport.upload if upload else transport.url
+        urls = {name: store(to_json(child))
+                for name, child in split.children.items()}
+        if upload:
+            self.echo('Template split into %d nested stacks' % len(urls))
+        return to_yaml(split.parent(urls))
 
     # CloudFormation helper funcs
 
@@ -52,159 +367,314 @@ class InlineConfCLI():
         Wrapper around boto3.describe_stacks. Raises RuntimeError if `exc` is
         True and error is encountered. Returns an empty dict otherwise.
         """
+        import botocore.exceptions
         try:
             resp = cfn.describe_stacks(StackName=self.stackname)
-        except botocore.exceptions.ClientError:
+        except botocore.exceptions.ClientError as err:
+            # Not a sign of the stack missing
+            if is_throttling(err):
+                raise
             if exc:
                 raise RuntimeError('Stack "%s" not found' % self.stackname)
             else:
                 return {}
         return resp['Stacks'][0]
 
+    @property
+    def aws(self):
+        """
+        `tropostack.aws.ClientProvider` shared by all commands and the stack.
+        May be replaced, e.g. to share clients between several CLI instances.
+        """
+        if self.__dict__.get('_aws') is None:
+            limiter = None
+            if self.args.max_api_rate:
+                limiter = RateLimiter(self.args.max_api_rate,
+                                      shared=self.args.shared_rate_limit)
+            # Adopt the provider of the stack, if it has already set one up
+            provider = self.stack.__dict__.get('_aws')
+            if provider is None:
+                provider = ClientProvider(
+                    region=self.stack.region,
+                    retry_mode=self.AWS_RETRY_MODE,
+                    max_attempts=self.AWS_MAX_ATTEMPTS,
+                    max_pool_connections=self.AWS_MAX_POOL_CONNECTIONS,
+                    rate_limiter=limiter)
+            elif limiter is not None and isinstance(provider, ClientProvider) \
+                    and provider.rate_limiter is None:
+                provider.limit_rate(limiter)
+            self.aws = provider
+        return self._aws
+
+    @aws.setter
+    def aws(self, provider):
+        self._aws = provider
+        self.stack.aws = provider
+
     def _cfn_conn(self):
         """
         Wrapper around CloudFormation connection establishing.
 
         Takes a region from the stack instance, if available.
         """
-        return boto3.client('cloudformation', region_name=self.stack.region)
+        return self.aws.client('cloudformation', region=self.stack.region)
 
 
-    def print_status_while(self, cfn, status, poll_sec=10):
+    def print_status_while(self, cfn, status, poll_sec=20):
         """
         Keep on polling and printing stack events while the stack is in the
         given state. Try to simulate CloudFormation experience in terminal.
+
+        Polling is fast while events keep coming in and backs off up to
+        `poll_sec` seconds while the stack is quiet.
+
+        With ``--quiet``, only the stack status is polled, backing off the
+        same way, and the events are fetched when it changes - failures
+        included, as they move the stack to a rollback or failed status.
+        The same events get reported, in fewer and larger batches.
         """
-        # get a TZ-aware marker, going back a couple of seconds
-        seen = datetime.now(timezone.utc) - timedelta(seconds=3)
-        hdr = ['TIMESTAMP (UTC)', 'RESOURCE TYPE',
-               'RESOURCE ID', 'STATUS', 'REASON']
-        hdr_printed = False
-        tabs = '{0:<24} {1:<42} {2:<28} {3:<40} {4}'
-        while True:
-            try:
-                ev_resp = cfn.describe_stack_events(StackName=self.stackname)
-            except botocore.exceptions.ClientError as err:
-                # stack might have disappeared in the meantime
-                print("Stack is gone: {} ({})".format(self.stackname, err))
-                return
-            # Events sorted by timestamp
-            s_ev = sorted(ev_resp['StackEvents'], key=lambda x: x['Timestamp'])
-            new = list(ev for ev in s_ev if ev['Timestamp'] > seen)
-            if new:
-                seen = new[-1]['Timestamp']
-            else:
-                continue
-
-            if hdr and not hdr_printed:
-                print(tabs.format(*hdr))
-                hdr_printed = True
-            for ev in new:
-                print(tabs.format(
-                    ev['Timestamp'].strftime('%Y-%m-%d %H:%M:%S'),
-                    ev['ResourceType'],
-                    ev['LogicalResourceId'],
-                    ev['ResourceStatus'],
-                    ev.get('ResourceStatusReason', '')
-                ))
-            if self._aws_stack(cfn, exc=False).get('StackStatus') != status:
-                break
-            time.sleep(poll_sec)
+        with instrument.span(instrument.PHASE, 'wait %s' % status):
+            self._print_status_while(cfn, status, poll_sec)
+
+    def _print_status_while(self, cfn, status, poll_sec):
+        poller = StatusPoller(self, cfn, status, poll_sec)
+        try:
+            delay = poller.step()
+            while delay is not None:
+                time.sleep(delay)
+                delay = poller.step()
+        finally:
+            poller.sink.flush()
+
+    def event_sink(self):
+        """
+        `tropostack.events.EventSink` reporting the events of one stack
+        operation, as chosen by ``--events``
+        """
+        if self.args.events == 'json':
+            return JsonLinesSink()
+        return TableSink(self.echo)
 
     # Base CloudFormation commands
     def cmd_print(self):
         """Print out the generated stack"""
-        print(self.stack.compile().to_yaml())
+        print(self.template_body())
 
 
+    def cmd_budget(self):
+        """Reports the template size and counts against the service limits"""
+        template = self.stack.compile(UnboundedTemplate()).to_dict()
+        budget = TemplateBudget(template)
+        self.echo(budget.report())
+        for problem in budget.over_limits():
+            self.echo('Over the limits - %s' % problem)
+        split = self._nested_split(template) if self.split_nested else None
+        if split:
+            rows = [[name, len(child['Resources']), tmpl.body_bytes,
+                     len(child.get('Parameters', {})),
+                     len(child.get('Outputs', {}))]
+                    for (name, child), tmpl in zip(
+                        split.children.items(), split.budgets().values())]
+            self.echo(_tabulate(rows, headers=[
+                'NESTED STACK', 'RESOURCES', 'BYTES', 'PARAMETERS',
+                'OUTPUTS']))
+
     def cmd_validate(self):
         """Validates the generated stack against the CloudFormation API"""
-        cfn = boto3.client('cloudformation', region_name=self.stack.region)
-        template_body = self.stack.compile().to_yaml()
-        resp = cfn.validate_template(TemplateBody=template_body)
+        cfn = self._cfn_conn()
+        template_body = self.template_body()
+        resp = cfn.validate_template(**self.template_args(template_body))
         status = resp.get('ResponseMetadata', {}).get('HTTPStatusCode', '')
         if status == 200:
-            print('Validation OK')
+            self.echo('Validation OK')
         else:
             raise RuntimeError('Validation failed! Response:\n%s' % resp)
 
     def cmd_create(self):
         """Creates the stack YAML"""
-        cfn = boto3.client('cloudformation', region_name=self.stack.region)
-        template_body = self.stack.compile().to_yaml()
+        cfn = self._cfn_conn()
+        self._create_stack(cfn, self.template_body())
+        self.print_status_while(cfn, 'CREATE_IN_PROGRESS')
+
+    def _create_stack(self, cfn, template_body):
         resp = cfn.create_stack(
             StackName=self.stackname,
-            TemplateBody=template_body,
             Capabilities=self.stack.CFN_CAPS,
-            Tags=self.stack.tags
+            Tags=self.stack.tags,
+            **self.template_args(template_body)
         )
         status = resp.get('ResponseMetadata', {}).get('HTTPStatusCode', '')
         if status == 200:
-            print('Stack creation initiated for: %s' % resp['StackId'])
-            self.print_status_while(cfn, 'CREATE_IN_PROGRESS')
+            self.echo('Stack creation initiated for: %s' % resp['StackId'])
         else:
             raise RuntimeError('Creation failed! Response:\n%s' % resp)
+        return resp
 
     def cmd_update(self, exc_on_noop=True):
         """
         Updates the stack YAML. In case `exc_on_noop` is set to False, then the
         exception that's normally raised if there is nothing to update will be
         swallowed instead of propagated.
+
+        The deployed template is compared against the compiled one locally
+        first, so no-op updates end without any further API calls. Actual
+        changes go through a change set, whose plan is printed before it is
+        executed.
         """
-        cfn = boto3.client('cloudformation', region_name=self.stack.region)
+        cfn = self._cfn_conn()
         # Verify stack exists first
-        self._aws_stack(cfn, exc=True)
-        template_body = self.stack.compile().to_yaml()
+        aws_stack = self._aws_stack(cfn, exc=True)
+        template_body = self.template_body()
+        changes = self._template_changes(cfn, template_body)
+        if not changes and not self._tags_changed(aws_stack):
+            return self._update_noop(exc_on_noop)
 
-        try:
-            resp = cfn.update_stack(
-                StackName=self.stackname,
-                TemplateBody=template_body,
-                Capabilities=self.stack.CFN_CAPS,
-                Tags=self.stack.tags
-            )
-        except botocore.exceptions.ClientError as err:
-            # Porcelain! Depends on AWS response message to detect the case
-            if not exc_on_noop and 'no updates' in err.args[0].lower():
-                print('No updates to be performed for: %s' % self.stackname)
-                return
+        cs_id = self._create_change_set(cfn, template_body)
+        while True:
+            change_set = self._describe_change_set(cfn, cs_id)
+            if change_set['Status'] not in self._CS_PENDING:
+                break
+            time.sleep(self.POLL_MIN_SEC)
+        if self._change_set_noop(cfn, change_set, cs_id):
+            return self._update_noop(exc_on_noop)
+        self._execute_change_set(cfn, change_set, cs_id)
+        self.print_status_while(cfn, 'UPDATE_IN_PROGRESS')
+
+    def _template_changes(self, cfn, template_body):
+        """
+        Structural diff between the deployed and the given template - or,
+        for nested stacks, the parent template it is split into. Nested
+        templates are addressed by content, so that changes to them show as
+        changed parent resources.
+        """
+        if self.split_nested:
+            template_body = self._split_nested(self._transport(),
+                                               template_body, upload=False)
+        resp = cfn.get_template(StackName=self.stackname,
+                                TemplateStage='Original')
+        return diff_templates(load_template(resp['TemplateBody']),
+                              load_template(template_body))
+
+    def _tags_changed(self, aws_stack):
+        old_tags = {(tag['Key'], tag['Value'])
+                    for tag in aws_stack.get('Tags', [])}
+        new_tags = {(tag['Key'], tag['Value']) for tag in self.stack.tags}
+        return old_tags != new_tags
+
+    def _update_noop(self, exc_on_noop):
+        msg = 'No updates to be performed for: %s' % self.stackname
+        if exc_on_noop:
+            raise RuntimeError(msg)
+        self.echo(msg)
+
+    # Change set states that are not final yet
+    _CS_PENDING = ('CREATE_PENDING', 'CREATE_IN_PROGRESS')
+
+    def _create_change_set(self, cfn, template_body):
+        """Request an update change set, returning its ID"""
+        cs_name = time.strftime('tropostack-%Y%m%d%H%M%S', time.gmtime())
+        resp = cfn.create_change_set(
+            StackName=self.stackname,
+            ChangeSetName=cs_name,
+            ChangeSetType='UPDATE',
+            Capabilities=self.stack.CFN_CAPS,
+            Tags=self.stack.tags,
+            **self.template_args(template_body)
+        )
+        return resp['Id']
+
+    def _describe_change_set(self, cfn, cs_id):
+        """
+        Returns:
+            dict: The `describe_change_set` response, with all pages of
+            changes merged under ``Changes``
+        """
+        pages = cfn.get_paginator('describe_change_set').paginate(
+            ChangeSetName=cs_id)
+        change_set = None
+        for page in pages:
+            if change_set is None:
+                change_set = page
+                if page['Status'] in self._CS_PENDING:
+                    break
             else:
-                raise
-        status = resp.get('ResponseMetadata', {}).get('HTTPStatusCode', '')
-        if status == 200:
-            print('Stack update initiated for:%s' % resp['StackId'])
-            self.print_status_while(cfn, 'UPDATE_IN_PROGRESS')
-        else:
-            raise RuntimeError('Update failed! Response:\n%s' % resp)
+                change_set['Changes'].extend(page.get('Changes', []))
+        return change_set
+
+    def _change_set_noop(self, cfn, change_set, cs_id):
+        """
+        Tell whether a finished change set failed for lack of changes.
+        Raises RuntimeError if it failed for any other reason. Failed change
+        sets get deleted either way, so that they do not pile up on the
+        stack.
+        """
+        if change_set['Status'] == 'CREATE_COMPLETE':
+            return False
+        cfn.delete_change_set(ChangeSetName=cs_id)
+        reason = change_set.get('StatusReason', '')
+        # Porcelain! Depends on AWS response message to detect the case
+        if "didn't contain changes" in reason \
+                or 'no updates' in reason.lower():
+            return True
+        raise RuntimeError('Change set creation failed: %s' % reason)
+
+    def _execute_change_set(self, cfn, change_set, cs_id):
+        """Print the plan of the change set, then execute it"""
+        self.echo(_tabulate(
+            [[chg['ResourceChange']['Action'],
+              chg['ResourceChange']['LogicalResourceId'],
+              chg['ResourceChange']['ResourceType'],
+              chg['ResourceChange'].get('Replacement', '')]
+             for chg in change_set.get('Changes', [])],
+            headers=['ACTION', 'RESOURCE ID', 'RESOURCE TYPE', 'REPLACEMENT']))
+        cfn.execute_change_set(ChangeSetName=cs_id)
+        self.echo('Stack update initiated for: %s' % self.stackname)
 
     def cmd_delete(self):
         """Deletes the stack and the associated resources"""
-        cfn = boto3.client('cloudformation', region_name=self.stack.region)
+        cfn = self._cfn_conn()
         # Verify stack exists first
         self._aws_stack(cfn, exc=True)
+        self._delete_stack(cfn)
+        self.print_status_while(cfn, 'DELETE_IN_PROGRESS')
+
+    def _delete_stack(self, cfn):
         resp = cfn.delete_stack(StackName=self.stackname)
         status = resp.get('ResponseMetadata', {}).get('HTTPStatusCode', '')
         if status == 200:
-            print('Destroy initiated for stack: %s' % self.stackname)
-            self.print_status_while(cfn, 'DELETE_IN_PROGRESS')
+            self.echo('Destroy initiated for stack: %s' % self.stackname)
         else:
             raise RuntimeError('Update failed! Response:\n%s' % resp)
 
+    def cmd_diff(self):
+        """Shows how the generated stack differs from the deployed one"""
+        cfn = self._cfn_conn()
+        # Verify stack exists first
+        self._aws_stack(cfn, exc=True)
+        changes = self._template_changes(cfn, self.template_body())
+        if changes:
+            self.echo(_tabulate(
+                changes, headers=['ACTION', 'SECTION', 'NAME']))
+        else:
+            self.echo('No template changes for: %s' % self.stackname)
+
     def cmd_outputs(self):
         """Prints out the stack outputs"""
-        cfn = boto3.client('cloudformation', region_name=self.stack.region)
-        stack = self._aws_stack(cfn, exc=True)
-        outs = stack.get('Outputs')
-        status = stack.get('StackStatus')
-        print('Stack is in status: %s' % status)
+        cfn = self._cfn_conn()
+        self._echo_outputs(self._aws_stack(cfn, exc=True))
+
+    def _echo_outputs(self, aws_stack):
+        outs = aws_stack.get('Outputs')
+        status = aws_stack.get('StackStatus')
+        self.echo('Stack is in status: %s' % status)
         if outs:
-            print(tabulate.tabulate(outs, headers="keys"))
+            self.echo(_tabulate(outs, headers="keys"))
         else:
-            print('No outputs')
+            self.echo('No outputs')
 
     def cmd_apply(self):
         """Creates the stack if it does not exists, otherwise updates it"""
-        cfn = boto3.client('cloudformation', region_name=self.stack.region)
+        cfn = self._cfn_conn()
         # Verify stack exists first
         resp = self._aws_stack(cfn, exc=False)
         if resp:
@@ -248,14 +718,25 @@ class InlineConfOvrdCLI(InlineConfCLI):
 class EnvCLI(InlineConfCLI):
     CONF_FUNC = partitioned_yaml_loader
 
-    def __init__(self, stack_cls):
-        """Initialize the class and run it as a CLI command"""
+    def __init__(self, stack_cls, conf=None):
+        """
+        Initialize the class and run it as a CLI command. An already loaded
+        `tropostack.conf_loaders.PartitionedConfig` can be passed as `conf`,
+        instead of reading a config file given on the command line.
+        """
+        self.conf_source = conf
         # Parse the CLI arguments
         self.args = self.argparser().parse_args()
-        # Use the loader function to render a config based on the CLI config
-        # Translates as "from this file,  extract the config for BASE_NAME"
-        self.conf = self.__class__.CONF_FUNC(
-            self.args.conf_file, stack_cls.BASE_NAME,)
+        if isinstance(conf, PartitionedConfig) and not self.args.conf_file:
+            # Use a view of the shared config, without copying it, with a
+            # layer of its own on top for the values the stack sets
+            self.conf = conf.stack_conf(stack_cls.BASE_NAME).new_child()
+        else:
+            # Use the loader function to render a config based on the CLI
+            # config. Translates as "from this file, extract the config for
+            # BASE_NAME"
+            self.conf = self.__class__.CONF_FUNC(
+                self.args.conf_file or conf, stack_cls.BASE_NAME,)
         # Generate a stack instance using the rendered config
         self.stack = stack_cls(self.conf)
         # Create a shortcut to the stackname
@@ -266,5 +747,8 @@ class EnvCLI(InlineConfCLI):
     def argparser(self):
         """Add parameter for config file"""
         parser = super().argparser()
-        parser.add_argument('conf_file', type=argparse.FileType('r'))
-        return parser
\ No newline at end of file
+        # The file is optional if a configuration was passed in already
+        nargs = '?' if self.__dict__.get('conf_source') is not None else None
+        parser.add_argument('conf_file', type=argparse.FileType('r'),
+                            nargs=nargs)
+        return parser
@@ -1,12 +1,71 @@
 """
 Configuration loading routines
 """
+from collections import ChainMap
 from collections.abc import Mapping
+from types import MappingProxyType
 
 import yaml
 
 from tropostack.exceptions import ConfigLoadError
 
+# Prefer the libyaml-backed loader, which is many times faster
+try:
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader
+
+
+class PartitionedConfig():
+    """
+    A partitioned configuration (see `partitioned_yaml_loader`), parsed once
+    and shared between any number of stacks.
+
+    The inherited top-level values are collected up front. Per-stack configs
+    are handed out as read-only views over the parsed document, without
+    copying any data; stacks get them through ``ChainMap.new_child()``, so
+    that they can still set values of their own.
+
+    Args:
+        full_conf (dict): The complete configuration mapping
+
+    Raises:
+        tropostack.exceptions.ConfigLoadError: When the structure is invalid
+
+    Usage:
+    >>> config = PartitionedConfig.load(open('dev.yml'))
+    >>> config.stack_conf('stack-bar')['stackvar']
+    'bar'
+    """
+    def __init__(self, full_conf):
+        if not isinstance(full_conf, Mapping):
+            raise ConfigLoadError('Top-level configuration must be a mapping')
+        self.full_conf = full_conf
+        # Only non-mapping values get "inherited"
+        self.inherited = MappingProxyType({
+            key: value for key, value in full_conf.items()
+            if not isinstance(value, Mapping)
+        })
+
+    @classmethod
+    def load(cls, fhandle):
+        """Parse the YAML document in `fhandle`"""
+        try:
+            full_conf = yaml.load(fhandle, Loader=_YamlLoader)
+        except yaml.YAMLError as exc:
+            raise ConfigLoadError('YAML Parsing failed: %s' % exc)
+        return cls(full_conf)
+
+    def stack_conf(self, stack_basename):
+        """
+        Read-only configuration view for the given stack: the inherited
+        top-level values, overridden by the `stack_basename` mapping.
+        """
+        stack_tree = self.full_conf.get(stack_basename, {})
+        if not isinstance(stack_tree, Mapping):
+            raise ConfigLoadError('Stack-specific config must be a mapping')
+        return ChainMap(MappingProxyType(stack_tree), self.inherited)
+
 
 def partitioned_yaml_loader(fhanlde, stack_basename):
     """
@@ -16,7 +75,8 @@ def partitioned_yaml_loader(fhanlde, stack_basename):
     as `stack_basename`
 
     Args:
-        fhandle (file): A file-handle-compatible stream
+        fhandle (file): A file-handle-compatible stream, or an already
+            loaded `PartitionedConfig`
         stack_basename (str): Base name of the stack to be configured
 
     Returns:
@@ -41,19 +101,24 @@ def partitioned_yaml_loader(fhanlde, stack_basename):
 
 
     """
-    try:
-        full_conf = yaml.safe_load(fhanlde)
-    except yaml.YAMLError as exc:
-        raise ConfigLoadError('YAML Parsing failed: %s' % exc)
-    stack_conf = {}
-    if not isinstance(full_conf, Mapping):
-        raise ConfigLoadError('Top-level configuration must be a mapping')
-    for key, value in full_conf.items():
-        if not isinstance(value, Mapping):
-            # Only non-mapping values get "inherited"
-            stack_conf[key] = value
-    stack_tree = full_conf.get(stack_basename, {})
-    if not isinstance(stack_tree, Mapping):
-        raise ConfigLoadError('Stack-specific config must be a mapping')
-    stack_conf.update(stack_tree)
-    return stack_conf
+    if not isinstance(fhanlde, PartitionedConfig):
+        fhanlde = PartitionedConfig.load(fhanlde)
+    return dict(fhanlde.stack_conf(stack_basename))
+
+
+def partition_conf(full_conf, stack_basename):
+    """
+    Flatten an already-parsed partitioned configuration for a single stack,
+    following the rules of `partitioned_yaml_loader`.
+
+    Args:
+        full_conf (dict): The complete configuration mapping
+        stack_basename (str): Base name of the stack to be configured
+
+    Returns:
+        dict: Flattened configuration dict pertinent to the specific stack
+
+    Raises:
+        tropostack.exceptions.ConfigLoadError: When the structure is invalid
+    """
+    return dict(PartitionedConfig(full_conf).stack_conf(stack_basename))
@@ -0,0 +1,57 @@
+"""
+Structural comparison of CloudFormation templates
+"""
+from collections.abc import Mapping
+
+import cfn_flip
+
+# Template sections holding named elements, compared element by element
+_NAMED_SECTIONS = ('Parameters', 'Mappings', 'Conditions', 'Resources',
+                   'Outputs')
+
+
+def _plain(obj):
+    # Ordered mappings compare order-sensitively - normalize to plain dicts
+    if isinstance(obj, Mapping):
+        return {key: _plain(value) for key, value in obj.items()}
+    if isinstance(obj, list):
+        return [_plain(value) for value in obj]
+    return obj
+
+
+def load_template(body):
+    """
+    Parse a template body (JSON or YAML, short-form tags included) into
+    plain Python structures with long-form intrinsic functions.
+    """
+    if isinstance(body, Mapping):
+        return _plain(body)
+    data, _ = cfn_flip.load(body)
+    return _plain(data)
+
+
+def diff_templates(old, new):
+    """
+    Compare two parsed templates.
+
+    Returns:
+        list: ``(action, section, name)`` tuples, where action is one of
+        ``Add``, ``Modify`` or ``Remove``. `name` is empty for sections
+        compared as a whole (e.g. ``Description``).
+    """
+    changes = []
+    for section in sorted(set(old) | set(new)):
+        old_sect = old.get(section, {})
+        new_sect = new.get(section, {})
+        if section not in _NAMED_SECTIONS:
+            if old_sect != new_sect:
+                changes.append(('Modify', section, ''))
+            continue
+        for name in sorted(set(old_sect) | set(new_sect)):
+            if name not in old_sect:
+                changes.append(('Add', section, name))
+            elif name not in new_sect:
+                changes.append(('Remove', section, name))
+            elif old_sect[name] != new_sect[name]:
+                changes.append(('Modify', section, name))
+    return changes
@@ -0,0 +1,58 @@
+"""
+Locating stack classes by their import path
+"""
+import importlib
+import inspect
+import os
+
+from tropostack.base import BaseStack
+
+
+def module_stacks(module):
+    """
+    List the concrete stack classes defined in `module` - i.e. those declared
+    in the module itself and having a `BASE_NAME`.
+    """
+    return [
+        obj for _, obj in inspect.getmembers(module, inspect.isclass)
+        if issubclass(obj, BaseStack) and obj.BASE_NAME
+        and obj.__module__ == module.__name__
+    ]
+
+
+def _submodules(paths, prefix):
+    """
+    Names of the modules under the package directories `paths`, found by
+    scanning the file system - so that, unlike `pkgutil.walk_packages`,
+    directories without an ``__init__.py`` (namespace packages) are covered.
+    """
+    for path in paths:
+        for entry in sorted(os.scandir(path), key=lambda entry: entry.name):
+            name, ext = os.path.splitext(entry.name)
+            if not name.isidentifier() or name.startswith('__'):
+                continue
+            if entry.is_dir() and not ext:
+                yield prefix + name
+                yield from _submodules([entry.path], prefix + name + '.')
+            elif entry.is_file() and ext == '.py':
+                yield prefix + name
+
+
+def find_stacks(spec):
+    """
+    Import stack classes given a ``module:Class`` or ``module`` spec. The
+    latter form returns all stacks defined in the module - or, for a package,
+    in the package and all of its submodules, namespace packages included.
+
+    Returns:
+        list: Stack classes, sorted by their `BASE_NAME`
+    """
+    modname, _, clsname = spec.partition(':')
+    module = importlib.import_module(modname)
+    if clsname:
+        return [getattr(module, clsname)]
+    stacks = module_stacks(module)
+    if hasattr(module, '__path__'):
+        for name in _submodules(module.__path__, module.__name__ + '.'):
+            stacks.extend(module_stacks(importlib.import_module(name)))
+    return sorted(stacks, key=lambda cls: (cls.BASE_NAME, cls.__module__))
@@ -0,0 +1,195 @@
+"""
+Stack event tracking routines
+"""
+import json
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+# Serializes writes of JSON-lines sinks sharing a stream, so that lines of
+# stacks deployed in parallel never interleave
+_WRITE_LOCK = threading.Lock()
+
+
+class Backoff():
+    """
+    Adaptive polling interval. Drops back to `min_sec` whenever there is
+    activity and grows by `factor` up to `max_sec` while things are idle.
+    Each delay is randomized by +/- `jitter` (as a fraction), so that parallel
+    pollers do not hit the API in lockstep.
+    """
+    def __init__(self, min_sec=2, max_sec=20, factor=1.5, jitter=0.2):
+        self.min_sec = min_sec
+        self.max_sec = max(min_sec, max_sec)
+        self.factor = factor
+        self.jitter = jitter
+        self.current = min_sec
+
+    def reset(self):
+        """Activity seen - poll at the fastest rate again"""
+        self.current = self.min_sec
+
+    def idle(self):
+        """Nothing happened - slow down"""
+        self.current = min(self.max_sec, self.current * self.factor)
+
+    def delay(self):
+        """Seconds to sleep before the next poll"""
+        return self.current * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+
+class StackEventTailer():
+    """
+    Incremental reader of CloudFormation stack events.
+
+    ``describe_stack_events`` returns the newest events first, so each `poll()`
+    only pages until it reaches the last event it has already returned,
+    rather than fetching the full stack history every time.
+    """
+    def __init__(self, cfn, stackname, since=None):
+        self.cfn = cfn
+        self.stackname = stackname
+        # get a TZ-aware marker, going back a couple of seconds
+        if since is None:
+            since = datetime.now(timezone.utc) - timedelta(seconds=3)
+        self.since = since
+        self.last_id = None
+
+    def _is_seen(self, event):
+        if self.last_id is None:
+            return event['Timestamp'] <= self.since
+        return event['EventId'] == self.last_id \
+            or event['Timestamp'] < self.since
+
+    def poll(self):
+        """
+        Fetch the events that occurred since the previous call.
+
+        Returns:
+            list: Stack events, oldest first
+
+        Raises:
+            botocore.exceptions.ClientError: If the stack cannot be described
+        """
+        new = []
+        paginator = self.cfn.get_paginator('describe_stack_events')
+        for page in paginator.paginate(StackName=self.stackname):
+            events = page['StackEvents']
+            for idx, event in enumerate(events):
+                if self._is_seen(event):
+                    new.extend(events[:idx])
+                    break
+            else:
+                new.extend(events)
+                continue
+            break
+        new.reverse()
+        if new:
+            self.last_id = new[-1]['EventId']
+            self.since = new[-1]['Timestamp']
+        return new
+
+
+class EventSink():
+    """
+    Destination of the stack events reported while waiting on a stack
+    operation. `emit()` gets each batch of new events, oldest first, and
+    `flush()` is called once the wait is over.
+    """
+    def emit(self, stackname, region, events):
+        """Report new `events` of `stackname`"""
+        raise NotImplementedError
+
+    def flush(self):
+        """Write out anything still buffered"""
+
+
+class TableSink(EventSink):
+    """
+    Human-readable, fixed-width event table, printed through `echo` - with a
+    header ahead of the first event. Each batch is printed in one go.
+    """
+    HEADER = ['TIMESTAMP (UTC)', 'RESOURCE TYPE', 'RESOURCE ID', 'STATUS',
+              'REASON']
+    ROW = '{0:<24} {1:<42} {2:<28} {3:<40} {4}'
+
+    def __init__(self, echo=print):
+        self.echo = echo
+        self.header_printed = False
+
+    def emit(self, stackname, region, events):
+        if not events:
+            return
+        lines = []
+        if not self.header_printed:
+            lines.append(self.ROW.format(*self.HEADER))
+            self.header_printed = True
+        for ev in events:
+            lines.append(self.ROW.format(
+                ev['Timestamp'].strftime('%Y-%m-%d %H:%M:%S'),
+                ev['ResourceType'],
+                ev['LogicalResourceId'],
+                ev['ResourceStatus'],
+                ev.get('ResourceStatusReason', '')
+            ))
+        self.echo('\n'.join(lines))
+
+
+class JsonLinesSink(EventSink):
+    """
+    Streams every event as a JSON object on a line of its own, for log
+    shippers and other tools.
+
+    Lines are buffered and written out in batches - once `batch_size` of
+    them are pending, or `interval` seconds after the previous write - so
+    that stacks with many resources do not bottleneck on terminal I/O.
+
+    Args:
+        stream (file): Where to write the lines; stdout if None
+        batch_size (int): Pending lines that trigger a write
+        interval (float): Seconds after which pending lines are written
+    """
+    def __init__(self, stream=None, batch_size=100, interval=1.0):
+        self.stream = stream
+        self.batch_size = batch_size
+        self.interval = interval
+        self._pending = []
+        self._written = time.monotonic()
+
+    @staticmethod
+    def record(stackname, region, event):
+        """The JSON-serializable form of `event`"""
+        return {
+            'stack': stackname,
+            'region': region,
+            'timestamp': event['Timestamp'].isoformat(),
+            'received': datetime.now(timezone.utc).isoformat(),
+            'event_id': event['EventId'],
+            'logical_id': event['LogicalResourceId'],
+            'physical_id': event.get('PhysicalResourceId'),
+            'resource_type': event['ResourceType'],
+            'status': event['ResourceStatus'],
+            'reason': event.get('ResourceStatusReason'),
+        }
+
+    def emit(self, stackname, region, events):
+        self._pending.extend(
+            json.dumps(self.record(stackname, region, ev), sort_keys=True)
+            for ev in events)
+        if len(self._pending) >= self.batch_size or \
+                time.monotonic() - self._written >= self.interval:
+            self.flush()
+
+    def flush(self):
+        self._written = time.monotonic()
+        if not self._pending:
+            return
+        data = '\n'.join(self._pending) + '\n'
+        self._pending = []
+        # Looked up late, so that redirected/captured stdout is honoured
+        stream = self.stream or sys.stdout
+        with _WRITE_LOCK:
+            stream.write(data)
+            stream.flush()
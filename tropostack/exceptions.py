@@ -5,3 +5,15 @@ class ConfigLoadError(Exception):
 
 class InvalidStackError(Exception):
     pass
+
+
+class OrchestrationError(Exception):
+    pass
+
+
+class AmiLookupError(RuntimeError):
+    pass
+
+
+class OutputLookupError(RuntimeError):
+    pass
@@ -0,0 +1,135 @@
+"""
+Running one stack definition across many regions and accounts
+"""
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from .base import ConfRecorder
+from .orchestrator import OK, FAILED
+
+Target = namedtuple('Target', ['region', 'role_arn'])
+
+
+def target_label(target):
+    """Short name of a target for the consolidated output"""
+    if target.role_arn:
+        # Account ID out of arn:aws:iam::<account>:role/<name>
+        parts = target.role_arn.split(':')
+        account = parts[4] if len(parts) > 5 else target.role_arn
+        return '%s/%s' % (account, target.region)
+    return target.region
+
+
+class FanOut():
+    """
+    Runs a CLI command for one stack definition across several targets -
+    every combination of the given regions and assumed roles - in parallel.
+
+    Each target gets its own stack instance, configured for the target
+    region, and clients of its own account and region. The template is
+    compiled only once if the stack does not read its region (directly or
+    through ``self.region``) while compiling; otherwise it is compiled per
+    target. Either way it is rendered by the target CLI, so that its
+    ``--split-nested``, ``--cache`` and ``--incremental`` options apply.
+
+    Args:
+        cli (tropostack.cli.InlineConfCLI): CLI of the stack to fan out
+        regions (list): Target regions
+        role_arns (list): IAM roles to assume, one per target account; the
+            CLI's own credentials are used if empty
+        max_workers (int): Maximum number of targets processed in parallel
+    """
+    def __init__(self, cli, regions, role_arns=None, max_workers=8):
+        self.cli = cli
+        self.targets = [Target(region, role_arn)
+                        for role_arn in role_arns or [None]
+                        for region in regions]
+        self.max_workers = max_workers
+        self.compiles = 0
+        self._body = None
+        self._lock = threading.Lock()
+        self._compile_lock = threading.Lock()
+
+    def echo(self, target, msg):
+        """Print a line of the consolidated output, tagged by target"""
+        with self._lock:
+            for line in str(msg).splitlines() or ['']:
+                print('[{}] {}'.format(target_label(target), line),
+                      flush=True)
+
+    def provider(self, target):
+        """Client provider for the account of `target`"""
+        if target.role_arn:
+            return self.cli.aws.assume_role(target.role_arn)
+        return self.cli.aws
+
+    def stack(self, target):
+        """Stack instance configured for the region of `target`"""
+        stack = self.cli.stack
+        return type(stack)(dict(stack.conf, region=target.region))
+
+    def template_body(self, cli, render):
+        """
+        Template of the stack of the target `cli`, rendered by `render` - the
+        CLI's own `template_body`, with its split, cache and incremental
+        options - and shared by all targets once it turns out the template
+        does not depend on the region.
+        """
+        # Compiles are CPU-bound anyway, so running them one at a time costs
+        # little and lets the first one decide whether the others are needed
+        with self._compile_lock:
+            if self._body is not None:
+                return self._body
+            stack = cli.stack
+            conf = stack.conf
+            recorder = stack.conf = ConfRecorder(conf)
+            try:
+                body = render()
+            finally:
+                stack.conf = conf
+            self.compiles += 1
+            if 'region' not in recorder.keys_read:
+                self._body = body
+            return body
+
+    def _run_one(self, target, command):
+        stack = self.stack(target)
+        # Profiling covers all targets from the fanning out CLI already
+        options = dict(vars(self.cli.args), regions=None, role_arns=None,
+                       profile=False, trace_file=None)
+        options.pop('command', None)
+        cli = type(self.cli).for_stack(stack, command, **options)
+        cli.aws = self.provider(target)
+        cli.echo = lambda msg: self.echo(target, msg)
+        render = cli.template_body
+        cli.template_body = lambda: self.template_body(cli, render)
+        started = time.time()
+        try:
+            cli.run()
+        except Exception as err:
+            self.echo(target, 'Failed: %s' % err)
+            return FAILED, time.time() - started
+        return OK, time.time() - started
+
+    def run(self, command='apply'):
+        """
+        Run `command` on all targets.
+
+        Returns:
+            dict: `Target` to its result - OK or FAILED
+        """
+        import tabulate
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = [(target, pool.submit(self._run_one, target, command))
+                       for target in self.targets]
+            results = {}
+            report = []
+            for target, future in futures:
+                results[target], elapsed = future.result()
+                report.append([target.role_arn or '', target.region,
+                               results[target], '%.1f' % elapsed])
+        print(tabulate.tabulate(
+            report, headers=['ROLE', 'REGION', 'RESULT', 'SECONDS']))
+        return results
@@ -0,0 +1,276 @@
+"""
+Incremental compilation - rebuilding only the stack members whose
+configuration inputs changed
+"""
+import hashlib
+import json
+import os
+import time
+from collections.abc import Iterable, Mapping
+from contextlib import contextmanager
+
+import troposphere
+
+from .budget import UnboundedTemplate
+from .cache import atomic_write, source_fingerprint, value_fingerprint
+
+# Fingerprint of configuration keys that are not set
+_MISSING = '-'
+
+
+class _Tracker(Mapping):
+    """
+    Configuration view attributing every key read to the stack members being
+    evaluated at the time - or to the stack as a whole, outside of members.
+    Also records which memoized members each member references, and the
+    AMIs and stack outputs each member looked up.
+    """
+    def __init__(self, conf):
+        self.conf = conf
+        self.active = []
+        self.keys = {}
+        self.refs = {}
+        self.lookups = {}
+        self.global_keys = set()
+        self.global_lookups = {}
+
+    def _read(self, keys):
+        if not self.active:
+            self.global_keys.update(keys)
+        # Nested evaluations count for every member up the chain
+        for name in self.active:
+            self.keys[name].update(keys)
+
+    def __getitem__(self, key):
+        self._read([key])
+        return self.conf[key]
+
+    def __iter__(self):
+        self._read(list(self.conf))
+        return iter(self.conf)
+
+    def __len__(self):
+        return len(self.conf)
+
+    def lookup(self, args, value):
+        """Record the resolved `value` of `BaseStack.resolve_lookup(*args)`"""
+        key = json.dumps(list(args))
+        if not self.active:
+            self.global_lookups[key] = value
+        for name in self.active:
+            self.lookups[name][key] = value
+
+    @contextmanager
+    def evaluating(self, name):
+        self.keys.setdefault(name, set())
+        self.refs.setdefault(name, set())
+        self.lookups.setdefault(name, {})
+        self.active.append(name)
+        try:
+            yield
+        finally:
+            self.active.pop()
+
+    def reference(self, name):
+        if self.active and self.active[-1] != name:
+            self.refs[self.active[-1]].add(name)
+
+
+def _conf_fingerprints(conf, keys):
+    return {key: value_fingerprint(conf[key]) if key in conf else _MISSING
+            for key in keys}
+
+
+def _stale_lookups(stack, lookups):
+    """Whether any of the recorded `lookups` resolves differently now"""
+    for key, value in sorted(lookups.items()):
+        try:
+            if stack.resolve_lookup(*json.loads(key)) != value:
+                return True
+        except RuntimeError:
+            # Gone - let the rebuild report it
+            return True
+    return False
+
+
+def _check_limits(template_dict, template):
+    """Enforce the section limits troposphere enforces on `template`"""
+    limits = [('Outputs', troposphere.MAX_OUTPUTS, 'outputs')]
+    if not isinstance(template, UnboundedTemplate):
+        limits.append(('Resources', troposphere.MAX_RESOURCES, 'resources'))
+    for section, limit, noun in limits:
+        if len(template_dict.get(section, {})) > limit:
+            raise ValueError('Maximum number of %s %d reached'
+                             % (noun, limit))
+
+
+def _instance_state(stack):
+    # Attributes derived from the configuration at instantiation time (e.g.
+    # `EnvStack.env`) are visible to every member
+    return value_fingerprint({
+        key: value for key, value in vars(stack).items()
+        if not key.startswith('_')})
+
+
+class IncrementalCompiler():
+    """
+    Compiles stacks to template dicts, reusing the rendered resources and
+    outputs of members whose inputs did not change since the last compile.
+
+    While a stack is compiled, every `self.conf` key read is attributed to the
+    member being evaluated, along with the `resource`/`output` members it
+    references. On the next compile of the same stack, a member is rebuilt
+    only if any of its keys changed value, or a member it references was
+    rebuilt; all other members are spliced in from their stored fragments.
+    Changes to the stack source code, to keys read outside of members or to
+    the stack attributes (e.g. `env`) rebuild everything.
+
+    AMIs and stack outputs looked up by a member count as its inputs too:
+    they are resolved again on every compile - through the resolvers'
+    caches - and the member is rebuilt if any of them changed value.
+
+    Args:
+        path (str): Directory to persist the fragments to, one JSON file per
+            stack, so that they survive across processes; in-memory only if
+            None
+        max_age (int): Seconds after which the files of stacks no longer
+            compiled are removed
+    """
+    def __init__(self, path=None, max_age=30 * 24 * 3600):
+        self.path = path
+        self.max_age = max_age
+        self._state = {}
+        self.rebuilt = []
+        self.reused = []
+
+    def _file(self, key):
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.path, digest + '.json')
+
+    def _load(self, key):
+        """Stored entry of the stack `key`, or None"""
+        if key not in self._state and self.path:
+            try:
+                with open(self._file(key), encoding='utf-8') as fhandle:
+                    self._state[key] = json.load(fhandle)
+            except (OSError, ValueError):
+                pass
+        return self._state.get(key)
+
+    def _save(self, key, entry):
+        self._state[key] = entry
+        if not self.path:
+            return
+        atomic_write(self._file(key), json.dumps(entry, sort_keys=True))
+        now = time.time()
+        for dentry in os.scandir(self.path):
+            try:
+                if dentry.name.endswith('.json') \
+                        and now - dentry.stat().st_mtime > self.max_age:
+                    os.remove(dentry.path)
+            except FileNotFoundError:
+                # Evicted by another process meanwhile
+                pass
+
+    def _dirty(self, stack, entry, conf, members):
+        """Members to rebuild, given the stored `entry` of the stack"""
+        stored = entry['members']
+        dirty = set()
+        for attr in members:
+            member = stored.get(attr)
+            if member is None or _conf_fingerprints(
+                    conf, member['keys']) != member['keys'] \
+                    or _stale_lookups(stack, member.get('lookups', {})):
+                dirty.add(attr)
+        # Rebuilt members invalidate the members referencing them
+        while True:
+            more = {attr for attr in members if attr not in dirty
+                    and dirty & set(stored[attr]['refs'])}
+            if not more:
+                return dirty
+            dirty |= more
+
+    def compile(self, stack, template=None):
+        """
+        Compile `stack`, rebuilding what changed since the previous call.
+
+        Args:
+            template (troposphere.Template): Template whose limits apply, as
+                for `BaseStack.compile()` - e.g. an `UnboundedTemplate` for
+                stacks to split into nested stacks
+
+        Returns:
+            dict: The template, like `troposphere.Template.to_dict()` gives
+
+        Raises:
+            ValueError: If the template is over the resource or output limits
+        """
+        key = '%s.%s %s' % (type(stack).__module__,
+                            type(stack).__qualname__, stack.stackname)
+        members = list(stack._RESOURCES) + list(stack._OUTPUTS)
+        source = source_fingerprint(type(stack))
+        instance = _instance_state(stack)
+        conf = stack.conf
+        entry = self._load(key)
+
+        tracker = _Tracker(conf)
+        stack.conf = tracker
+        stack._tracker = tracker
+        try:
+            stack.prefetch_amis()
+            stack.prefetch_outputs()
+            if entry is None or entry['source'] != source \
+                    or entry['instance'] != instance \
+                    or _conf_fingerprints(conf, entry['global']) \
+                    != entry['global'] \
+                    or _stale_lookups(stack, entry.get('global_lookups', {})):
+                entry = {'members': {}}
+                dirty = set(members)
+            else:
+                dirty = self._dirty(stack, entry, conf, members)
+            for attr in members:
+                if attr in dirty:
+                    with tracker.evaluating(attr):
+                        entry['members'][attr] = self._fragments(stack, attr)
+        finally:
+            del stack._tracker
+            stack.conf = conf
+
+        for attr in dirty:
+            entry['members'][attr].update(
+                keys=_conf_fingerprints(conf, tracker.keys[attr]),
+                refs=sorted(tracker.refs[attr]),
+                lookups=tracker.lookups[attr])
+        self._save(key, {
+            'source': source,
+            'instance': instance,
+            'global': _conf_fingerprints(conf, tracker.global_keys),
+            'global_lookups': tracker.global_lookups,
+            # Members no longer part of the stack are dropped
+            'members': {attr: entry['members'][attr] for attr in members},
+        })
+        self.rebuilt = [attr for attr in members if attr in dirty]
+        self.reused = [attr for attr in members if attr not in dirty]
+        result = self._splice(self._state[key]['members'], members)
+        _check_limits(result, template)
+        return result
+
+    @staticmethod
+    def _fragments(stack, attr):
+        section = 'Resources' if attr in stack._RESOURCES else 'Outputs'
+        value = getattr(stack, attr)
+        objs = value if isinstance(value, Iterable) else [value]
+        return {'fragments': [[section, obj.title, obj.to_dict()]
+                              for obj in objs]}
+
+    @staticmethod
+    def _splice(stored, members):
+        template = {'Outputs': {}, 'Resources': {}}
+        for attr in members:
+            for section, title, fragment in stored[attr]['fragments']:
+                if title in template[section]:
+                    raise ValueError('duplicate key "%s" detected' % title)
+                template[section][title] = fragment
+        if not template['Outputs']:
+            del template['Outputs']
+        return template
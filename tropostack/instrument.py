@@ -0,0 +1,175 @@
+"""
+Instrumentation hooks for the compile and deploy phases
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Span kinds reported to the hooks
+MEMBER = 'member'
+PHASE = 'phase'
+API = 'api'
+
+_HOOKS = []
+_HOOKS_LOCK = threading.Lock()
+
+
+class Instrument():
+    """
+    Base class of instrumentation hooks. Subclasses override the callbacks
+    they need; both get the span kind - one of MEMBER (a stack resource or
+    output being built), PHASE (e.g. ``compile``) or API (an AWS API call) -
+    and its name.
+
+    Callbacks may run concurrently from several threads.
+    """
+    def on_start(self, kind, name):
+        """Called when a span starts"""
+
+    def on_end(self, kind, name, elapsed):
+        """Called when a span ends, with its duration in seconds"""
+
+
+def register(hook):
+    """Start reporting spans to the `Instrument` `hook`"""
+    with _HOOKS_LOCK:
+        _HOOKS.append(hook)
+
+
+def unregister(hook):
+    """Stop reporting spans to `hook`"""
+    with _HOOKS_LOCK:
+        _HOOKS.remove(hook)
+
+
+def active():
+    """Whether any hooks are registered"""
+    return bool(_HOOKS)
+
+
+def start(kind, name):
+    """Report the start of a span; returns the token to pass to `end()`"""
+    hooks = list(_HOOKS)
+    for hook in hooks:
+        hook.on_start(kind, name)
+    return hooks, time.perf_counter()
+
+
+def end(kind, name, token):
+    """Report the end of a span started with `start()`"""
+    hooks, started = token
+    elapsed = time.perf_counter() - started
+    for hook in reversed(hooks):
+        hook.on_end(kind, name, elapsed)
+
+
+@contextmanager
+def span(kind, name):
+    """
+    Report the enclosed block to the registered hooks. Costs next to nothing
+    while no hooks are registered.
+    """
+    if not _HOOKS:
+        yield
+        return
+    token = start(kind, name)
+    try:
+        yield
+    finally:
+        end(kind, name, token)
+
+
+def _before_call(model, context, **kwargs):
+    if _HOOKS:
+        name = '%s.%s' % (model.service_model.service_name, model.name)
+        context['tropostack_span'] = (name, start(API, name))
+
+
+def _after_call(context, **kwargs):
+    pending = context.pop('tropostack_span', None)
+    if pending:
+        end(API, pending[0], pending[1])
+
+
+def attach_client(client):
+    """Report the API calls of a boto3 client to the hooks"""
+    client.meta.events.register('before-call.*.*', _before_call)
+    client.meta.events.register('after-call.*.*', _after_call)
+    client.meta.events.register('after-call-error.*.*', _after_call)
+
+
+class Profiler(Instrument):
+    """
+    Records all spans, for a timing table (`report()`) and a Chrome
+    trace-event file (`write_trace()`) that can be loaded in
+    ``chrome://tracing`` or Perfetto for flamegraph-style inspection.
+    """
+    def __init__(self):
+        self.spans = []
+        self.origin = time.perf_counter()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def on_start(self, kind, name):
+        # Track the time spent in nested spans, to derive the self time
+        self._stack().append([time.perf_counter(), 0.0])
+
+    def on_end(self, kind, name, elapsed):
+        stack = self._stack()
+        started, children = stack.pop()
+        if stack:
+            stack[-1][1] += elapsed
+        with self._lock:
+            self.spans.append((kind, name, started - self.origin, elapsed,
+                               elapsed - children, threading.get_ident()))
+
+    def totals(self):
+        """
+        Returns:
+            list: ``[kind, name, calls, total, self, max]`` rows, by
+            descending total seconds
+        """
+        rows = {}
+        with self._lock:
+            spans = list(self.spans)
+        for kind, name, _, elapsed, own, _ in spans:
+            row = rows.setdefault((kind, name), [kind, name, 0, 0.0, 0.0, 0.0])
+            row[2] += 1
+            row[3] += elapsed
+            row[4] += own
+            row[5] = max(row[5], elapsed)
+        return sorted(rows.values(), key=lambda row: (-row[3], row[0], row[1]))
+
+    def report(self, limit=None):
+        """Timing table of the recorded spans, slowest first"""
+        import tabulate
+        return tabulate.tabulate(
+            self.totals()[:limit],
+            headers=['KIND', 'NAME', 'CALLS', 'TOTAL (s)', 'SELF (s)',
+                     'MAX (s)'],
+            floatfmt='.4f')
+
+    def trace_events(self):
+        """The recorded spans as Chrome trace "complete" events"""
+        pid = os.getpid()
+        with self._lock:
+            spans = list(self.spans)
+        return [{
+            'name': name, 'cat': kind, 'ph': 'X', 'pid': pid, 'tid': tid,
+            'ts': round(started * 1e6, 3), 'dur': round(elapsed * 1e6, 3),
+        } for kind, name, started, elapsed, _, tid in sorted(
+            spans, key=lambda span: span[2])]
+
+    def write_trace(self, path):
+        """Write a Chrome trace-event JSON file"""
+        with open(path, 'w', encoding='utf-8') as fhandle:
+            json.dump({'traceEvents': self.trace_events(),
+                       'displayTimeUnit': 'ms'}, fhandle)
@@ -0,0 +1,309 @@
+"""
+Splitting the resources of one template into nested stacks
+"""
+import hashlib
+import heapq
+import re
+
+import troposphere
+
+from .budget import TemplateBudget, compact_size
+from .transport import URL_LIMIT
+
+# ${Name} and ${Name.Attribute} placeholders of Fn::Sub; ${!Literal} is not
+_SUB_VAR = re.compile(r'\$\{([^!}][^}]*)\}')
+
+
+def _getatt_args(arg):
+    """``(logical_id, attribute)`` of a Fn::GetAtt argument"""
+    if isinstance(arg, str):
+        return tuple(arg.split('.', 1)) if '.' in arg else None
+    if isinstance(arg, list) and len(arg) == 2 \
+            and all(isinstance(part, str) for part in arg):
+        return arg[0], arg[1]
+    return None
+
+
+def _sub_ref(name):
+    target, _, attr = name.partition('.')
+    return target, attr or None
+
+
+def references(value):
+    """
+    All ``(logical_id, attribute)`` pairs `value` references through
+    ``Ref`` (with a None attribute), ``Fn::GetAtt`` and ``Fn::Sub``.
+    """
+    if isinstance(value, list):
+        for item in value:
+            yield from references(item)
+        return
+    if not isinstance(value, dict):
+        return
+    if len(value) == 1:
+        key, arg = next(iter(value.items()))
+        if key == 'Ref' and isinstance(arg, str):
+            yield arg, None
+            return
+        if key == 'Fn::GetAtt' and _getatt_args(arg):
+            yield _getatt_args(arg)
+            return
+        if key == 'Fn::Sub':
+            text, variables = (arg, {}) if isinstance(arg, str) else arg
+            for name in _SUB_VAR.findall(text):
+                if name not in variables:
+                    yield _sub_ref(name)
+            yield from references(variables)
+            return
+    for item in value.values():
+        yield from references(item)
+
+
+def rewrite(value, replace):
+    """
+    Copy of `value` with its references swapped through `replace`.
+
+    Args:
+        replace (callable): Takes a ``(logical_id, attribute)`` pair and
+            returns None to keep the reference, or the ``(expression,
+            sub_name)`` to put in its place - the latter for use in
+            ``Fn::Sub`` strings
+    """
+    if isinstance(value, list):
+        return [rewrite(item, replace) for item in value]
+    if not isinstance(value, dict):
+        return value
+    if len(value) == 1:
+        key, arg = next(iter(value.items()))
+        ref = None
+        if key == 'Ref' and isinstance(arg, str):
+            ref = (arg, None)
+        elif key == 'Fn::GetAtt':
+            ref = _getatt_args(arg)
+        if ref:
+            new = replace(ref)
+            return dict(value) if new is None else new[0]
+        if key == 'Fn::Sub':
+            text, variables = (arg, {}) if isinstance(arg, str) else arg
+
+            def sub(match):
+                new = None
+                if match.group(1) not in variables:
+                    new = replace(_sub_ref(match.group(1)))
+                return match.group(0) if new is None else '${%s}' % new[1]
+            text = _SUB_VAR.sub(sub, text)
+            if isinstance(arg, str):
+                return {key: text}
+            return {key: [text, rewrite(variables, replace)]}
+    return {key: rewrite(item, replace) for key, item in value.items()}
+
+
+def _depends_on(rsc):
+    deps = rsc.get('DependsOn', [])
+    return [deps] if isinstance(deps, str) else list(deps)
+
+
+def exchange_name(target, attr):
+    """
+    Name of the output/parameter pair passing a reference across stacks.
+    Logical IDs are alphanumeric, so a hash of the reference sets apart
+    pairs that would read the same, e.g. ``Foo`` + ``Bar.Baz`` and
+    ``FooBar`` + ``Baz``.
+    """
+    digest = hashlib.sha256(('%s %s' % (target, attr)).encode('utf-8'))
+    return '%s%s%s' % (target, re.sub('[^A-Za-z0-9]', '', attr or 'Ref'),
+                       digest.hexdigest()[:8])
+
+
+class NestedSplit():
+    """
+    Partitions the resources of a template into child stacks, each below
+    `max_resources` resources and `max_bytes` bytes, tied together by a
+    parent template of ``AWS::CloudFormation::Stack`` resources.
+
+    Resources are taken in dependency order - and otherwise in declaration
+    order - and cut into consecutive chunks, so references only ever point
+    to earlier children. References crossing children are rewritten into an
+    output of the referenced child and a parameter of the referencing one,
+    which the parent wires up; CloudFormation creates children with no such
+    links in parallel. Parameters, mappings and conditions of the template
+    are shared by all children, and its outputs stay on the parent.
+
+    Note that moving a resource between child stacks replaces it: keep the
+    declaration order stable, adding new members at the end, for the
+    partitions to stay put. Cross-stack values are passed as ``String``
+    parameters, so attributes returning lists cannot be referenced across
+    children.
+
+    Args:
+        template (dict): Template to split, in its dict form
+        max_resources (int): Most resources per child stack
+        max_bytes (int): Largest resources size per child stack
+        prefix (str): Logical ID prefix of the child stacks in the parent
+
+    Raises:
+        ValueError: If a child stack ends up with more parameters or outputs
+            than CloudFormation allows
+    """
+    def __init__(self, template, max_resources=200, max_bytes=URL_LIMIT // 2,
+                 prefix='Part'):
+        self.template = template
+        self.max_resources = max_resources
+        self.max_bytes = max_bytes
+        self.prefix = prefix
+        self.partitions = self._partition()
+        self.owner = {title: name for name, titles in self.partitions.items()
+                      for title in titles}
+        self.children = {}
+        self.links = {}
+        self._split()
+
+    def _ordered(self):
+        resources = self.template['Resources']
+        position = {title: idx for idx, title in enumerate(resources)}
+        deps = {title: {ref for ref, _ in references(rsc)
+                        if ref in resources and ref != title}
+                | set(_depends_on(rsc)) & set(resources)
+                for title, rsc in resources.items()}
+        dependents = {title: set() for title in resources}
+        for title, needs in deps.items():
+            for need in needs:
+                dependents[need].add(title)
+        ready = [position[title] for title, needs in deps.items()
+                 if not needs]
+        heapq.heapify(ready)
+        order = []
+        titles = list(resources)
+        while ready:
+            title = titles[heapq.heappop(ready)]
+            order.append(title)
+            for dependent in dependents[title]:
+                deps[dependent].discard(title)
+                if not deps[dependent]:
+                    heapq.heappush(ready, position[dependent])
+        if len(order) != len(resources):
+            raise ValueError('Circular dependencies between resources: %s'
+                             % ', '.join(sorted(set(resources) - set(order))))
+        return order
+
+    def _partition(self):
+        resources = self.template['Resources']
+        partitions = []
+        size = 0
+        for title in self._ordered():
+            rsc_size = compact_size({title: resources[title]})
+            if not partitions or len(partitions[-1]) >= self.max_resources \
+                    or size + rsc_size > self.max_bytes:
+                partitions.append([])
+                size = 0
+            partitions[-1].append(title)
+            size += rsc_size
+        return {'%s%d' % (self.prefix, idx + 1): titles
+                for idx, titles in enumerate(partitions)}
+
+    def _split(self):
+        resources = self.template['Resources']
+        shared = {section: self.template[section]
+                  for section in ('Parameters', 'Mappings', 'Conditions')
+                  if section in self.template}
+        exports = {name: {} for name in self.partitions}
+        for name, titles in self.partitions.items():
+            imports = {}
+            depends = set()
+
+            def replace(ref, name=name, imports=imports):
+                owner = self.owner.get(ref[0])
+                if owner is None or owner == name:
+                    return None
+                exchanged = exchange_name(*ref)
+                exports[owner][exchanged] = ref
+                imports[exchanged] = owner
+                return {'Ref': exchanged}, exchanged
+
+            child_rscs = {}
+            for title in titles:
+                rsc = rewrite(resources[title], replace)
+                deps = _depends_on(rsc)
+                if deps:
+                    # Ordering across children moves up to the parent
+                    local = [dep for dep in deps
+                             if self.owner.get(dep) == name]
+                    depends.update(self.owner[dep] for dep in deps
+                                   if dep in self.owner and dep not in local)
+                    if local:
+                        rsc['DependsOn'] = local
+                    else:
+                        del rsc['DependsOn']
+                child_rscs[title] = rsc
+            child = {'AWSTemplateFormatVersion': '2010-09-09'}
+            child.update(shared)
+            child['Parameters'] = dict(shared.get('Parameters', {}))
+            child['Parameters'].update(
+                (exchanged, {'Type': 'String'}) for exchanged in imports)
+            if not child['Parameters']:
+                del child['Parameters']
+            child['Resources'] = child_rscs
+            self.children[name] = child
+            self.links[name] = (imports, depends)
+        # The template outputs get their values from the children too
+        for target, attr in references(self.template.get('Outputs', {})):
+            if target in self.owner:
+                exports[self.owner[target]][exchange_name(target, attr)] = \
+                    (target, attr)
+        for name, outputs in exports.items():
+            if outputs:
+                self.children[name]['Outputs'] = {
+                    exchanged: {'Value': {'Ref': target} if attr is None
+                                else {'Fn::GetAtt': [target, attr]}}
+                    for exchanged, (target, attr) in sorted(outputs.items())}
+        self._check_limits()
+
+    def _check_limits(self):
+        # Caught here rather than by CloudFormation, once deploying
+        limits = [('Parameters', troposphere.MAX_PARAMETERS, 'parameters'),
+                  ('Outputs', troposphere.MAX_OUTPUTS, 'outputs')]
+        for name, child in sorted(self.children.items()):
+            for section, limit, noun in limits:
+                if len(child.get(section, {})) > limit:
+                    raise ValueError(
+                        'Maximum number of %s %d reached in nested stack %s'
+                        % (noun, limit, name))
+
+    def parent(self, urls):
+        """
+        The parent template, given the S3 URL of each child template (by
+        the child's logical ID).
+        """
+        params = self.template.get('Parameters', {})
+        parent = {key: value for key, value in self.template.items()
+                  if key not in ('Resources', 'Outputs')}
+        parent['Resources'] = {}
+        for name in self.partitions:
+            imports, depends = self.links[name]
+            child_params = {param: {'Ref': param} for param in params}
+            child_params.update(
+                (exchanged, {'Fn::GetAtt': [owner, 'Outputs.' + exchanged]})
+                for exchanged, owner in sorted(imports.items()))
+            rsc = {'Type': 'AWS::CloudFormation::Stack',
+                   'Properties': {'TemplateURL': urls[name]}}
+            if child_params:
+                rsc['Properties']['Parameters'] = child_params
+            if depends:
+                rsc['DependsOn'] = sorted(depends)
+            parent['Resources'][name] = rsc
+
+        def replace(ref):
+            owner = self.owner.get(ref[0])
+            if owner is None:
+                return None
+            exchanged = exchange_name(*ref)
+            return ({'Fn::GetAtt': [owner, 'Outputs.' + exchanged]},
+                    '%s.Outputs.%s' % (owner, exchanged))
+        if 'Outputs' in self.template:
+            parent['Outputs'] = rewrite(self.template['Outputs'], replace)
+        return parent
+
+    def budgets(self):
+        """`tropostack.budget.TemplateBudget` of each child template"""
+        return {name: TemplateBudget(child)
+                for name, child in self.children.items()}
@@ -0,0 +1,257 @@
+"""
+Deployment of multiple, inter-dependent stacks
+"""
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .aws import ClientProvider
+from .cli import InlineConfCLI
+from .conf_loaders import PartitionedConfig
+from .exceptions import OrchestrationError
+from .ratelimit import RateLimiter
+
+# Result markers for the individual stacks
+OK = 'OK'
+FAILED = 'FAILED'
+SKIPPED = 'SKIPPED'
+
+# Commands run on the importing stacks before the stacks they import from
+REVERSED_COMMANDS = frozenset(['delete'])
+
+_SUB_VAR = re.compile(r'\$\{([^}!]+)\}')
+
+
+def resolve_name(value, stackname, region):
+    """
+    Statically resolve an export/import name as found in a template dict.
+    Handles plain strings, ``Fn::Sub``, ``Fn::Join`` and ``Ref`` to the
+    ``AWS::StackName``/``AWS::Region`` pseudo parameters. Other ``${...}``
+    variables are left as-is - those match only if spelled the same on both
+    ends.
+
+    Returns:
+        str: The resolved name, or None if it cannot be determined locally
+    """
+    pseudo = {'AWS::StackName': stackname, 'AWS::Region': region}
+    if isinstance(value, str):
+        return value
+    if not isinstance(value, dict) or len(value) != 1:
+        return None
+    func, arg = next(iter(value.items()))
+    if func == 'Fn::Sub':
+        if isinstance(arg, list):
+            arg, variables = arg
+            for var, var_value in variables.items():
+                pseudo[var] = resolve_name(var_value, stackname, region)
+                if pseudo[var] is None:
+                    return None
+        return _SUB_VAR.sub(
+            lambda m: pseudo.get(m.group(1), m.group(0)), arg)
+    if func == 'Fn::Join':
+        parts = [resolve_name(part, stackname, region) for part in arg[1]]
+        if None in parts:
+            return None
+        return arg[0].join(parts)
+    if func == 'Ref':
+        return pseudo.get(arg)
+    return None
+
+
+def template_exports(tmpl, stackname, region):
+    """List the resolvable export names of a template dict"""
+    names = []
+    for output in tmpl.get('Outputs', {}).values():
+        export = output.get('Export')
+        if export:
+            name = resolve_name(export['Name'], stackname, region)
+            if name is not None:
+                names.append(name)
+    return names
+
+
+def template_imports(tmpl, stackname, region):
+    """List the resolvable ``Fn::ImportValue`` names used in a template dict"""
+    names = []
+    pending = [tmpl]
+    while pending:
+        node = pending.pop()
+        if isinstance(node, dict):
+            if 'Fn::ImportValue' in node:
+                name = resolve_name(node['Fn::ImportValue'], stackname, region)
+                if name is not None:
+                    names.append(name)
+            pending.extend(node.values())
+        elif isinstance(node, list):
+            pending.extend(node)
+    return names
+
+
+class Orchestrator():
+    """
+    Runs a CLI command (``apply`` by default) across a set of stacks,
+    respecting the dependencies between them. A stack depends on another one
+    if it imports any of its exported outputs.
+
+    Stacks are processed in topological waves - every stack in a wave only
+    depends on stacks from previous waves - on a bounded thread pool. If a
+    stack fails, the stacks depending on it (directly or not) are skipped,
+    while unrelated branches carry on. Commands in `REVERSED_COMMANDS` run
+    the waves backwards instead - exports cannot be deleted while imported -
+    and skip the stacks whose dependents failed.
+
+    Args:
+        stack_classes (list): Stack classes to be deployed
+        conf (dict): Partitioned configuration, as read by
+            `tropostack.conf_loaders.partitioned_yaml_loader` - either the
+            full mapping or a `tropostack.conf_loaders.PartitionedConfig`
+        cli_cls (type): CLI class to run the commands through
+        max_workers (int): Maximum number of stacks processed in parallel
+        aws (tropostack.aws.ClientProvider): Client provider shared by all
+            stacks; one with a connection pool fitting `max_workers` is
+            created if not given
+    """
+    def __init__(self, stack_classes, conf, cli_cls=InlineConfCLI,
+                 max_workers=4, aws=None):
+        self.cli_cls = cli_cls
+        self.max_workers = max_workers
+        self.aws = aws or ClientProvider(
+            retry_mode=cli_cls.AWS_RETRY_MODE,
+            max_attempts=cli_cls.AWS_MAX_ATTEMPTS,
+            max_pool_connections=max(max_workers,
+                                     cli_cls.AWS_MAX_POOL_CONNECTIONS),
+            rate_limiter=RateLimiter(cli_cls.AWS_MAX_RATE)
+            if cli_cls.AWS_MAX_RATE else None)
+        if not isinstance(conf, PartitionedConfig):
+            conf = PartitionedConfig(conf)
+        self.stacks = {}
+        for stack_cls in stack_classes:
+            # Writable per stack, sharing the parsed document underneath
+            stack = stack_cls(conf.stack_conf(stack_cls.BASE_NAME).new_child())
+            # Lookups while compiling go through the shared, limited clients
+            stack.aws = self.aws
+            if stack.stackname in self.stacks:
+                raise OrchestrationError(
+                    'Duplicate stack name: %s' % stack.stackname)
+            self.stacks[stack.stackname] = stack
+        self.deps = self.dependencies()
+        self._lock = threading.Lock()
+
+    def dependencies(self):
+        """
+        Infer the dependencies between the stacks from their compiled
+        templates.
+
+        Returns:
+            dict: Stack name to the set of stack names it depends on
+        """
+        templates = {name: stack.compile().to_dict()
+                     for name, stack in self.stacks.items()}
+        exporters = {}
+        for name, tmpl in templates.items():
+            region = self.stacks[name].region
+            for export in template_exports(tmpl, name, region):
+                if exporters.setdefault(export, name) != name:
+                    raise OrchestrationError(
+                        'Export %s declared by both %s and %s'
+                        % (export, exporters[export], name))
+        deps = {}
+        for name, tmpl in templates.items():
+            region = self.stacks[name].region
+            imports = template_imports(tmpl, name, region)
+            # Imports of exports not managed here are assumed to exist already
+            deps[name] = {exporters[imp] for imp in imports
+                          if exporters.get(imp, name) != name}
+        return deps
+
+    def waves(self, reverse=False):
+        """
+        Group the stacks in topological waves.
+
+        Args:
+            reverse (bool): Order the waves dependents first
+
+        Returns:
+            list: Lists of stack names, each depending only on earlier ones -
+            or, with `reverse`, only depended on by earlier ones
+
+        Raises:
+            tropostack.exceptions.OrchestrationError: On circular dependencies
+        """
+        remaining = dict(self.deps)
+        waves = []
+        while remaining:
+            ready = sorted(name for name, deps in remaining.items()
+                           if not deps & set(remaining))
+            if not ready:
+                raise OrchestrationError(
+                    'Circular dependencies between stacks: %s'
+                    % ', '.join(sorted(remaining)))
+            waves.append(ready)
+            for name in ready:
+                del remaining[name]
+        if reverse:
+            waves.reverse()
+        return waves
+
+    def dependents(self):
+        """
+        Returns:
+            dict: Stack name to the set of stack names depending on it
+        """
+        return {name: {other for other, deps in self.deps.items()
+                       if name in deps}
+                for name in self.deps}
+
+    def echo(self, stackname, msg):
+        """Print a line of the consolidated output, tagged by stack name"""
+        with self._lock:
+            for line in str(msg).splitlines() or ['']:
+                print('[{}] {}'.format(stackname, line), flush=True)
+
+    def _run_one(self, stackname, command):
+        cli = self.cli_cls.for_stack(self.stacks[stackname], command)
+        cli.aws = self.aws
+        cli.echo = lambda msg: self.echo(stackname, msg)
+        started = time.time()
+        try:
+            cli.run()
+        except Exception as err:
+            self.echo(stackname, 'Failed: %s' % err)
+            return FAILED, time.time() - started
+        return OK, time.time() - started
+
+    def run(self, command='apply'):
+        """
+        Run `command` on all stacks, wave by wave.
+
+        Returns:
+            dict: Stack name to its result - one of OK, FAILED or SKIPPED
+        """
+        reverse = command in REVERSED_COMMANDS
+        blockers = self.dependents() if reverse else self.deps
+        results = {}
+        report = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            for wave_num, wave in enumerate(self.waves(reverse), 1):
+                futures = {}
+                for name in wave:
+                    failed = sorted(dep for dep in blockers[name]
+                                    if results[dep] != OK)
+                    if failed:
+                        self.echo(name, 'Skipped, as %s failed: %s' % (
+                            'dependents' if reverse else 'dependencies',
+                            ', '.join(failed)))
+                        results[name] = SKIPPED
+                        report.append([name, wave_num, SKIPPED, ''])
+                        continue
+                    futures[name] = pool.submit(self._run_one, name, command)
+                for name, future in futures.items():
+                    results[name], elapsed = future.result()
+                    report.append([name, wave_num, results[name],
+                                   '%.1f' % elapsed])
+        import tabulate
+        print(tabulate.tabulate(
+            report, headers=['STACK', 'WAVE', 'RESULT', 'SECONDS']))
+        return results
@@ -0,0 +1,124 @@
+"""
+Resolution of other stacks' outputs at compile time
+"""
+from tropostack.exceptions import OutputLookupError
+from tropostack.resolver import CachingResolver
+
+# From this many stacks on, listing all stacks of the region in pages takes
+# fewer calls than describing each of them
+_LIST_ALL_MIN = 20
+
+
+class CloudFormationOutputBackend():
+    """Looks stack outputs up through the CloudFormation API"""
+    # Results are worth persisting in the on-disk cache
+    cacheable = True
+
+    def describe(self, aws, region, stacknames):
+        """
+        Fetch the outputs of each of `stacknames`, using the
+        `tropostack.aws.ClientProvider` given as `aws`.
+
+        Returns:
+            dict: Stack name to its outputs (a key to value dict), for the
+            stacks that exist
+        """
+        import botocore.exceptions
+        client = aws.client('cloudformation', region=region)
+        if len(stacknames) >= _LIST_ALL_MIN:
+            pages = client.get_paginator('describe_stacks').paginate()
+            stacks = [stack for page in pages for stack in page['Stacks']
+                      if stack['StackName'] in stacknames]
+        else:
+            stacks = []
+            for name in sorted(stacknames):
+                try:
+                    stacks.extend(client.describe_stacks(
+                        StackName=name)['Stacks'])
+                except botocore.exceptions.ClientError as err:
+                    if 'does not exist' not in str(err):
+                        raise
+        return {stack['StackName']: {out['OutputKey']: out['OutputValue']
+                                     for out in stack.get('Outputs', [])}
+                for stack in stacks}
+
+
+class _Default(dict):
+    """Outputs of a stub stack, with any key resolving to the same value"""
+    def __init__(self, value):
+        super().__init__()
+        self.value = value
+
+    def __missing__(self, key):
+        return self.value
+
+    def __contains__(self, key):
+        return True
+
+
+class StubOutputBackend():
+    """
+    Offline backend resolving outputs from a static mapping, of stack names
+    to their outputs. Outputs of unknown stacks resolve to `default`. Used
+    for the ``pytest`` region.
+    """
+    cacheable = False
+
+    def __init__(self, outputs=None, default='output-notfound'):
+        self.outputs = outputs or {}
+        self.default = default
+
+    def describe(self, aws, region, stacknames):
+        return {name: self.outputs.get(name, _Default(self.default))
+                for name in stacknames}
+
+
+class OutputResolver(CachingResolver):
+    """
+    Memoizing, batching stack output lookup (see
+    `tropostack.resolver.CachingResolver`). The outputs of each referenced
+    stack are fetched once, all stacks requested through one `prefetch()`
+    call together.
+
+    Outputs change with every deploy of their stack, so cached ones are only
+    reused online for `ttl` seconds - five minutes by default. They remain
+    available offline after that.
+    """
+    error = OutputLookupError
+    cache_name = 'outputs.json'
+    default_ttl = 300
+    noun = 'Stack outputs'
+
+    def _default_backend(self):
+        return CloudFormationOutputBackend()
+
+    def _stub_backend(self):
+        return StubOutputBackend()
+
+    def _value(self, region, name, found):
+        if name not in found:
+            raise OutputLookupError('Stack not found in %s: %s'
+                                    % (region, name))
+        return found[name]
+
+    def resolve(self, region, stackname, key, aws=None):
+        """
+        Value of the output `key` of `stackname` in `region`
+
+        Raises:
+            tropostack.exceptions.OutputLookupError: If the stack does not
+                exist or has no such output
+        """
+        outputs = self.lookup(region, stackname, aws=aws)
+        if key not in outputs:
+            raise OutputLookupError('Stack %s has no output: %s'
+                                    % (stackname, key))
+        return outputs[key]
+
+
+def default_resolver():
+    """
+    The process-wide `OutputResolver`, shared by all stacks. Offline mode is
+    on if ``$TROPOSTACK_OFFLINE`` is set.
+    """
+    return OutputResolver.default()
@@ -0,0 +1,280 @@
+"""
+Client-side rate limiting of AWS API calls
+"""
+import collections
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, where buckets are per process only
+    fcntl = None
+
+from .cache import cache_dir
+
+# Error codes AWS services use to signal throttling
+THROTTLING_CODES = frozenset([
+    'Throttling', 'ThrottlingException', 'ThrottledException',
+    'RequestThrottledException', 'TooManyRequestsException',
+    'RequestLimitExceeded', 'RequestThrottled', 'SlowDown',
+    'ProvisionedThroughputExceededException', 'BandwidthLimitExceeded',
+    'EC2ThrottledException', 'PriorRequestNotComplete',
+])
+
+
+def default_scope():
+    """
+    Scope of the API rate limits of the default credentials: the access key
+    set in the environment - hashed, as scopes end up in file names - else
+    the AWS profile in use
+    """
+    key_id = os.environ.get('AWS_ACCESS_KEY_ID')
+    if key_id:
+        return 'key-' + hashlib.sha256(key_id.encode('utf-8')).hexdigest()[:16]
+    return (os.environ.get('AWS_PROFILE')
+            or os.environ.get('AWS_DEFAULT_PROFILE')
+            or 'default')
+
+
+def error_code(err):
+    """Error code of a botocore ClientError, or None for other errors"""
+    response = getattr(err, 'response', None) or {}
+    return response.get('Error', {}).get('Code')
+
+
+def is_throttling(err):
+    """Whether the exception `err` is a throttling error response"""
+    return error_code(err) in THROTTLING_CODES
+
+
+class TokenBucket():
+    """
+    Thread-safe token bucket, handing out `rate` tokens per second with up to
+    `burst` saved up.
+
+    The rate adapts to throttling: each `throttled()` call cuts it by
+    `decrease` (a factor), down to `min_rate`, and each `succeeded()` call
+    raises it by `increase` tokens per second back up to `rate`.
+
+    Args:
+        rate (float): Tokens per second, at most
+        burst (float): Bucket capacity; `rate` if None
+        min_rate (float): Lowest rate throttling can push it to
+        decrease (float): Rate factor applied on throttling
+        increase (float): Rate step added on success; a tenth of `rate` if
+            None
+    """
+    def __init__(self, rate, burst=None, min_rate=0.1, decrease=0.5,
+                 increase=None):
+        self.max_rate = float(rate)
+        self.burst = float(burst or max(1.0, rate))
+        self.min_rate = min(min_rate, self.max_rate)
+        self.decrease = decrease
+        self.increase = self.max_rate / 10 if increase is None else increase
+        self._state = None
+        self._lock = threading.Lock()
+
+    def _initial(self):
+        return {'tokens': self.burst, 'stamp': time.time(),
+                'rate': self.max_rate}
+
+    def _transact(self, update):
+        """Run `update` on the bucket state, returning its result"""
+        with self._lock:
+            if self._state is None:
+                self._state = self._initial()
+            return update(self._state)
+
+    def _take(self, state):
+        now = time.time()
+        state['tokens'] = min(self.burst, state['tokens'] + max(
+            0.0, now - state['stamp']) * state['rate'])
+        state['stamp'] = now
+        if state['tokens'] >= 1:
+            state['tokens'] -= 1
+            return 0.0
+        return (1 - state['tokens']) / state['rate']
+
+    def acquire(self):
+        """
+        Take a token, waiting for one if needed.
+
+        Returns:
+            float: Seconds spent waiting
+        """
+        waited = 0.0
+        while True:
+            delay = self._transact(self._take)
+            if not delay:
+                return waited
+            time.sleep(delay)
+            waited += delay
+
+    def throttled(self):
+        """The API pushed back - slow down"""
+        def update(state):
+            state['rate'] = max(self.min_rate, state['rate'] * self.decrease)
+            # Drop any saved-up burst as well
+            state['tokens'] = min(state['tokens'], 0.0)
+        self._transact(update)
+
+    def succeeded(self):
+        """A call went through - recover towards the full rate"""
+        def update(state):
+            state['rate'] = min(self.max_rate, state['rate'] + self.increase)
+        self._transact(update)
+
+    @property
+    def rate(self):
+        """Current rate, in tokens per second"""
+        return self._transact(lambda state: state['rate'])
+
+
+class SharedTokenBucket(TokenBucket):
+    """
+    `TokenBucket` whose state lives in the file at `path`, locked while in
+    use, so that all processes using the same file draw from one budget - e.g.
+    several CLIs deploying in parallel with the same credentials.
+
+    Falls back to a per-process bucket where file locks are not available.
+    """
+    def __init__(self, path, rate, **kwargs):
+        super().__init__(rate, **kwargs)
+        self.path = path
+
+    def _transact(self, update):
+        if fcntl is None:
+            return super()._transact(update)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._lock, open(self.path, 'a+', encoding='utf-8') as fhandle:
+            fcntl.flock(fhandle, fcntl.LOCK_EX)
+            try:
+                fhandle.seek(0)
+                try:
+                    state = json.loads(fhandle.read())
+                except ValueError:
+                    state = self._initial()
+                result = update(state)
+                fhandle.seek(0)
+                fhandle.truncate()
+                fhandle.write(json.dumps(state))
+                fhandle.flush()
+                return result
+            finally:
+                fcntl.flock(fhandle, fcntl.LOCK_UN)
+
+
+class RateLimiter():
+    """
+    Rate limits the API calls of boto3 clients, with a `TokenBucket` per
+    service and region - shared by all clients attached (see `attach()`).
+
+    Every HTTP request, retries included, waits for a token of its bucket.
+    Throttling responses slow the bucket down, while botocore's retry
+    handling goes on as usual. Counts of the calls, throttling responses and
+    time spent waiting are kept per bucket, and summed up with those of the
+    `scoped()` limiters (see `stats()`).
+
+    Args:
+        rate (float): API calls per second, per service and region
+        rates (dict): Rates of specific services, overriding `rate`
+        shared (bool): Coordinate the buckets between processes through
+            lock files
+        scope (str): Label separating the buckets of different accounts;
+            `default_scope()` if None
+        bucket_kwargs: Passed on to the `TokenBucket` instances
+    """
+    def __init__(self, rate=5.0, rates=None, shared=False, scope=None,
+                 **bucket_kwargs):
+        self.rate = rate
+        self.rates = dict(rates or {})
+        self.shared = shared
+        self.scope = default_scope() if scope is None else scope
+        self.bucket_kwargs = bucket_kwargs
+        self.counters = collections.defaultdict(collections.Counter)
+        self._buckets = {}
+        self._scoped = {}
+        self._lock = threading.Lock()
+
+    def scoped(self, scope):
+        """
+        Limiter with the same settings, for the account of `scope` - one per
+        scope, whose counters add up to those of this limiter
+        """
+        with self._lock:
+            if scope not in self._scoped:
+                self._scoped[scope] = RateLimiter(
+                    self.rate, self.rates, self.shared, scope,
+                    **self.bucket_kwargs)
+            return self._scoped[scope]
+
+    def bucket(self, service, region):
+        """The `TokenBucket` of `service` in `region`"""
+        key = (service, region)
+        with self._lock:
+            if key not in self._buckets:
+                rate = self.rates.get(service, self.rate)
+                if self.shared:
+                    name = re.sub(r'[^\w.-]', '_', '%s-%s-%s' % (
+                        self.scope, service, region))
+                    self._buckets[key] = SharedTokenBucket(
+                        cache_dir('ratelimit', name + '.json'), rate,
+                        **self.bucket_kwargs)
+                else:
+                    self._buckets[key] = TokenBucket(rate,
+                                                     **self.bucket_kwargs)
+            return self._buckets[key]
+
+    def attach(self, client):
+        """Rate limit the API calls of the boto3 `client`"""
+        service = client.meta.service_model.service_name
+        key = (service, client.meta.region_name)
+        bucket = self.bucket(*key)
+        counters = self.counters[key]
+
+        def before_send(**kwargs):
+            waited = bucket.acquire()
+            with self._lock:
+                counters['calls'] += 1
+                counters['waited_ms'] += int(waited * 1000)
+
+        def needs_retry(response=None, **kwargs):
+            # Called after every attempt, retried or not
+            parsed = response[1] if response else {}
+            if parsed.get('Error', {}).get('Code') in THROTTLING_CODES:
+                bucket.throttled()
+                with self._lock:
+                    counters['throttled'] += 1
+            elif response:
+                bucket.succeeded()
+
+        client.meta.events.register('before-send.*.*', before_send)
+        client.meta.events.register('needs-retry.*.*', needs_retry)
+
+    def _totals(self):
+        """Counters per (service, region), scoped limiters included"""
+        with self._lock:
+            totals = collections.defaultdict(collections.Counter)
+            for key, counts in self.counters.items():
+                totals[key].update(counts)
+            scoped = list(self._scoped.values())
+        for limiter in scoped:
+            for key, counts in limiter._totals().items():
+                totals[key].update(counts)
+        return totals
+
+    def stats(self):
+        """
+        Returns:
+            list: ``[service, region, calls, throttled, waited seconds]``
+            rows, one per service and region, over all scopes
+        """
+        return [[service, region, counts['calls'], counts['throttled'],
+                 counts['waited_ms'] / 1000.0]
+                for (service, region), counts in sorted(
+                    self._totals().items(), key=str)]
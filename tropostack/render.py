@@ -0,0 +1,135 @@
+"""
+Compiling many stacks to template files in one go
+"""
+import importlib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from .cache import atomic_write
+from .conf_loaders import PartitionedConfig
+from .exceptions import InvalidStackError
+from .serialize import FORMATS, dumps
+
+
+def render_stack(modname, qualname, conf, fmt='yaml'):
+    """
+    Instantiate, compile and serialize a single stack. Runs in the worker
+    processes of `Renderer`, so it takes the stack class by its import path.
+
+    Returns:
+        tuple: The stack name, its region, the template body and a dict of
+        the seconds spent on each step
+    """
+    timings = {}
+    started = time.perf_counter()
+    stack_cls = importlib.import_module(modname)
+    for attr in qualname.split('.'):
+        stack_cls = getattr(stack_cls, attr)
+    stack = stack_cls(conf)
+    timings['import'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    template = stack.compile()
+    timings['compile'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    body = dumps(template, fmt)
+    timings['serialize'] = time.perf_counter() - started
+    return stack.stackname, stack.region, body, timings
+
+
+class Renderer():
+    """
+    Renders the templates of many stacks into an output directory, compiling
+    them in parallel on a process pool - compilation is CPU-bound, so threads
+    would not help.
+
+    Templates are written as ``<stackname>.<fmt>``. Each file is written
+    atomically, and left untouched if its content did not change.
+
+    Args:
+        stack_classes (list): Stack classes to be rendered; these must be
+            importable by the worker processes
+        conf (dict): Partitioned configuration (see
+            `tropostack.conf_loaders.PartitionedConfig`); empty by default
+        outdir (str): Directory to write the templates to
+        fmt (str): Template format - yaml or json
+        workers (int): Number of worker processes - defaults to the number of
+            CPUs; with 1, stacks are rendered in the current process
+    """
+    def __init__(self, stack_classes, conf=None, outdir='templates',
+                 fmt='yaml', workers=None):
+        if fmt not in FORMATS:
+            raise ValueError('Unsupported template format: %s' % fmt)
+        if not isinstance(conf, PartitionedConfig):
+            conf = PartitionedConfig(conf or {})
+        self.conf = conf
+        self.stack_classes = list(stack_classes)
+        self.outdir = outdir
+        self.fmt = fmt
+        self.workers = workers or os.cpu_count() or 1
+        self.timings = {}
+
+    def _jobs(self):
+        for stack_cls in self.stack_classes:
+            yield (stack_cls.__module__, stack_cls.__qualname__,
+                   dict(self.conf.stack_conf(stack_cls.BASE_NAME)), self.fmt)
+
+    def write(self, stackname, body):
+        """
+        Store the template of `stackname`, unless an identical one is there.
+
+        Returns:
+            str: Path of the template file
+        """
+        path = os.path.join(self.outdir, '%s.%s' % (stackname, self.fmt))
+        try:
+            with open(path, encoding='utf-8') as fhandle:
+                if fhandle.read() == body:
+                    return path
+        except OSError:
+            pass
+        atomic_write(path, body)
+        return path
+
+    def run(self):
+        """
+        Render all stacks.
+
+        Returns:
+            dict: Stack name to ``(region, template path)``
+
+        Raises:
+            tropostack.exceptions.InvalidStackError: If two stacks share a name
+        """
+        jobs = list(self._jobs())
+        if self.workers == 1 or len(jobs) < 2:
+            rendered = [render_stack(*job) for job in jobs]
+        else:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                rendered = list(pool.map(render_stack, *zip(*jobs)))
+
+        results = {}
+        for stackname, region, body, timings in rendered:
+            if stackname in results:
+                raise InvalidStackError('Duplicate stack name: %s'
+                                        % stackname)
+            started = time.perf_counter()
+            results[stackname] = (region, self.write(stackname, body))
+            timings['write'] = time.perf_counter() - started
+            self.timings[stackname] = timings
+        return results
+
+    def report(self):
+        """Per-stack timings, slowest first, as a printable table"""
+        import tabulate
+        steps = ('import', 'compile', 'serialize', 'write')
+        rows = sorted(
+            ([name] + [timings[step] for step in steps]
+             + [sum(timings.values())]
+             for name, timings in self.timings.items()),
+            key=lambda row: (-row[-1], row[0]))
+        return tabulate.tabulate(
+            rows, headers=['STACK'] + [step.upper() for step in steps]
+            + ['TOTAL'], floatfmt='.3f')
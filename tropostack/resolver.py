@@ -0,0 +1,159 @@
+"""
+Memoizing, persistent lookups of deployed AWS state at compile time
+"""
+import json
+import os
+import threading
+import time
+
+from tropostack.cache import atomic_write, cache_dir
+
+
+class CachingResolver():
+    """
+    Base of the memoizing, batching resolvers of `tropostack.ami` and
+    `tropostack.outputs`.
+
+    All names requested through one `prefetch()` call are looked up with a
+    single backend call per region, made without holding the resolver lock,
+    so that lookups in other regions go on in parallel. Results are kept in
+    memory for the lifetime of the resolver and, for real backends, in an
+    on-disk cache, reused for `ttl` seconds. In `offline` mode, cached
+    results are used whatever their age, and a cache miss raises an error
+    instead of calling the API.
+
+    Backends other than the default one can be registered per region - the
+    ``pytest`` region is served by a stub backend out of the box.
+
+    Subclasses set `error`, `cache_name` and `default_ttl`, and implement
+    `_default_backend()`, `_stub_backend()` and `_value()`.
+    """
+    # Exception raised on failed lookups
+    error = RuntimeError
+    # File name of the on-disk cache, in the cache directory
+    cache_name = None
+    default_ttl = 0
+    # What a name stands for, in error messages
+    noun = 'Name'
+
+    def __init__(self, backend=None, cache_path=None, ttl=None,
+                 offline=False):
+        self.backend = backend or self._default_backend()
+        self.backends = {'pytest': self._stub_backend()}
+        self.cache_path = cache_path or cache_dir(self.cache_name)
+        self.ttl = self.default_ttl if ttl is None else ttl
+        self.offline = offline
+        self._memo = {}
+        self._disk = None
+        # Names being looked up by some thread, to the event set once done
+        self._pending = {}
+        self._lock = threading.RLock()
+
+    def _default_backend(self):
+        raise NotImplementedError
+
+    def _stub_backend(self):
+        raise NotImplementedError
+
+    def _value(self, region, name, found):
+        """
+        The value to memoize for `name`, out of the backend results `found`
+
+        Raises:
+            error: If `found` has no usable value for `name`
+        """
+        raise NotImplementedError
+
+    def register_backend(self, region, backend):
+        """Serve lookups in `region` through `backend`"""
+        self.backends[region] = backend
+
+    def _load_disk(self):
+        if self._disk is None:
+            try:
+                with open(self.cache_path, encoding='utf-8') as fhandle:
+                    self._disk = json.load(fhandle)
+            except (OSError, ValueError):
+                self._disk = {}
+        return self._disk
+
+    def _save_disk(self):
+        atomic_write(self.cache_path, json.dumps(self._disk, sort_keys=True))
+
+    def _missing(self, region, names, cacheable):
+        """Names still unknown once the on-disk cache has been consulted"""
+        missing = {name for name in names if (region, name) not in self._memo}
+        if cacheable and missing:
+            disk = self._load_disk()
+            for name in sorted(missing):
+                entry = disk.get('%s %s' % (region, name))
+                if entry and (self.offline
+                              or time.time() - entry[1] <= self.ttl):
+                    self._memo[region, name] = entry[0]
+                    missing.discard(name)
+        return missing
+
+    def prefetch(self, region, names, aws=None):
+        """
+        Look up all `names` in `region` that are not known yet, in one batch.
+
+        Raises:
+            error: If a lookup fails, or misses the cache in offline mode
+        """
+        backend = self.backends.get(region, self.backend)
+        while True:
+            with self._lock:
+                missing = self._missing(region, names, backend.cacheable)
+                waits = {self._pending[region, name] for name in missing
+                         if (region, name) in self._pending}
+                if not waits:
+                    break
+            # Another thread is looking some of them up already
+            for event in waits:
+                event.wait()
+        if not missing:
+            return
+        if self.offline and backend.cacheable:
+            raise self.error('%s not cached for offline use: %s' % (
+                self.noun, ', '.join(sorted(missing))))
+        done = threading.Event()
+        with self._lock:
+            for name in missing:
+                self._pending[region, name] = done
+        try:
+            found = backend.describe(aws, region, missing)
+            with self._lock:
+                for name in sorted(missing):
+                    value = self._value(region, name, found)
+                    self._memo[region, name] = value
+                    if backend.cacheable:
+                        self._load_disk()['%s %s' % (region, name)] = [
+                            value, time.time()]
+                if backend.cacheable:
+                    self._save_disk()
+        finally:
+            with self._lock:
+                for name in missing:
+                    del self._pending[region, name]
+            done.set()
+
+    def lookup(self, region, name, aws=None):
+        """The memoized value of `name` in `region`"""
+        self.prefetch(region, [name], aws=aws)
+        return self._memo[region, name]
+
+    @classmethod
+    def default(cls):
+        """
+        The process-wide resolver of this class, shared by all stacks.
+        Offline mode is on if ``$TROPOSTACK_OFFLINE`` is set.
+        """
+        with _DEFAULTS_LOCK:
+            if cls not in _DEFAULTS:
+                offline = bool(os.environ.get('TROPOSTACK_OFFLINE'))
+                _DEFAULTS[cls] = cls(offline=offline)
+            return _DEFAULTS[cls]
+
+
+_DEFAULTS = {}
+_DEFAULTS_LOCK = threading.Lock()
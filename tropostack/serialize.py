@@ -0,0 +1,113 @@
+"""
+Fast rendering of compiled templates to YAML and JSON
+"""
+import json
+
+import yaml
+
+from tropostack import instrument
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+FORMATS = ('yaml', 'json')
+
+# Single-key mappings with these keys are written as short-form YAML tags,
+# besides the ``Fn::`` ones
+_SHORT_FORM_KEYS = ('Ref', 'Condition')
+
+
+class _Dumper(getattr(yaml, 'CSafeDumper', yaml.SafeDumper)):
+    """SafeDumper, C-accelerated if libyaml is available"""
+    # CloudFormation does not support YAML anchors and aliases
+    def ignore_aliases(self, data):
+        return True
+
+
+def _represent_fn(dumper, name, arg):
+    tag = '!' + name
+    if name == 'GetAtt' and isinstance(arg, list) \
+            and all(isinstance(part, str) for part in arg):
+        arg = '.'.join(arg)
+    if isinstance(arg, list):
+        return dumper.represent_sequence(tag, arg)
+    if isinstance(arg, dict):
+        return dumper.represent_mapping(tag, arg)
+    return dumper.represent_scalar(tag, arg)
+
+
+def _represent_dict(dumper, value):
+    if len(value) == 1:
+        key, arg = next(iter(value.items()))
+        if key in _SHORT_FORM_KEYS:
+            return _represent_fn(dumper, key, arg)
+        if key.startswith('Fn::'):
+            return _represent_fn(dumper, key[4:], arg)
+    return dumper.represent_mapping('tag:yaml.org,2002:map', value)
+
+
+def _represent_str(dumper, value):
+    # Multi-line strings (e.g. user data scripts) read best as blocks
+    style = '|' if '\n' in value else None
+    return dumper.represent_scalar('tag:yaml.org,2002:str', value, style=style)
+
+
+_Dumper.add_representer(dict, _represent_dict)
+_Dumper.add_representer(str, _represent_str)
+
+
+def template_dict(template):
+    """Plain dict form of a troposphere template, or a dict as-is"""
+    if isinstance(template, dict):
+        return template
+    return template.to_dict()
+
+
+def to_yaml(template):
+    """
+    Render a template as YAML, with intrinsic functions in their short form
+    (``!Ref``, ``!Sub``, ...).
+
+    Unlike `troposphere.Template.to_yaml`, the template is not serialized to
+    JSON and parsed back first, and libyaml does the emitting when available.
+    Keys are sorted, so the output is stable across runs.
+
+    Args:
+        template: A `troposphere.Template`, or its dict form
+    """
+    with instrument.span(instrument.PHASE, 'serialize'):
+        return yaml.dump(template_dict(template), Dumper=_Dumper,
+                         default_flow_style=False, allow_unicode=True,
+                         sort_keys=True, width=200)
+
+
+def to_json(template, compact=True):
+    """
+    Render a template as JSON with sorted keys - compact by default, or
+    indented like `troposphere.Template.to_json`. Compact output goes through
+    orjson when it is installed.
+
+    Args:
+        template: A `troposphere.Template`, or its dict form
+        compact (bool): Leave out all optional whitespace
+    """
+    with instrument.span(instrument.PHASE, 'serialize'):
+        data = template_dict(template)
+        if not compact:
+            return json.dumps(data, indent=1, sort_keys=True)
+        if orjson is not None:
+            return orjson.dumps(
+                data, option=orjson.OPT_SORT_KEYS).decode('utf-8')
+        return json.dumps(data, separators=(',', ':'), sort_keys=True,
+                          ensure_ascii=False)
+
+
+def dumps(template, fmt='yaml'):
+    """Render a template in the given format - yaml or json"""
+    if fmt == 'json':
+        return to_json(template)
+    if fmt == 'yaml':
+        return to_yaml(template)
+    raise ValueError('Unsupported template format: %s' % fmt)
@@ -0,0 +1,159 @@
+"""
+Status and outputs of many deployed stacks at once
+"""
+import csv
+import fnmatch
+import io
+import json
+import os
+import time
+
+from .cache import atomic_write, cache_dir, value_fingerprint
+
+FORMATS = ('table', 'json', 'csv')
+
+_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def name_filter(prefix=None, patterns=None):
+    """
+    Predicate on stack names: they must start with `prefix` and match any of
+    the shell-style `patterns` (e.g. ``myapp-*-prod``), if given.
+    """
+    def matches(name):
+        if prefix and not name.startswith(prefix):
+            return False
+        return not patterns or any(fnmatch.fnmatchcase(name, pattern)
+                                   for pattern in patterns)
+    return matches
+
+
+class StackStatusQuery():
+    """
+    Lists the deployed stacks of a region whose names match, in a handful of
+    paginated calls rather than one call per stack: ``describe_stacks``
+    without a stack name when outputs are wanted, ``list_stacks`` (filtered by
+    status on the API side) otherwise.
+
+    Results can be kept in a local cache for `ttl` seconds, so that repeated
+    dashboard refreshes do not hit the API.
+
+    Args:
+        aws (tropostack.aws.ClientProvider): Source of the clients
+        region (str): Region to list the stacks of; the provider's if None
+        prefix (str): Only stacks whose name starts with this
+        patterns (list): Only stacks whose name matches any of these
+            shell-style patterns
+        statuses (list): Only stacks in these statuses; all but deleted
+            stacks if empty
+        outputs (bool): Fetch the stack outputs as well
+        ttl (int): Seconds to reuse previously fetched results for; 0
+            disables the cache
+    """
+    def __init__(self, aws, region=None, prefix=None, patterns=None,
+                 statuses=None, outputs=False, ttl=0):
+        self.aws = aws
+        self.region = region or aws.region
+        self.prefix = prefix
+        self.patterns = list(patterns or [])
+        self.statuses = list(statuses or [])
+        self.outputs = outputs
+        self.ttl = ttl
+
+    @property
+    def cache_path(self):
+        key = value_fingerprint([
+            self.region, os.environ.get('AWS_PROFILE'), self.prefix,
+            self.patterns, sorted(self.statuses), self.outputs])
+        return cache_dir('status', key + '.json')
+
+    def _cached(self):
+        if self.ttl <= 0:
+            return None
+        try:
+            with open(self.cache_path, encoding='utf-8') as fhandle:
+                cached = json.load(fhandle)
+        except (OSError, ValueError):
+            return None
+        if time.time() - cached['time'] > self.ttl:
+            return None
+        return cached['stacks']
+
+    def _summaries(self, cfn):
+        if self.outputs:
+            pages = cfn.get_paginator('describe_stacks').paginate()
+            return (stack for page in pages for stack in page['Stacks'])
+        kwargs = {}
+        if self.statuses:
+            kwargs['StackStatusFilter'] = self.statuses
+        pages = cfn.get_paginator('list_stacks').paginate(**kwargs)
+        return (stack for page in pages for stack in page['StackSummaries'])
+
+    def fetch(self):
+        """
+        Returns:
+            list: One dict per matching stack, by name - with the
+            ``Region``, ``StackName``, ``StackStatus``, ``Updated`` timestamp
+            and, if requested, the ``Outputs`` as a key to value dict
+        """
+        cached = self._cached()
+        if cached is not None:
+            return cached
+        matches = name_filter(self.prefix, self.patterns)
+        cfn = self.aws.client('cloudformation', region=self.region)
+        stacks = []
+        for summary in self._summaries(cfn):
+            status = summary['StackStatus']
+            if not matches(summary['StackName']) or (
+                    status not in self.statuses if self.statuses
+                    else status == 'DELETE_COMPLETE'):
+                continue
+            updated = summary.get('LastUpdatedTime') or \
+                summary['CreationTime']
+            stack = {
+                'Region': self.region or '',
+                'StackName': summary['StackName'],
+                'StackStatus': status,
+                'Updated': updated.strftime(_TIME_FORMAT),
+            }
+            if self.outputs:
+                stack['Outputs'] = {out['OutputKey']: out.get('OutputValue')
+                                    for out in summary.get('Outputs', [])}
+            stacks.append(stack)
+        stacks.sort(key=lambda stack: stack['StackName'])
+        if self.ttl > 0:
+            atomic_write(self.cache_path, json.dumps(
+                {'time': time.time(), 'stacks': stacks}))
+        return stacks
+
+
+def _rows(stacks):
+    """Flat rows - one per stack output, or per stack without outputs"""
+    for stack in stacks:
+        base = [stack['Region'], stack['StackName'], stack['StackStatus'],
+                stack['Updated']]
+        if 'Outputs' not in stack:
+            yield base
+            continue
+        for key, value in sorted(stack['Outputs'].items()) or [('', '')]:
+            yield base + [key, value]
+
+
+def format_stacks(stacks, fmt='table', outputs=False):
+    """Render the result of `StackStatusQuery.fetch()` as `fmt`"""
+    if fmt == 'json':
+        return json.dumps(stacks, indent=2)
+    headers = ['REGION', 'STACK', 'STATUS', 'UPDATED (UTC)']
+    if outputs:
+        headers += ['OUTPUT', 'VALUE']
+    if fmt == 'csv':
+        buf = io.StringIO()
+        writer = csv.writer(buf, lineterminator='\n')
+        writer.writerow(headers)
+        writer.writerows(_rows(stacks))
+        return buf.getvalue()
+    if fmt == 'table':
+        import tabulate
+        return tabulate.tabulate(list(_rows(stacks)), headers=headers)
+    raise ValueError('Unknown format: %s (expected one of %s)'
+                     % (fmt, ', '.join(FORMATS)))
@@ -0,0 +1,464 @@
+"""
+In-memory fakes of the AWS clients used by tropostack, for tests
+"""
+import collections
+import io
+import itertools
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import botocore.exceptions
+
+from tropostack.diff import diff_templates, load_template
+
+_OK = {'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+
+def client_error(operation, message, code='ValidationError'):
+    """Build a botocore ClientError, as raised by the real clients"""
+    return botocore.exceptions.ClientError(
+        {'Error': {'Code': code, 'Message': message}}, operation)
+
+
+class _FakeClient():
+    """
+    Common behaviour of the fake clients: API call counting, simulated
+    latency and throttling.
+
+    Args:
+        latency (float): Seconds each API call takes
+        throttle_every (int): Fail every n-th API call with a throttling
+            error, as a rate-limited API would; never if 0
+    """
+    def __init__(self, latency=0.0, throttle_every=0):
+        self.latency = latency
+        self.throttle_every = throttle_every
+        self.calls = collections.Counter()
+        self.throttled = 0
+        self._attempts = 0
+        self._calls_lock = threading.Lock()
+
+    def _api(self, operation):
+        """Account for a call of `operation`, raising if it gets throttled"""
+        with self._calls_lock:
+            self.calls[operation] += 1
+            self._attempts += 1
+            throttle = self.throttle_every and \
+                self._attempts % self.throttle_every == 0
+            if throttle:
+                self.throttled += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if throttle:
+            name = ''.join(part.title() for part in operation.split('_'))
+            raise client_error(name, 'Rate exceeded', 'Throttling')
+
+
+class _Paginator():
+    """Pages through a fake client method returning ``NextToken``"""
+    def __init__(self, method):
+        self.method = method
+
+    def paginate(self, **kwargs):
+        while True:
+            page = self.method(**kwargs)
+            yield page
+            if not page.get('NextToken'):
+                return
+            kwargs['NextToken'] = page['NextToken']
+
+
+class _FakeStack():
+    def __init__(self, name, region):
+        self.name = name
+        self.stack_id = 'arn:aws:cloudformation:%s:000000000000:stack/%s/%s' \
+            % (region, name, uuid.uuid4())
+        self.status = None
+        self.template = None
+        self.tags = []
+        self.outputs = []
+        self.events = []
+        # Events yet to happen, released one per poll
+        self.pending = collections.deque()
+        self.final_status = None
+
+
+class FakeCloudFormation(_FakeClient):
+    """
+    In-memory stand-in for the boto3 CloudFormation client.
+
+    Stack operations progress as the stack gets polled: each
+    ``describe_stacks``/``describe_stack_events`` call releases the next
+    simulated event (one per template resource), until the operation
+    completes. With `steps_per_event` of 0, stacks only progress on `tick()`
+    instead - e.g. once per poller sleep, to simulate wall-clock time. API
+    call counts are kept in `calls`.
+
+    Args:
+        region (str): Region reported in stack IDs
+        steps_per_event (int): Polls needed to release each event; only
+            `tick()` releases them if 0
+        page_size (int): Events per ``describe_stack_events`` page
+        latency (float): Seconds each API call takes
+        throttle_every (int): Fail every n-th API call with a throttling
+            error; never if 0
+    """
+    def __init__(self, region='us-east-1', steps_per_event=1, page_size=100,
+                 latency=0.0, throttle_every=0):
+        super().__init__(latency, throttle_every)
+        self.region = region
+        self.steps_per_event = steps_per_event
+        self.page_size = page_size
+        self.stacks = {}
+        # All stacks ever created, deleted ones included, by stack ID
+        self.stack_ids = {}
+        self.change_sets = {}
+        self.clock = datetime.now(timezone.utc)
+        self._steps = 0
+        self._event_ids = itertools.count()
+        self._lock = threading.RLock()
+
+    # Simulation helpers
+    def _now(self):
+        self.clock += timedelta(seconds=1)
+        return self.clock
+
+    def _stack(self, operation, name, exists=True):
+        stack = self.stacks.get(name)
+        if stack is None and name in self.stack_ids:
+            # Deleted stacks can still be described by their ID
+            return self.stack_ids[name]
+        if exists and (stack is None or stack.status == 'DELETE_COMPLETE'):
+            raise client_error(operation, 'Stack with id %s does not exist'
+                               % name)
+        return stack
+
+    def _event(self, stack, logical_id, rtype, status, reason=None):
+        event = {
+            'StackId': stack.stack_id,
+            'EventId': 'event-%d' % next(self._event_ids),
+            'StackName': stack.name,
+            'LogicalResourceId': logical_id,
+            'ResourceType': rtype,
+            'ResourceStatus': status,
+        }
+        if reason:
+            event['ResourceStatusReason'] = reason
+        return event
+
+    def _start(self, stack, action, template, reason='User Initiated'):
+        """Queue up the events of a stack create/update/delete"""
+        stack.status = '%s_IN_PROGRESS' % action
+        self._record(stack, self._event(
+            stack, stack.name, 'AWS::CloudFormation::Stack', stack.status,
+            reason))
+        resources = sorted(template.get('Resources', {}).items())
+        for logical_id, rsc in resources:
+            for status in ('IN_PROGRESS', 'COMPLETE'):
+                stack.pending.append(self._event(
+                    stack, logical_id, rsc.get('Type', ''),
+                    '%s_%s' % (action, status)))
+        final = '%s_COMPLETE' % action
+        stack.pending.append(self._event(
+            stack, stack.name, 'AWS::CloudFormation::Stack', final))
+        stack.final_status = final
+
+    def _record(self, stack, event):
+        event['Timestamp'] = self._now()
+        stack.events.insert(0, event)
+
+    def _advance(self, stack):
+        if not self.steps_per_event:
+            return
+        self._steps += 1
+        if self._steps % self.steps_per_event:
+            return
+        self._release(stack)
+
+    def _release(self, stack):
+        if not stack.pending:
+            return
+        self._record(stack, stack.pending.popleft())
+        if not stack.pending:
+            stack.status = stack.final_status
+            if stack.status == 'DELETE_COMPLETE':
+                del self.stacks[stack.name]
+
+    def _set_template(self, stack, body):
+        stack.template = body
+        tmpl = load_template(body)
+        stack.outputs = [
+            {'OutputKey': key, 'OutputValue': '%s-%s' % (stack.name, key)}
+            for key in sorted(tmpl.get('Outputs', {}))]
+        return tmpl
+
+    def tick(self):
+        """Release the next event of every stack operation in progress"""
+        with self._lock:
+            for stack in list(self.stacks.values()):
+                self._release(stack)
+
+    # Client API
+    def get_paginator(self, operation):
+        return _Paginator(getattr(self, operation))
+
+    def validate_template(self, TemplateBody=None, TemplateURL=None):
+        self._api('validate_template')
+        with self._lock:
+            load_template(TemplateBody or '{}')
+            return dict(_OK)
+
+    def create_stack(self, StackName, TemplateBody=None, TemplateURL=None,
+                     Capabilities=None, Tags=None):
+        self._api('create_stack')
+        with self._lock:
+            if self._stack('CreateStack', StackName, exists=False):
+                raise client_error('CreateStack', 'Stack [%s] already exists'
+                                   % StackName, 'AlreadyExistsException')
+            stack = self.stacks[StackName] = _FakeStack(StackName,
+                                                        self.region)
+            self.stack_ids[stack.stack_id] = stack
+            stack.tags = list(Tags or [])
+            tmpl = self._set_template(stack, TemplateBody or '{}')
+            self._start(stack, 'CREATE', tmpl)
+            return dict(_OK, StackId=stack.stack_id)
+
+    def update_stack(self, StackName, TemplateBody=None, TemplateURL=None,
+                     Capabilities=None, Tags=None):
+        self._api('update_stack')
+        with self._lock:
+            stack = self._stack('UpdateStack', StackName)
+            old = load_template(stack.template)
+            tmpl = self._set_template(stack, TemplateBody or '{}')
+            if not diff_templates(old, tmpl) and list(Tags or []) == \
+                    stack.tags:
+                raise client_error('UpdateStack',
+                                   'No updates are to be performed.')
+            stack.tags = list(Tags or [])
+            self._start(stack, 'UPDATE', tmpl)
+            return dict(_OK, StackId=stack.stack_id)
+
+    def delete_stack(self, StackName):
+        self._api('delete_stack')
+        with self._lock:
+            stack = self._stack('DeleteStack', StackName)
+            self._start(stack, 'DELETE', load_template(stack.template))
+            return dict(_OK)
+
+    def describe_stacks(self, StackName=None, NextToken=None):
+        self._api('describe_stacks')
+        with self._lock:
+            if StackName:
+                stacks = [self._stack('DescribeStacks', StackName)]
+                self._advance(stacks[0])
+            else:
+                stacks = [self.stacks[name] for name in sorted(self.stacks)]
+            start = int(NextToken or 0)
+            page = stacks[start:start + self.page_size]
+            resp = {'Stacks': [{
+                'StackId': stack.stack_id,
+                'StackName': stack.name,
+                'StackStatus': stack.status,
+                'CreationTime': stack.events[-1]['Timestamp'],
+                'Tags': list(stack.tags),
+                'Outputs': list(stack.outputs),
+            } for stack in page]}
+            if start + self.page_size < len(stacks):
+                resp['NextToken'] = str(start + self.page_size)
+            return resp
+
+    def list_stacks(self, StackStatusFilter=None, NextToken=None):
+        self._api('list_stacks')
+        with self._lock:
+            stacks = [self.stacks[name] for name in sorted(self.stacks)
+                      if not StackStatusFilter
+                      or self.stacks[name].status in StackStatusFilter]
+            start = int(NextToken or 0)
+            resp = {'StackSummaries': [{
+                'StackId': stack.stack_id,
+                'StackName': stack.name,
+                'StackStatus': stack.status,
+                'CreationTime': stack.events[-1]['Timestamp'],
+            } for stack in stacks[start:start + self.page_size]]}
+            if start + self.page_size < len(stacks):
+                resp['NextToken'] = str(start + self.page_size)
+            return resp
+
+    def describe_stack_events(self, StackName, NextToken=None):
+        self._api('describe_stack_events')
+        with self._lock:
+            stack = self._stack('DescribeStackEvents', StackName)
+            if NextToken is None:
+                self._advance(stack)
+            start = int(NextToken or 0)
+            resp = {'StackEvents': [
+                dict(event) for event in
+                stack.events[start:start + self.page_size]]}
+            if start + self.page_size < len(stack.events):
+                resp['NextToken'] = str(start + self.page_size)
+            return resp
+
+    def get_template(self, StackName, TemplateStage=None):
+        self._api('get_template')
+        with self._lock:
+            return {'TemplateBody': self._stack('GetTemplate',
+                                                StackName).template}
+
+    def create_change_set(self, StackName, ChangeSetName, ChangeSetType,
+                          TemplateBody=None, TemplateURL=None,
+                          Capabilities=None, Tags=None):
+        self._api('create_change_set')
+        with self._lock:
+            stack = self._stack('CreateChangeSet', StackName)
+            cs_id = 'arn:aws:cloudformation:%s:000000000000:changeSet/%s/%s' \
+                % (self.region, ChangeSetName, uuid.uuid4())
+            new = load_template(TemplateBody or '{}')
+            changes = diff_templates(load_template(stack.template), new)
+            change_set = {
+                'StackName': StackName, 'Status': 'CREATE_COMPLETE',
+                'Changes': [{'Type': 'Resource', 'ResourceChange': {
+                    'Action': action, 'LogicalResourceId': name,
+                    'ResourceType': new.get('Resources', {}).get(
+                        name, {}).get('Type', ''),
+                }} for action, section, name in changes
+                    if section == 'Resources'],
+                'TemplateBody': TemplateBody, 'Tags': list(Tags or []),
+            }
+            if not changes and change_set['Tags'] == stack.tags:
+                change_set['Status'] = 'FAILED'
+                change_set['StatusReason'] = "The submitted information " \
+                    "didn't contain changes. Submit different information " \
+                    "to create a change set."
+            self.change_sets[cs_id] = change_set
+            return {'Id': cs_id, 'StackId': stack.stack_id}
+
+    def describe_change_set(self, ChangeSetName, StackName=None,
+                            NextToken=None):
+        self._api('describe_change_set')
+        with self._lock:
+            change_set = self.change_sets[ChangeSetName]
+            return {key: value for key, value in change_set.items()
+                    if key not in ('TemplateBody', 'Tags')}
+
+    def delete_change_set(self, ChangeSetName, StackName=None):
+        self._api('delete_change_set')
+        with self._lock:
+            del self.change_sets[ChangeSetName]
+            return {}
+
+    def execute_change_set(self, ChangeSetName, StackName=None):
+        self._api('execute_change_set')
+        with self._lock:
+            change_set = self.change_sets.pop(ChangeSetName)
+            stack = self._stack('ExecuteChangeSet', change_set['StackName'])
+            stack.tags = change_set['Tags']
+            tmpl = self._set_template(stack, change_set['TemplateBody'])
+            self._start(stack, 'UPDATE', tmpl)
+            return {}
+
+
+class FakeEC2(_FakeClient):
+    """
+    In-memory stand-in for the boto3 EC2 client, serving ``describe_images``
+    from `images` - a mapping of manifest locations to AMI IDs.
+    """
+    def __init__(self, region='us-east-1', images=None, latency=0.0,
+                 throttle_every=0):
+        super().__init__(latency, throttle_every)
+        self.region = region
+        self.images = dict(images or {})
+
+    def describe_images(self, Filters=None, ImageIds=None, Owners=None):
+        self._api('describe_images')
+        locations = set(self.images)
+        for filt in Filters or []:
+            if filt['Name'] == 'manifest-location':
+                locations &= set(filt['Values'])
+        return dict(_OK, Images=[
+            {'ImageId': self.images[loc], 'ImageLocation': loc}
+            for loc in sorted(locations)])
+
+
+class FakeS3(_FakeClient):
+    """In-memory stand-in for the boto3 S3 client, with `objects` by key"""
+    def __init__(self, region='us-east-1', latency=0.0, throttle_every=0):
+        super().__init__(latency, throttle_every)
+        self.region = region
+        self.objects = {}
+
+    def _object(self, operation, bucket, key):
+        try:
+            return self.objects[bucket, key]
+        except KeyError:
+            raise client_error(operation, 'Not Found', '404')
+
+    def head_object(self, Bucket, Key):
+        self._api('head_object')
+        return dict(_OK, ContentLength=len(self._object('HeadObject', Bucket,
+                                                        Key)))
+
+    def get_object(self, Bucket, Key):
+        self._api('get_object')
+        return dict(_OK, Body=io.BytesIO(self._object('GetObject', Bucket,
+                                                      Key)))
+
+    def put_object(self, Bucket, Key, Body):
+        self._api('put_object')
+        self.objects[Bucket, Key] = Body if isinstance(Body, bytes) \
+            else Body.encode('utf-8')
+        return dict(_OK)
+
+
+class FakeProvider():
+    """
+    Drop-in for `tropostack.aws.ClientProvider` handing out fake clients,
+    one per (service, region) - CloudFormation, EC2 and S3 ones by default.
+
+    Args:
+        factories (dict): Service name to a callable taking the region and
+            returning the fake client
+        latency (float): Seconds each API call of the default fakes takes
+        throttle_every (int): Have the default fakes throttle every n-th API
+            call; never if 0
+        fake_kwargs: Further `FakeCloudFormation` arguments
+    """
+    def __init__(self, region='us-east-1', factories=None, latency=0.0,
+                 throttle_every=0, **fake_kwargs):
+        self.region = region
+        common = {'latency': latency, 'throttle_every': throttle_every}
+        self.factories = {
+            'cloudformation': lambda region: FakeCloudFormation(
+                region, **dict(common, **fake_kwargs)),
+            'ec2': lambda region: FakeEC2(region, **common),
+            's3': lambda region: FakeS3(region, **common),
+        }
+        self.factories.update(factories or {})
+        self.fake_kwargs = dict(common, **fake_kwargs)
+        self.clients = {}
+        # Providers handed out by `assume_role`, by role ARN
+        self.assumed = {}
+        self._lock = threading.Lock()
+
+    def client(self, service, region=None):
+        key = (service, region or self.region)
+        with self._lock:
+            if key not in self.clients:
+                self.clients[key] = self.factories[service](key[1])
+            return self.clients[key]
+
+    def assume_role(self, role_arn, session_name='tropostack'):
+        """Separate fake provider per role, standing for another account"""
+        with self._lock:
+            if role_arn not in self.assumed:
+                self.assumed[role_arn] = FakeProvider(
+                    self.region, dict(self.factories), **self.fake_kwargs)
+            return self.assumed[role_arn]
+
+    def calls(self):
+        """API call counts summed across all fake clients"""
+        total = collections.Counter()
+        for client in self.clients.values():
+            total.update(client.calls)
+        return total
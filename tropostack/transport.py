@@ -0,0 +1,100 @@
+"""
+Passing templates on to the CloudFormation API
+"""
+import hashlib
+import json
+
+
+from tropostack.diff import load_template
+
+# CloudFormation limits on the template size, in bytes
+INLINE_LIMIT = 51200
+URL_LIMIT = 1024 * 1024
+
+
+def minify(body):
+    """Compact JSON rendering of a JSON/YAML template body"""
+    return json.dumps(load_template(body), separators=(',', ':'),
+                      sort_keys=True)
+
+
+class TemplateTransport():
+    """
+    Decides how a template is handed to CloudFormation. Templates within the
+    inline limit go in ``TemplateBody``. Larger ones are minified to JSON
+    first, and if that is still too big they get uploaded to S3 and passed
+    as ``TemplateURL``.
+
+    Uploads are content-addressed - the object key is the hash of the
+    template - so an unchanged template is never uploaded twice.
+
+    Args:
+        aws (tropostack.aws.ClientProvider): Source of the S3 client
+        bucket (str): S3 bucket for large templates; None disables uploads
+        region (str): Region of the bucket
+        prefix (str): Key prefix for uploaded templates
+        inline_limit (int): Largest template passed inline, in bytes
+    """
+    def __init__(self, aws, bucket=None, region=None, prefix='tropostack/',
+                 inline_limit=INLINE_LIMIT):
+        self.aws = aws
+        self.bucket = bucket
+        self.region = region
+        self.prefix = prefix
+        self.inline_limit = inline_limit
+
+    def template_args(self, body):
+        """
+        Keyword arguments passing `body` to CloudFormation API calls, e.g.
+        ``create_stack(**transport.template_args(body), ...)``.
+
+        Raises:
+            RuntimeError: If the template is too large to be passed on
+        """
+        size = len(body.encode('utf-8'))
+        if size <= self.inline_limit:
+            return {'TemplateBody': body}
+        body = minify(body)
+        size = len(body.encode('utf-8'))
+        if size <= self.inline_limit:
+            return {'TemplateBody': body}
+        if size > URL_LIMIT:
+            raise RuntimeError('Template is %d bytes, over the %d bytes limit'
+                               % (size, URL_LIMIT))
+        if not self.bucket:
+            raise RuntimeError('Template is %d bytes, over the %d bytes inline'
+                               ' limit, and no template bucket is configured'
+                               % (size, self.inline_limit))
+        return {'TemplateURL': self.upload(body)}
+
+    def _key(self, body):
+        digest = hashlib.sha256(body.encode('utf-8')).hexdigest()
+        return '%s%s.json' % (self.prefix, digest)
+
+    def url(self, body):
+        """URL `body` has - or will have, once uploaded - in the bucket"""
+        if self.region:
+            return 'https://%s.s3.%s.amazonaws.com/%s' % (
+                self.bucket, self.region, self._key(body))
+        return 'https://%s.s3.amazonaws.com/%s' % (self.bucket,
+                                                    self._key(body))
+
+    def upload(self, body):
+        """
+        Store `body` in the template bucket, unless it is there already.
+
+        Returns:
+            str: URL of the template object
+        """
+        key = self._key(body)
+        import botocore.exceptions
+        s3 = self.aws.client('s3', region=self.region)
+        try:
+            s3.head_object(Bucket=self.bucket, Key=key)
+        except botocore.exceptions.ClientError as err:
+            if err.response['Error']['Code'] not in ('404', 'NoSuchKey',
+                                                     'NotFound'):
+                raise
+            s3.put_object(Bucket=self.bucket, Key=key,
+                          Body=body.encode('utf-8'))
+        return self.url(body)